@@ -0,0 +1,3 @@
+"""
+オフラインベンチマーク一式 (スタブサーバー・シート代替・Gemini代替)。
+"""
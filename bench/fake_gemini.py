@@ -0,0 +1,68 @@
+"""
+Gemini モデルの代替 (ベンチマーク用)。
+
+generate_content() はプロンプトから決定的に選んだ分析結果を JSON テキストで返す。
+generation_config に response_schema があればそのキーだけを JSON のみで返し、
+無ければ実際のモデルと同様にコードフェンス付きのテキストで返す。
+invalid_rate を指定すると、その割合の応答で 1 つのキーを欠落させる (再問い合わせの計測用)。
+レイテンシを設定でき、呼び出し回数とプロンプト文字数を記録する。
+"""
+import hashlib
+import json
+import threading
+import time
+
+SENTIMENTS = ["ポジティブ", "ネガティブ", "ニュートラル"]
+CATEGORIES = ["会社", "モデル", "技術", "モータースポーツ", "バイク", "その他"]
+COMPANIES = ["トヨタ", "日産", "ホンダ", "三菱自動車", "マツダ", "スバル", "ダイハツ", "スズキ"]
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    google.generativeai.GenerativeModel の代替。
+    """
+
+    def __init__(self, model_name="fake-gemini", latency_ms=0, invalid_rate=0.0):
+        self.model_name = model_name
+        self.latency_ms = latency_ms
+        self.invalid_rate = invalid_rate
+        self.calls = 0
+        # 一部のキーだけを問い合わせた呼び出し (再問い合わせ) の回数
+        self.partial_calls = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, generation_config=None, **kwargs):
+        schema = (generation_config or {}).get("response_schema")
+        keys = list(schema["properties"]) if schema else None
+        with self._lock:
+            self.calls += 1
+            if keys is not None and len(keys) < 5:
+                self.partial_calls += 1
+            self.prompt_chars += len(prompt)
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+
+        digest = hashlib.md5(prompt.encode("utf-8")).digest()
+        company = COMPANIES[digest[2] % len(COMPANIES)]
+        mentions_nissan = company != "日産" and digest[3] % 4 == 0
+        result = {
+            "sentiment": SENTIMENTS[digest[0] % len(SENTIMENTS)],
+            "category": CATEGORIES[digest[1] % len(CATEGORIES)],
+            "company_info": company,
+            "nissan_mention": "日産との比較に言及" if mentions_nissan else "-",
+            "nissan_sentiment": "ニュートラル（理由：比較対象として挙げられているだけのため）" if mentions_nissan else "-",
+        }
+        if keys is not None:
+            result = {key: result[key] for key in keys}
+        if self.invalid_rate > 0 and len(result) > 1 and digest[4] / 256.0 < self.invalid_rate:
+            result.pop(list(result)[digest[5] % len(result)])
+        if keys is not None:
+            return FakeResponse(json.dumps(result, ensure_ascii=False))
+        # 実際のモデルと同様に、前後に説明文やコードフェンスが付く場合を再現する
+        return FakeResponse(f"```json\n{json.dumps(result, ensure_ascii=False, indent=2)}\n```")
@@ -0,0 +1,288 @@
+"""
+gspread の Worksheet / Spreadsheet / Client のインメモリ代替 (ベンチマーク用)。
+
+main.py が使う API (col_values, get_all_values, get, batch_get, append_rows,
+batch_update, row_values, update, spreadsheet.batch_update など) だけを実装する。
+読み取り時は JSON を経由して値を複製し、実際の API 応答のデシリアライズ相当の
+コストを再現する。呼び出し回数と読み書きしたセル数は stats に記録する。
+"""
+import json
+import re
+
+_A1_RE = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def column_letter_to_index(letters):
+    """
+    列記号 (A, Z, AA ...) を 1 始まりの列番号に変換する。
+    """
+    index = 0
+    for ch in letters:
+        index = index * 26 + (ord(ch) - ord("A") + 1)
+    return index
+
+
+def parse_a1_range(range_name):
+    """
+    'A1', 'G5:AE5', 'A2:Q' などを (start_row, start_col, end_row, end_col) に変換する。
+    行・列が省略された側は None を返す (1 始まり)。
+    """
+    if "!" in range_name:
+        range_name = range_name.split("!", 1)[1]
+    start, _, end = range_name.partition(":")
+    end = end or start
+
+    def split(cell):
+        match = _A1_RE.match(cell.upper())
+        if not match:
+            raise ValueError(f"不正な A1 表記です: {range_name}")
+        letters, digits = match.groups()
+        col = column_letter_to_index(letters) if letters else None
+        row = int(digits) if digits else None
+        return row, col
+
+    start_row, start_col = split(start)
+    end_row, end_col = split(end)
+    return start_row, start_col, end_row, end_col
+
+
+class FakeStats:
+    """
+    API 呼び出し回数と読み書きセル数の集計。
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.cells_read = 0
+        self.cells_written = 0
+
+    def record(self, method, read=0, written=0):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self.cells_read += read
+        self.cells_written += written
+
+    def reset(self):
+        self.calls = {}
+        self.cells_read = 0
+        self.cells_written = 0
+
+
+class FakeWorksheet:
+    """
+    gspread.Worksheet のインメモリ代替。値はすべて文字列で保持する。
+    """
+
+    def __init__(self, spreadsheet, title, sheet_id, rows=None, row_count=1000, col_count=26):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self._rows = [list(r) for r in (rows or [])]
+        self._row_count = max(row_count, len(self._rows))
+        self._col_count = max([col_count] + [len(r) for r in self._rows])
+        self.formats = []
+
+    @property
+    def stats(self):
+        return self.spreadsheet.stats
+
+    @property
+    def row_count(self):
+        return self._row_count
+
+    @property
+    def col_count(self):
+        return self._col_count
+
+    # --- 内部ヘルパー ---
+    def _ensure_size(self, rows, cols):
+        self._row_count = max(self._row_count, rows)
+        self._col_count = max(self._col_count, cols)
+
+    def _set_cell(self, row, col, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        target = self._rows[row - 1]
+        while len(target) < col:
+            target.append("")
+        target[col - 1] = "" if value is None else str(value)
+        self._ensure_size(row, col)
+
+    def _write_block(self, start_row, start_col, values):
+        written = 0
+        for r_offset, row_values in enumerate(values):
+            for c_offset, value in enumerate(row_values):
+                self._set_cell(start_row + r_offset, start_col + c_offset, value)
+                written += 1
+        return written
+
+    @staticmethod
+    def _trim(values):
+        # 実際の API と同様に、行末の空セルと末尾の空行を返さない
+        trimmed = []
+        for row in values:
+            row = list(row)
+            while row and row[-1] == "":
+                row.pop()
+            trimmed.append(row)
+        while trimmed and not trimmed[-1]:
+            trimmed.pop()
+        return trimmed
+
+    @staticmethod
+    def _over_the_wire(values):
+        # JSON を経由して複製し、API 応答のデシリアライズに相当するコストを発生させる
+        return json.loads(json.dumps(values, ensure_ascii=False))
+
+    # --- gspread 互換 API ---
+    def get_all_values(self, **kwargs):
+        values = self._over_the_wire(self._trim(self._rows))
+        self.stats.record("get_all_values", read=sum(len(r) for r in values))
+        width = max((len(r) for r in values), default=0)
+        # gspread は矩形に揃えて返す
+        return [r + [""] * (width - len(r)) for r in values]
+
+    def get(self, range_name=None, **kwargs):
+        start_row, start_col, end_row, end_col = parse_a1_range(range_name or "A1:ZZZ")
+        start_row = start_row or 1
+        start_col = start_col or 1
+        end_row = end_row or self._row_count
+        end_col = end_col or self._col_count
+        block = [
+            row[start_col - 1:end_col]
+            for row in self._rows[start_row - 1:end_row]
+        ]
+        values = self._over_the_wire(self._trim(block))
+        self.stats.record("get", read=sum(len(r) for r in values))
+        return values
+
+    def batch_get(self, ranges, **kwargs):
+        results = []
+        for range_name in ranges:
+            start_row, start_col, end_row, end_col = parse_a1_range(range_name)
+            block = [
+                row[start_col - 1:end_col]
+                for row in self._rows[start_row - 1:end_row]
+            ]
+            results.append(self._over_the_wire(self._trim(block)))
+        self.stats.record("batch_get", read=sum(len(r) for block in results for r in block))
+        return results
+
+    def col_values(self, col, **kwargs):
+        values = [row[col - 1] if len(row) >= col else "" for row in self._rows]
+        while values and values[-1] == "":
+            values.pop()
+        values = self._over_the_wire(values)
+        self.stats.record("col_values", read=len(values))
+        return values
+
+    def row_values(self, row, **kwargs):
+        values = list(self._rows[row - 1]) if row <= len(self._rows) else []
+        values = self._over_the_wire(self._trim([values]))
+        values = values[0] if values else []
+        self.stats.record("row_values", read=len(values))
+        return values
+
+    def append_rows(self, values, value_input_option=None, **kwargs):
+        # 実際の API と同様に、データのある最終行の直後に追記する
+        last_row = len(self._trim(self._rows))
+        written = self._write_block(last_row + 1, 1, values)
+        self.stats.record("append_rows", written=written)
+        return {"updates": {"updatedRows": len(values)}}
+
+    def update(self, range_name=None, values=None, value_input_option=None, **kwargs):
+        # gspread の新旧どちらの引数順 (values, range_name) / (range_name, values) も受け付ける
+        if not isinstance(range_name, str):
+            range_name, values = values, range_name
+        start_row, start_col, _, _ = parse_a1_range(range_name or "A1")
+        written = self._write_block(start_row or 1, start_col or 1, values or [])
+        self.stats.record("update", written=written)
+        return {"updatedCells": written}
+
+    def batch_update(self, data, value_input_option=None, **kwargs):
+        written = 0
+        for item in data:
+            start_row, start_col, _, _ = parse_a1_range(item["range"])
+            written += self._write_block(start_row or 1, start_col or 1, item["values"])
+        self.stats.record("batch_update", written=written)
+        return {"totalUpdatedCells": written}
+
+    # --- spreadsheet.batch_update から呼ばれる処理 ---
+    def _apply_sort_range(self, request):
+        grid = request["range"]
+        start = grid.get("startRowIndex", 0)
+        end = min(grid.get("endRowIndex", self._row_count), len(self._rows))
+        segment = self._rows[start:end]
+        for spec in reversed(request["sortSpecs"]):
+            col = spec["dimensionIndex"]
+            descending = spec.get("sortOrder") == "DESCENDING"
+            # 空セルは昇順・降順どちらでも末尾に置く (Sheets の挙動に合わせる)
+            filled = [r for r in segment if len(r) > col and r[col] != ""]
+            empty = [r for r in segment if not (len(r) > col and r[col] != "")]
+            filled.sort(key=lambda r: r[col], reverse=descending)
+            segment = filled + empty
+        self._rows[start:end] = segment
+
+    def _apply_delete_dimension(self, request):
+        grid = request["range"]
+        if grid.get("dimension") != "ROWS":
+            raise NotImplementedError("列の削除には未対応です。")
+        start, end = grid["startIndex"], grid["endIndex"]
+        del self._rows[start:end]
+        self._row_count -= min(end, self._row_count) - start
+
+
+class FakeSpreadsheet:
+    """
+    gspread.Spreadsheet のインメモリ代替。
+    """
+
+    def __init__(self, key="fake-spreadsheet"):
+        self.id = key
+        self.stats = FakeStats()
+        self._worksheets = {}
+        self._next_sheet_id = 0
+
+    def add_worksheet(self, title, rows=1000, cols=26, **kwargs):
+        ws = FakeWorksheet(self, title, self._next_sheet_id, row_count=int(rows), col_count=int(cols))
+        self._next_sheet_id += 1
+        self._worksheets[title] = ws
+        self.stats.record("add_worksheet")
+        return ws
+
+    def worksheet(self, title):
+        if title not in self._worksheets:
+            from gspread.exceptions import WorksheetNotFound
+            raise WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def worksheets(self, **kwargs):
+        return list(self._worksheets.values())
+
+    def batch_update(self, body):
+        by_id = {ws.id: ws for ws in self._worksheets.values()}
+        for request in body.get("requests", []):
+            if "sortRange" in request:
+                sort = request["sortRange"]
+                by_id[sort["range"]["sheetId"]]._apply_sort_range(sort)
+            elif "deleteDimension" in request:
+                delete = request["deleteDimension"]
+                by_id[delete["range"]["sheetId"]]._apply_delete_dimension(delete)
+            elif "repeatCell" in request:
+                repeat = request["repeatCell"]
+                by_id[repeat["range"]["sheetId"]].formats.append(repeat)
+            else:
+                raise NotImplementedError(f"未対応のリクエストです: {list(request)}")
+        self.stats.record("spreadsheet.batch_update")
+        return {"replies": [{} for _ in body.get("requests", [])]}
+
+
+class FakeClient:
+    """
+    gspread.Client のインメモリ代替。キーに関係なく同じスプレッドシートを返す。
+    """
+
+    def __init__(self, spreadsheet=None):
+        self.spreadsheet = spreadsheet or FakeSpreadsheet()
+
+    def open_by_key(self, key):
+        return self.spreadsheet
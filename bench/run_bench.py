@@ -0,0 +1,412 @@
+"""
+オフライン E2E ベンチマーク。
+
+Yahoo!ニュース・Googleスプレッドシート・Gemini を使わずに、
+ローカルのスタブサーバー / インメモリのシート / Gemini 代替モデルで
+main.py の各ステップを実行し、ステップごとの所要時間と処理件数を計測する。
+
+使い方 (リポジトリのルートで実行):
+    python -m bench.run_bench
+    python -m bench.run_bench --sizes 1000 10000 --latency-ms 50 --json bench_result.json
+    python -m bench.run_bench --backend sqlite   # ローカルの保存先で計測
+    python -m bench.run_bench --stories 5        # 未分析の行を 5 件のストーリー (出来事) に分けて分析する
+"""
+import argparse
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.fake_gemini import FakeGeminiModel
+from bench.fake_sheets import FakeClient, FakeSpreadsheet
+from bench.stub_server import StubConfig, start_stub_server
+from profiling import StageProfiler
+import blob_store
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+BODY_SENTENCE = "国内自動車メーカーは主力工場の稼働率を段階的に引き上げると発表した。"
+COMMENT_TEXT = "【yuk*****】納車までの期間が短くなるなら歓迎です。"
+# --stories の見出しに使う文字 (ストーリーごとに異なる並びにする)
+STORY_CHARS = "自動車工場新型発表電池開発販売計画提携統合協議価格改定生産停止再開輸出部品調達決算利益減少増加国内海外"
+
+
+def story_headline(story):
+    """
+    合成ストーリーの見出し (ストーリーごとに異なる 120 文字の並び)。
+    """
+    rng = random.Random(f"story:{story}")
+    return "".join(rng.choice(STORY_CHARS) for _ in range(120))
+
+
+def load_main(base_url, interval_scale):
+    """
+    ベンチマーク用の環境変数を設定してから main モジュールを読み込む。
+    """
+    os.environ.setdefault("SPREADSHEET_KEY", "bench-spreadsheet")
+    os.environ["YAHOO_NEWS_BASE_URL"] = base_url
+    os.environ["REQUEST_INTERVAL_SCALE"] = str(interval_scale)
+    if "main" in sys.modules:
+        return importlib.reload(sys.modules["main"])
+    return importlib.import_module("main")
+
+
+def build_synthetic_sheet(main, base_url, size, pending_fetch, pending_analyze, body_chars,
+                          backend="sheets", work_dir=None, stories=0):
+    """
+    size 行の SOURCE データを生成し、(gspread クライアントの代替, 保存先) を返す。
+    大半は取得・分析済みの行で、pending_fetch 行は本文未取得、
+    pending_analyze 行は本文取得済みで未分析の状態にする (全体に均等に配置)。
+    backend が sqlite / csv の場合は work_dir にファイルを作成する。
+    stories を指定すると、未分析の行のタイトルと本文の冒頭を stories 件のストーリーの見出しに順に割り当てる。
+    """
+    spreadsheet = FakeSpreadsheet()
+    if backend == "sqlite":
+        store = main.storage.SQLiteStore(os.path.join(work_dir, f"source_{size}.sqlite3"), main.SOURCE_HEADERS)
+    elif backend == "csv":
+        store = main.storage.CSVStore(os.path.join(work_dir, f"source_{size}.csv"), main.SOURCE_HEADERS)
+    else:
+        ws = spreadsheet.add_worksheet("SOURCE", rows=size + 1, cols=len(main.SOURCE_HEADERS))
+        store = main.storage.SheetsStore(ws, main.SOURCE_HEADERS)
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.check_and_set_headers(store)
+    headers = main.SOURCE_HEADERS
+    col = {name: i for i, name in enumerate(headers)}
+
+    body = (BODY_SENTENCE * (body_chars // len(BODY_SENTENCE) + 1))[:body_chars]
+    comments = [COMMENT_TEXT] * 10
+    now = datetime.now()
+
+    fetch_every = size // pending_fetch if pending_fetch else 0
+    analyze_every = size // pending_analyze if pending_analyze else 0
+
+    rows = []
+    for i in range(size):
+        article_id = hashlib.sha1(f"synthetic:{i}".encode("utf-8")).hexdigest()
+        post_time = (now - timedelta(minutes=i)).strftime("%Y/%m/%d %H:%M:%S")
+        row = [""] * len(headers)
+        row[col["keyword"]] = main.SEARCH_KEYWORDS[i % len(main.SEARCH_KEYWORDS)]
+        row[col["URL"]] = f"{base_url}/articles/{article_id}"
+        row[col["post_time_str"]] = post_time
+        row[col["source"]] = "自動車新聞"
+        row[col["title"]] = f"合成記事 {i}"
+        row[col["analysis_flag"]] = "TRUE"
+
+        if fetch_every and i % fetch_every == fetch_every - 1:
+            rows.append(row)
+            continue
+
+        row[col["body_p1"]] = body
+        for page in range(2, 11):
+            row[col[f"body_p{page}"]] = "-"
+        row[col["comment_count"]] = "12"
+        row[col["full_post_time"]] = post_time
+        for n in range(1, 11):
+            row[col[f"comment_{n}"]] = comments[n - 1]
+
+        if analyze_every and i % analyze_every == analyze_every - 2:
+            if stories:
+                headline = story_headline(i // analyze_every % stories)
+                row[col["title"]] = f"{headline[:20]} (合成記事 {i})"
+                row[col["body_p1"]] = f"{headline}。{body}"
+            rows.append(row)
+            continue
+
+        row[col["sentiment"]] = "ニュートラル"
+        row[col["category"]] = "会社"
+        row[col["company_info"]] = "トヨタ"
+        row[col["nissan_mention"]] = "-"
+        row[col["nissan_sentiment"]] = "-"
+        rows.append(row)
+
+    if backend == "sheets":
+        store.ws.append_rows(rows)
+    else:
+        store.append([dict(zip(headers, row)) for row in rows])
+    spreadsheet.stats.reset()
+    return FakeClient(spreadsheet), store
+
+
+class StageTimer:
+    """
+    ステップごとの累積所要時間を記録する。profiler を渡すと同じ単位でプロファイルも取る。
+    """
+
+    def __init__(self, profiler=None):
+        self.seconds = {}
+        self.profiler = profiler or StageProfiler(None)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            with self.profiler.stage(name):
+                yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+
+def run_pipeline(main, gc, store, timer, deadline=None):
+    """
+    main.main() と同じ順序で各ステップを実行する (認証・プロンプト読み込みは除く)。
+    保存先がローカルの場合は、main.main() と同様にシート専用のステップを行わない。
+    deadline を指定すると main.main() と同様に各ステップに時間を配分し、終了処理は締め切り前だけ行う。
+    """
+    use_sheets = isinstance(store, main.storage.SheetsStore)
+    groups = main.search_planner.plan_queries(main.SEARCH_KEYWORDS, main.SEARCH_OR_GROUP_SIZE)
+    run_budget = main.setup_budget("run", store, deadline, groups)
+
+    with timer.stage("load_existing_ids"):
+        existing_ids = main.load_existing_ids(store)
+
+    search_report = main.search_planner.SearchReport(main.SEARCH_KEYWORDS)
+    stage = run_budget.begin("search")
+    searched = added = 0
+    for group in groups:
+        if stage.expired():
+            break
+        with timer.stage("search"):
+            new_articles = main.search_keyword_group(group, search_report)
+        with timer.stage("append_new_articles"):
+            added += main.append_new_articles(store, new_articles, existing_ids)
+        searched += 1
+    stage.finish(searched, len(groups) - searched)
+    run_budget.set_backlog("analyze", min(run_budget.backlogs.get("analyze", 0) + added, main.MAX_ANALYZE))
+
+    with timer.stage("fetch"):
+        main.fetch_pending_details(store, budget=run_budget)
+
+    if use_sheets and run_budget.has_time():
+        with timer.stage("sort_and_format_sheet"):
+            main.sort_and_format_sheet(gc)
+
+    with timer.stage("analyze"):
+        main.analyze_with_gemini_and_update_sheet(store, budget=run_budget)
+
+    if run_budget.has_time():
+        with timer.stage("export"):
+            main.export_analyzed_rows(store)
+
+    if use_sheets and run_budget.has_time():
+        with timer.stage("archive"):
+            main.archive_old_rows(gc)
+
+    if run_budget.limited:
+        run_budget.report()
+    return search_report
+
+
+def run_one(main, stub_config, base_url, args, size, work_dir):
+    gc, store = build_synthetic_sheet(
+        main, base_url, size, args.pending_fetch, args.pending_analyze, args.body_chars,
+        backend=args.backend, work_dir=work_dir, stories=args.stories,
+    )
+    stats = gc.spreadsheet.stats
+    fake_model = FakeGeminiModel(latency_ms=args.gemini_latency_ms, invalid_rate=args.gemini_invalid_rate)
+    main.gemini_model = fake_model
+    # --route の場合は短い記事用の速いモデル (レイテンシ 1/4) にも振り分ける
+    fast_model = FakeGeminiModel("fake-gemini-fast", latency_ms=args.gemini_latency_ms / 4,
+                                 invalid_rate=args.gemini_invalid_rate) if args.route else None
+    main.gemini_fast_model = fast_model
+    if args.route_max_chars is not None:
+        main.GEMINI_ROUTE_MAX_CHARS = args.route_max_chars
+    main.route_stats = main.model_router.RouteStats(
+        main.model_router.parse_prices(main.GEMINI_ROUTE_PRICES),
+        models={
+            "strong": fake_model.model_name,
+            "fast": fast_model.model_name if fast_model else fake_model.model_name,
+            "confirm": fast_model.model_name if fast_model else fake_model.model_name,
+        },
+    )
+    main.STORY_CLUSTERING = args.cluster_stories
+    main.ARCHIVE_AFTER_DAYS = args.archive_after_days
+    main.BODY_STORE = args.body_store
+    main.RUN_DEADLINE_RESERVE = args.deadline_reserve
+    if args.or_group_size is not None:
+        main.SEARCH_OR_GROUP_SIZE = args.or_group_size
+    # スタブの検索結果 1 ページあたりの件数 (実際の Yahoo!ニュースと同様に固定)
+    main.SEARCH_PAGE_SIZE = args.results_per_query
+    main.parse_pool = main.html_parse.ParsePool(
+        workers=args.parse_workers or main.html_parse.PARSE_WORKERS,
+        min_process_batch=args.parse_process_min_batch,
+    )
+    main.selector_profile = main.selector_cache.SelectorProfile(args.selector_profile or "")
+    stub_config.markup = args.markup
+    export_dir = tempfile.TemporaryDirectory(prefix="bench_export_") if args.export else None
+    main.EXPORT_DIR = export_dir.name if export_dir else ""
+    stub_config.request_counts = {}
+
+    profile_dir = os.path.join(args.profile, f"rows_{size}") if args.profile else None
+    timer = StageTimer(StageProfiler(profile_dir))
+    output = sys.stdout if args.verbose else io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        search_report = run_pipeline(main, gc, store, timer, deadline=args.deadline)
+    total = time.perf_counter() - start
+    timer.profiler.finish()
+    main.parse_pool.close()
+    selector_lines = main.selector_profile.summary_lines()
+    selector_alerts = main.selector_profile.alerts(main.SELECTOR_MISS_ALERT)
+    main.selector_profile.save()
+    if export_dir:
+        export_dir.cleanup()
+
+    fetched = stub_config.request_counts.get("article_first_page", 0)
+    models = [fake_model] + ([fast_model] if fast_model else [])
+    gemini_calls = sum(model.calls for model in models)
+    gemini_repair_calls = sum(model.partial_calls for model in models)
+    analyzed = gemini_calls - gemini_repair_calls
+    minutes = total / 60.0 if total > 0 else 0.0
+
+    return {
+        "rows": size,
+        "backend": args.backend,
+        "total_seconds": round(total, 3),
+        "stage_seconds": {k: round(v, 3) for k, v in timer.seconds.items()},
+        "fetched_articles": fetched,
+        "analyzed_articles": analyzed,
+        "articles_per_minute": round((fetched + analyzed) / minutes, 1) if minutes else 0.0,
+        "gemini_calls": gemini_calls,
+        "gemini_repair_calls": gemini_repair_calls,
+        "gemini_routes": main.route_stats.as_dict(),
+        "gemini_route_lines": main.route_stats.summary_lines(),
+        "selector_lines": selector_lines,
+        "selector_alerts": selector_alerts,
+        "http_requests": dict(stub_config.request_counts),
+        "parse_batches": {"process": main.parse_pool.process_batches, "thread": main.parse_pool.thread_batches},
+        "search_requests": search_report.requests,
+        "search_requests_saved": search_report.saved(),
+        "sheet_calls": dict(stats.calls),
+        "sheet_cells_read": stats.cells_read,
+        "sheet_cells_written": stats.cells_written,
+        "final_row_count": len(store.ids()),
+    }
+
+
+def print_report(results):
+    print("\n===== 📊 ベンチマーク結果 =====")
+    for result in results:
+        print(f"\n--- {result['rows']:,} 行 ({result['backend']}) ---")
+        print(f"  合計: {result['total_seconds']:.2f}秒 / "
+              f"記事 {result['articles_per_minute']:.1f} 件/分 "
+              f"(本文取得 {result['fetched_articles']} 件, 分析 {result['analyzed_articles']} 件)")
+        for stage, seconds in result["stage_seconds"].items():
+            share = seconds / result["total_seconds"] * 100 if result["total_seconds"] else 0.0
+            print(f"  - {stage:<24} {seconds:9.3f}秒 ({share:5.1f}%)")
+        print(f"  シートAPI: {result['sheet_calls']} "
+              f"(読み取り {result['sheet_cells_read']:,} セル / 書き込み {result['sheet_cells_written']:,} セル)")
+        print(f"  HTTP: {result['http_requests']}")
+        print(f"  HTML 解析: プロセスプール {result['parse_batches']['process']} 回 / "
+              f"スレッド {result['parse_batches']['thread']} 回")
+        print(f"  検索: {result['search_requests']} 回 (キーワードごとの検索より {result['search_requests_saved']} 回少ない)")
+        print(f"  Gemini: {result['gemini_calls']} 回 (うち再問い合わせ {result['gemini_repair_calls']} 回)")
+        for line in result["gemini_route_lines"]:
+            print(f"    - {line}")
+        print("  セレクタ:")
+        for line in result["selector_lines"]:
+            print(f"    - {line}")
+        for message in result["selector_alerts"]:
+            print(f"    ⚠️ {message}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="オフライン E2E ベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="合成 SOURCE シートの行数 (既定: 1000 10000 100000)")
+    parser.add_argument("--pending-fetch", type=int, default=20,
+                        help="本文未取得の既存行数")
+    parser.add_argument("--pending-analyze", type=int, default=30,
+                        help="本文取得済みで未分析の既存行数")
+    parser.add_argument("--body-chars", type=int, default=600,
+                        help="合成行の本文 (body_p1) の文字数")
+    parser.add_argument("--results-per-query", type=int, default=20,
+                        help="検索 1 回あたりの記事数")
+    parser.add_argument("--results-per-term", type=int, default=None,
+                        help="キーワードごとの検索結果の総数 (既定: 無制限。小さくすると OR クエリのページ送りが早く終わる)")
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="スタブサーバーの応答遅延 (ミリ秒)")
+    parser.add_argument("--jitter-ms", type=float, default=0,
+                        help="スタブサーバーの応答遅延の揺らぎ (ミリ秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="スタブサーバーが 503 を返す割合 (0〜1)")
+    parser.add_argument("--gemini-latency-ms", type=float, default=0,
+                        help="Gemini 代替モデルの応答遅延 (ミリ秒)")
+    parser.add_argument("--gemini-invalid-rate", type=float, default=0.0,
+                        help="Gemini 代替モデルが応答のキーを 1 つ欠落させる割合 (0〜1)")
+    parser.add_argument("--route", action="store_true",
+                        help="短い記事を速いモデル (Gemini 代替モデル、レイテンシ 1/4) に振り分ける")
+    parser.add_argument("--route-max-chars", type=int, default=None,
+                        help="速いモデルに振り分ける本文の最大文字数 (既定: main.GEMINI_ROUTE_MAX_CHARS)")
+    parser.add_argument("--stories", type=int, default=0,
+                        help="未分析の行を N 件のストーリー (同じ出来事の記事) に分ける (既定: 0 = すべて同じ本文)")
+    parser.add_argument("--cluster-stories", action="store_true",
+                        help="同じ出来事の記事をストーリーにまとめ、代表記事以外は確認だけを行う (STORY_CLUSTERING=1)")
+    parser.add_argument("--markup", choices=["current", "legacy"], default="current",
+                        help="スタブサーバーが返す HTML のマークアップ (legacy は旧マークアップのセレクタだけが一致する)")
+    parser.add_argument("--selector-profile", default=None, metavar="PATH",
+                        help="セレクタプロファイルの読み込み・保存先 (既定: 保存しない)。--markup を変えて 2 回実行するとミス率を確認できる")
+    parser.add_argument("--archive-after-days", type=int, default=0,
+                        help="アーカイブの対象日数 (合成行は 1 分刻みで過去に並ぶ。既定: 0 = アーカイブしない)")
+    parser.add_argument("--body-store", choices=["sheet", "blob"], default="sheet",
+                        help="本文の保存先 (blob の場合は一時ディレクトリのブロブストアを使う)")
+    parser.add_argument("--backend", choices=["sheets", "sqlite", "csv"], default="sheets",
+                        help="SOURCE データの保存先 (sqlite / csv は一時ディレクトリに作成する)")
+    parser.add_argument("--export", action="store_true",
+                        help="分析済み記事を一時ディレクトリへエクスポートするステップも実行する")
+    parser.add_argument("--or-group-size", type=int, default=None,
+                        help="1 回の検索に OR でまとめるキーワード数 (既定: main.SEARCH_OR_GROUP_SIZE)")
+    parser.add_argument("--deadline", default=None,
+                        help="実行の締め切り ('30s' など)。各ステップに時間を配分し、使い切ったら残りを持ち越す")
+    parser.add_argument("--deadline-reserve", type=float, default=1.0,
+                        help="締め切りのうち終了処理のために残しておく秒数 (main.RUN_DEADLINE_RESERVE)")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="HTML 解析のワーカープロセス数 (既定: CPU コア数)")
+    parser.add_argument("--parse-process-min-batch", type=int, default=8,
+                        help="この件数以上のバッチをプロセスプールで解析する (未満はスレッド)")
+    parser.add_argument("--interval-scale", type=float, default=0.0,
+                        help="main.py のリクエスト間待機の倍率 (既定: 0 = 待機なし)")
+    parser.add_argument("--profile", nargs="?", const="profile_output", default=None, metavar="DIR",
+                        help="ステップごとのプロファイルを DIR/rows_<行数>/ に出力する")
+    parser.add_argument("--json", dest="json_path", help="結果を JSON で保存するパス")
+    parser.add_argument("--verbose", action="store_true", help="main.py のログを表示する")
+    args = parser.parse_args(argv)
+
+    stub_config = StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, results_per_query=args.results_per_query,
+        results_per_term=args.results_per_term,
+    )
+    server, base_url = start_stub_server(stub_config)
+    blob_dir = tempfile.TemporaryDirectory(prefix="bench_blobs_")
+    blob_store.BODY_BLOB_DIR = blob_dir.name
+    work_dir = tempfile.TemporaryDirectory(prefix="bench_store_")
+    try:
+        main_module = load_main(base_url, args.interval_scale)
+        with contextlib.redirect_stdout(io.StringIO()):
+            main_module.load_prompts()
+
+        results = []
+        for size in args.sizes:
+            print(f"  ... {size:,} 行のシートでベンチマーク実行中 ...", flush=True)
+            results.append(run_one(main_module, stub_config, base_url, args, size, work_dir.name))
+    finally:
+        server.shutdown()
+        blob_dir.cleanup()
+        work_dir.cleanup()
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ 結果を {args.json_path} に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
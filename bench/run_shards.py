@@ -0,0 +1,193 @@
+"""
+分担実行 (シャーディング) のローカル検証。
+
+スタブサーバー・SQLite の SOURCE・リースの保存先 (SQLite またはファイル) を共有して、
+main.py の run を複数のプロセスで --shard K/N 付きで同時に実行し、最後に merge を 1 回実行する。
+同じ記事の本文取得・分析が 2 回以上行われていないこと、合成行がすべて処理されたことを確認する。
+hash モードでは、他のワーカーが追加した記事は次の実行で取得されるため、--rounds 回 (既定 2) 繰り返して確認する。
+
+使い方 (リポジトリのルートで実行):
+    python -m bench.run_shards --workers 4
+    python -m bench.run_shards --workers 4 --shard-mode keyword --lease file
+    python -m bench.run_shards --workers 4 --overlap   # 全ワーカーが全件を担当し、リースだけで排他する
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench.fake_gemini import FakeGeminiModel
+from bench.run_bench import build_synthetic_sheet, load_main
+from bench.stub_server import StubConfig, start_stub_server
+
+
+def run_worker(command, shard_value, env, gemini_latency_ms):
+    """
+    子プロセスで環境変数を設定してから main を読み込み、main.main() を実行する。
+    """
+    os.environ.update(env)
+    import main
+
+    model = FakeGeminiModel(latency_ms=gemini_latency_ms)
+    main.initialize_gemini = lambda: setattr(main, "gemini_model", model)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        exit_code = main.main(command=command, shard_value=shard_value)
+    return {
+        "command": command,
+        "shard": shard_value,
+        "exit_code": exit_code,
+        "seconds": round(time.perf_counter() - start, 3),
+        "gemini_calls": model.calls,
+        "skipped_by_lease": output.getvalue().count("他のワーカーが処理中"),
+        "log": output.getvalue() if exit_code else "",
+    }
+
+
+def count_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        total, unfetched, unanalyzed, analyzed = conn.execute(
+            "SELECT COUNT(*), "
+            "SUM(body_p1 = '' OR body_p1 = '（本文取得失敗）'), "
+            "SUM(sentiment = '' OR sentiment = 'N/A'), "
+            "SUM(analyzed_at != '' AND sentiment NOT LIKE 'N/A%') FROM source"
+        ).fetchone()
+    finally:
+        conn.close()
+    return {"rows": total, "unfetched": unfetched, "unanalyzed": unanalyzed, "analyzed": analyzed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分担実行 (シャーディング) のローカル検証")
+    parser.add_argument("--workers", type=int, default=4, help="同時に実行するワーカープロセス数")
+    parser.add_argument("--rows", type=int, default=1000, help="合成 SOURCE の行数")
+    parser.add_argument("--pending-fetch", type=int, default=40, help="本文未取得の既存行数")
+    parser.add_argument("--pending-analyze", type=int, default=20, help="本文取得済みで未分析の既存行数")
+    parser.add_argument("--shard-mode", choices=["hash", "keyword"], default="hash", help="行の分け方")
+    parser.add_argument("--lease", choices=["sqlite", "file", "none"], default="sqlite", help="リースの保存先")
+    parser.add_argument("--rounds", type=int, default=2, help="分担実行を繰り返す回数 (定期実行の回数に相当)")
+    parser.add_argument("--overlap", action="store_true",
+                        help="シャードを指定せず全ワーカーに全件を担当させ、リースだけで排他できるか確認する")
+    parser.add_argument("--latency-ms", type=float, default=5, help="スタブサーバーの応答遅延 (ミリ秒)")
+    parser.add_argument("--gemini-latency-ms", type=float, default=20, help="Gemini 代替モデルの応答遅延 (ミリ秒)")
+    parser.add_argument("--json", dest="json_path", help="結果を JSON で保存するパス")
+    args = parser.parse_args(argv)
+
+    stub_config = StubConfig(latency_ms=args.latency_ms)
+    server, base_url = start_stub_server(stub_config)
+    work_dir = tempfile.TemporaryDirectory(prefix="bench_shards_")
+    try:
+        main_module = load_main(base_url, 0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, store = build_synthetic_sheet(
+                main_module, base_url, args.rows, args.pending_fetch, args.pending_analyze, 600,
+                backend="sqlite", work_dir=work_dir.name,
+            )
+        store.conn.close()
+
+        lease_spec = {
+            "sqlite": f"sqlite:{os.path.join(work_dir.name, 'leases.sqlite3')}",
+            "file": f"file:{os.path.join(work_dir.name, 'leases')}",
+            "none": "",
+        }[args.lease]
+        env = {
+            "YAHOO_NEWS_BASE_URL": base_url,
+            "REQUEST_INTERVAL_SCALE": "0",
+            "STORAGE_BACKEND": "sqlite",
+            "STORAGE_PATH": store.path,
+            "SHARD_MODE": args.shard_mode,
+            "LEASE_STORE": lease_spec,
+            "EXPORT_DIR": "",
+            "PARSE_WORKERS": "1",
+            "SELECTOR_PROFILE_FILE": os.path.join(work_dir.name, "selector_profile.json"),
+        }
+        stub_config.request_counts = {}
+        stub_config.article_fetches = {}
+        print(f"  ... {args.workers} ワーカーで分担実行中 "
+              f"({'重複担当' if args.overlap else args.shard_mode}, リース: {args.lease}) ...", flush=True)
+
+        # 子プロセスは fork せずに起動し、環境変数から設定を読み直させる
+        context = multiprocessing.get_context("spawn")
+        start = time.perf_counter()
+        workers = []
+        for _ in range(args.rounds):
+            with context.Pool(args.workers) as pool:
+                jobs = [
+                    pool.apply_async(run_worker, (
+                        "run", None if args.overlap else f"{k}/{args.workers}", env, args.gemini_latency_ms,
+                    ))
+                    for k in range(1, args.workers + 1)
+                ]
+                workers.extend(job.get() for job in jobs)
+        parallel_seconds = time.perf_counter() - start
+
+        export_dir = os.path.join(work_dir.name, "export")
+        with context.Pool(1) as pool:
+            merge = pool.apply(run_worker, ("merge", None, dict(env, EXPORT_DIR=export_dir), 0))
+
+        watermark_path = os.path.join(export_dir, "_watermark.json")
+        exported = 0
+        if os.path.exists(watermark_path):
+            with open(watermark_path, "r", encoding="utf-8") as f:
+                exported = json.load(f).get("rows", 0)
+
+        counts = count_rows(store.path)
+        duplicate_fetches = sum(1 for n in stub_config.article_fetches.values() if n > 1)
+        gemini_calls = sum(worker["gemini_calls"] for worker in workers)
+        result = {
+            "workers": workers,
+            "merge": merge,
+            "parallel_seconds": round(parallel_seconds, 3),
+            "http_requests": dict(stub_config.request_counts),
+            "fetched_articles": len(stub_config.article_fetches),
+            "duplicate_fetches": duplicate_fetches,
+            "gemini_calls": gemini_calls,
+            "exported_rows": exported,
+            **counts,
+        }
+    finally:
+        server.shutdown()
+        work_dir.cleanup()
+
+    print("\n===== 🧩 分担実行の検証結果 =====")
+    for worker in workers + [merge]:
+        label = worker["shard"] or ("全件" if worker["command"] == "run" else "-")
+        print(f"  - {worker['command']:<5} {label:<6} 終了コード {worker['exit_code']} / "
+              f"{worker['seconds']:.2f}秒 / Gemini {worker['gemini_calls']} 回 / "
+              f"リースでスキップ {worker['skipped_by_lease']} 回")
+        if worker["log"]:
+            print(worker["log"])
+    print(f"  並列実行: {result['parallel_seconds']:.2f}秒 / HTTP: {result['http_requests']}")
+    print(f"  SOURCE: {result['rows']} 行 (本文未取得 {result['unfetched']}, 未分析 {result['unanalyzed']}, "
+          f"分析済み {result['analyzed']}) / エクスポート {result['exported_rows']} 行")
+
+    problems = []
+    if any(worker["exit_code"] for worker in workers + [merge]):
+        problems.append("終了コードが 0 でないワーカーがあります")
+    if duplicate_fetches:
+        problems.append(f"{duplicate_fetches} 件の記事の本文が重複して取得されました")
+    if gemini_calls != result["analyzed"]:
+        problems.append(f"Gemini の呼び出し回数 ({gemini_calls}) と Gemini で分析した行数 ({result['analyzed']}) が一致しません")
+    if result["unfetched"]:
+        problems.append(f"本文未取得の行が {result['unfetched']} 件残っています")
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if not problems:
+        print("  ✅ 重複した取得・分析はありませんでした。")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
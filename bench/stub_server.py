@@ -0,0 +1,235 @@
+"""
+Yahoo!ニュースのローカル代替サーバー (ベンチマーク用)。
+
+bench/fixtures/ の HTML を元に、検索結果・記事本文 (複数ページ)・コメントページを返す。
+レイテンシとエラー率を設定でき、記事IDは検索クエリから決定的に生成する。
+markup="legacy" にすると、旧マークアップ (div.NewsFeed・sc- 始まりの別クラスのタイトル・コメント数ボタン) で返す
+(セレクタプロファイルのミス率の確認用)。
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 検索結果 1 ページあたりの記事数
+DEFAULT_RESULTS_PER_QUERY = 20
+
+# 記事本文とコメントのページ数 (これを超えるページは 404)
+ARTICLE_PAGES = 3
+COMMENT_PAGES = 2
+
+# 旧マークアップへの置き換え (現在の表記, 旧表記)
+LEGACY_MARKUP = [
+    ('<div class="newsFeed">\n<ol class="newsFeed_list">', '<div class="NewsFeed">\n<ol class="NewsFeed_list">'),
+    ('class="sc-3ls169-0 newsFeed_item_title"', 'class="sc-kw7r1b-0 NewsFeed_title"'),
+    ('<a class="sc-1n9vtw0-2 CommentCount__CommentCountButton-sc-1n9vtw0-3" '
+     'href="{{BASE_URL}}/articles/{{ARTICLE_ID}}/comments/">コメント{{COMMENT_COUNT}}件</a>',
+     '<button class="sc-1n9vtw0-1">コメント{{COMMENT_COUNT}}件</button>'),
+]
+
+SOURCES = ["自動車新聞", "経済ニュース", "くるまWEB", "日刊モーター", "共同通信"]
+TITLES = [
+    "新型車の国内生産体制を見直し",
+    "通期業績予想を上方修正",
+    "次世代EVの量産計画を発表",
+    "リコールを届け出 対象は約5万台",
+    "モータースポーツ活動の体制を刷新",
+]
+SNIPPETS = [
+    "主力工場の稼働率を段階的に引き上げると発表した。",
+    "為替の円安効果で営業利益が前年を上回る見通しとなった。",
+    "協業先と共同開発した電池を搭載し、航続距離を伸ばす。",
+]
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def article_id_for(query, position):
+    """
+    検索クエリと表示位置から 40 桁の16進記事IDを決定的に生成する。
+    """
+    return hashlib.sha1(f"{query}:{position}".encode("utf-8")).hexdigest()
+
+
+class StubConfig:
+    """
+    スタブサーバーの挙動設定。実行中に書き換えてもよい。
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 results_per_query=DEFAULT_RESULTS_PER_QUERY, results_per_term=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.results_per_query = results_per_query
+        # キーワードごとの検索結果の総数 (None なら無制限。ページ送りで結果が尽きる場合を再現する)
+        self.results_per_term = results_per_term
+        self.markup = "current"
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_counts = {}
+        # 記事IDごとの本文 1 ページ目の取得回数 (同じ記事を重複して取得していないかの確認用)
+        self.article_fetches = {}
+
+    def count(self, kind):
+        with self.lock:
+            self.request_counts[kind] = self.request_counts.get(kind, 0) + 1
+
+    def count_article(self, article_id):
+        with self.lock:
+            self.article_fetches[article_id] = self.article_fetches.get(article_id, 0) + 1
+
+    def draw(self):
+        with self.lock:
+            return self.rng.random(), self.rng.random()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    /search, /articles/<id>, /articles/<id>/comments を返すハンドラ。
+    """
+
+    server_version = "YahooNewsStub/1.0"
+
+    def log_message(self, format, *args):
+        # アクセスログは出力しない
+        pass
+
+    def do_GET(self):
+        config = self.server.config
+        error_draw, jitter_draw = config.draw()
+
+        delay_ms = config.latency_ms + config.jitter_ms * jitter_draw
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        page = int(query.get("page", ["1"])[0])
+        parts = [p for p in parsed.path.split("/") if p]
+
+        if config.error_rate > 0 and error_draw < config.error_rate:
+            config.count("error")
+            self._send(503, "<html><body>Service Unavailable</body></html>")
+            return
+
+        if parts == ["search"]:
+            config.count("search")
+            self._send(200, self._render_search(query.get("p", [""])[0], int(query.get("b", ["1"])[0])))
+        elif len(parts) == 2 and parts[0] == "articles":
+            config.count("article")
+            if page == 1:
+                # 記事 1 件の取得につき 1 回だけ発生するリクエスト
+                config.count("article_first_page")
+                config.count_article(parts[1])
+            if page > ARTICLE_PAGES:
+                self._send(404, "<html><body>Not Found</body></html>")
+            else:
+                self._send(200, self._render(f"article_p{page}.html", parts[1]))
+        elif len(parts) == 3 and parts[0] == "articles" and parts[2] == "comments":
+            config.count("comments")
+            if page > COMMENT_PAGES:
+                self._send(404, "<html><body>Not Found</body></html>")
+            else:
+                self._send(200, self._render(f"comments_p{page}.html", parts[1]))
+        else:
+            config.count("not_found")
+            self._send(404, "<html><body>Not Found</body></html>")
+
+    def _fixture(self, name):
+        html = self.server.fixtures[name]
+        if self.server.config.markup == "legacy":
+            for current, legacy in LEGACY_MARKUP:
+                html = html.replace(current, legacy)
+        return html
+
+    def _render(self, fixture_name, article_id):
+        html = self._fixture(fixture_name)
+        comment_count = int(article_id[:4], 16) % 500
+        return (html.replace("{{BASE_URL}}", self.server.base_url)
+                    .replace("{{ARTICLE_ID}}", article_id)
+                    .replace("{{COMMENT_COUNT}}", str(comment_count)))
+
+    def _render_search(self, query, start=1):
+        """
+        'A OR B' のクエリでは、各キーワード単体の検索結果を交互に並べる
+        (同じ記事は単体の検索と同じ記事IDになり、タイトルにはそのキーワードが入る)。
+        start (b パラメータ、1 始まり) から results_per_query 件を返す。
+        """
+        config = self.server.config
+        item_template = self._fixture("search_item.html")
+        terms = [term.strip().strip('"') for term in query.split(" OR ")]
+        end = start - 1 + config.results_per_query
+        limit = config.results_per_term if config.results_per_term is not None else end
+        # 結果が残っているキーワードを交互に並べた (キーワード, キーワード内の順位) の列
+        ordered = [(term, rank) for rank in range(min(limit, end)) for term in terms][:end]
+        items = []
+        for position, (term, term_position) in enumerate(ordered[start - 1:end], start - 1):
+            items.append(
+                item_template
+                .replace("{{QUERY}}", term)
+                .replace("{{ARTICLE_ID}}", article_id_for(term, term_position))
+                .replace("{{POSITION}}", str(position + 1))
+                .replace("{{TITLE}}", TITLES[position % len(TITLES)])
+                .replace("{{SNIPPET}}", SNIPPETS[position % len(SNIPPETS)])
+                .replace("{{SOURCE}}", SOURCES[position % len(SOURCES)])
+                .replace("{{POST_TIME}}", f"{position + 1}時間前")
+            )
+        html = self._fixture("search.html").replace("{{ITEMS}}", "\n".join(items))
+        return html.replace("{{BASE_URL}}", self.server.base_url).replace("{{QUERY}}", query)
+
+    def _send(self, status, body):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stub_server(config=None, host="127.0.0.1", port=0):
+    """
+    スタブサーバーを別スレッドで起動し、(server, base_url) を返す。
+    停止は server.shutdown() で行う。
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.config = config or StubConfig()
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    server.fixtures = {
+        name: load_fixture(name)
+        for name in os.listdir(FIXTURE_DIR) if name.endswith(".html")
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, server.base_url
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Yahoo!ニュースのローカル代替サーバー")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(
+        StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate),
+        port=args.port,
+    )
+    print(f"✅ スタブサーバー起動: {base_url} (Ctrl+C で停止)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,63 @@
+"""
+記事本文のコンテンツアドレス型ブロブストア。
+
+本文全体を SHA-256 ハッシュをキーとして gzip 圧縮したファイルに保存する。
+同じ本文は同じファイルになるため、重複した記事本文は 1 つだけ保存される。
+    <BODY_BLOB_DIR>/<ハッシュ先頭2文字>/<ハッシュ>.txt.gz
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+
+# ブロブの保存先
+BODY_BLOB_DIR = os.environ.get("BODY_BLOB_DIR", "body_blobs")
+
+
+def body_hash(text):
+    """
+    本文の SHA-256 ハッシュ (16進 64 文字) を返す。
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def blob_path(digest, blob_dir=None):
+    return os.path.join(blob_dir or BODY_BLOB_DIR, digest[:2], f"{digest}.txt.gz")
+
+
+def put_body(text, blob_dir=None):
+    """
+    本文を保存してハッシュを返す。既に同じ本文があれば書き込まない。
+    一時ファイルに書いてからリネームするため、途中で中断しても壊れたブロブは残らない。
+    """
+    digest = body_hash(text)
+    path = blob_path(digest, blob_dir)
+    if os.path.exists(path):
+        return digest
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            f.write(text.encode("utf-8"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return digest
+
+
+def get_body(digest, blob_dir=None):
+    """
+    ハッシュに対応する本文を返す。見つからない・内容がハッシュと一致しない場合は None。
+    """
+    path = blob_path(digest, blob_dir)
+    try:
+        with gzip.open(path, "rb") as f:
+            text = f.read().decode("utf-8")
+    except (OSError, EOFError):
+        return None
+    if body_hash(text) != digest:
+        return None
+    return text
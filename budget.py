@@ -0,0 +1,168 @@
+"""
+実行の締め切り (RUN_DEADLINE / --deadline) に合わせたステップごとの時間配分。
+
+締め切りまでの残り時間から終了処理の予備 (RUN_DEADLINE_RESERVE) を除いた時間を、
+各ステップの未処理件数 × 1 件あたりの見込み秒数に比例して配分する。
+ステップは配分された時間を使い切ると処理を打ち切り、それまでの結果を書き込んでから次のステップへ進む。
+打ち切った分は保存先に未処理のまま残り、次回の実行で処理される。
+先に終わったステップの余りは、まだ始まっていないステップに配分し直す。
+"""
+import re
+import time
+
+# 1 件あたりの見込み秒数 (リクエスト間の待機時間を含む。BUDGET_ITEM_SECONDS で上書きできる)
+DEFAULT_ITEM_SECONDS = {
+    "search": 3.0,     # 検索クエリ 1 グループ
+    "fetch": 10.0,     # 記事 1 件の本文 (複数ページ)・コメント
+    "comments": 4.0,   # 記事 1 件のコメント
+    "analyze": 5.0,    # 記事 1 件の Gemini 分析
+}
+
+
+def parse_duration(value):
+    """
+    '55m' / '1h' / '3300s' / '3300' を秒数に変換する。空なら None。
+    """
+    if not value:
+        return None
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([hms]?)\s*", str(value))
+    if not match:
+        raise ValueError(f"締め切りは '55m' / '1h' / '3300s' / '3300' の形式で指定してください: {value}")
+    number, unit = match.groups()
+    return float(number) * {"h": 3600, "m": 60, "s": 1, "": 1}[unit]
+
+
+def parse_item_seconds(value):
+    """
+    'fetch=8,analyze=4' 形式の文字列で DEFAULT_ITEM_SECONDS を上書きした辞書を返す。
+    """
+    item_seconds = dict(DEFAULT_ITEM_SECONDS)
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        name, _, seconds = part.partition("=")
+        item_seconds[name.strip()] = float(seconds)
+    return item_seconds
+
+
+class StageBudget:
+    """
+    1 つのステップに配分された時間。allocated が None なら無制限。
+    """
+
+    def __init__(self, name, allocated, backlog, item_seconds=1.0):
+        self.name = name
+        self.allocated = allocated
+        self.backlog = backlog
+        self.item_seconds = item_seconds
+        self.started = time.time()
+        self.ended = None
+        self.done = 0
+        self.carried = 0
+        self.stopped = False
+
+    def elapsed(self):
+        return (self.ended or time.time()) - self.started
+
+    def remaining(self):
+        return None if self.allocated is None else self.allocated - self.elapsed()
+
+    def batch_size(self, limit):
+        """
+        残りの配分時間で処理できる見込みの件数 (1〜limit)。まとめて処理するステップが締め切りを大きく超えないようにする。
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return max(1, min(limit, int(remaining / self.item_seconds)))
+
+    def expired(self):
+        """
+        配分された時間を使い切ったか。使い切った最初の呼び出しでメッセージを表示する。
+        """
+        if self.allocated is None or self.elapsed() < self.allocated:
+            return False
+        if not self.stopped:
+            self.stopped = True
+            print(f"  ⏱️ ステップ {self.name} の配分時間 ({self.allocated:.0f}秒) を使い切ったため打ち切ります。")
+        return True
+
+    def finish(self, done, carried=0):
+        """
+        処理した件数と、打ち切りで次回に持ち越した件数を記録する。
+        """
+        self.ended = time.time()
+        self.done = done
+        self.carried = carried
+
+
+class RunBudget:
+    """
+    実行全体の締め切りと、ステップごとの未処理件数・配分・実績。seconds が None なら締め切り無し。
+    """
+
+    def __init__(self, seconds=None, reserve=60.0, item_seconds=None):
+        self.started = time.time()
+        self.deadline = self.started + seconds if seconds else None
+        self.reserve = reserve
+        self.item_seconds = item_seconds or dict(DEFAULT_ITEM_SECONDS)
+        self.backlogs = {}
+        self.stages = []
+
+    @property
+    def limited(self):
+        return self.deadline is not None
+
+    def remaining(self):
+        return None if self.deadline is None else self.deadline - time.time()
+
+    def set_backlog(self, stage, items):
+        """
+        まだ始まっていないステップの未処理件数 (の見込み) を設定する。
+        """
+        self.backlogs[stage] = max(0, items)
+
+    def _work(self, stage):
+        return self.backlogs.get(stage, 0) * self.item_seconds.get(stage, 1.0)
+
+    def begin(self, stage, backlog=None):
+        """
+        ステップを開始し、残り時間を未処理件数に比例して配分した StageBudget を返す。
+        """
+        if backlog is not None:
+            self.set_backlog(stage, backlog)
+        allocated = None
+        if self.limited:
+            pending = [name for name in self.backlogs if name not in {s.name for s in self.stages}]
+            total_work = sum(self._work(name) for name in pending)
+            available = max(0.0, self.remaining() - self.reserve)
+            share = self._work(stage) / total_work if total_work else 1.0
+            allocated = available * share
+        stage_budget = StageBudget(stage, allocated, self.backlogs.get(stage, 0), self.item_seconds.get(stage, 1.0))
+        self.stages.append(stage_budget)
+        if allocated is not None:
+            print(f"  ⏱️ ステップ {stage}: 未処理 {stage_budget.backlog} 件に {allocated:.0f}秒を配分 "
+                  f"(締め切りまで残り {self.remaining():.0f}秒)")
+        return stage_budget
+
+    def has_time(self):
+        """
+        終了処理 (ソート・エクスポート・アーカイブ) を始めてよいか (締め切りを過ぎていないか)。
+        """
+        return not self.limited or self.remaining() > 0
+
+    def report(self):
+        """
+        ステップごとの 配分 / 実績 / 処理件数 / 持ち越し件数 を表示する。
+        """
+        print("\n===== ⏱️ 時間配分と実績 =====")
+        if self.limited:
+            total = self.deadline - self.started
+            print(f"  締め切り: 開始から {total:.0f}秒 (予備 {self.reserve:.0f}秒) / "
+                  f"経過 {time.time() - self.started:.0f}秒 / 残り {self.remaining():.0f}秒")
+        for stage in self.stages:
+            planned = f"{stage.allocated:8.1f}秒" if stage.allocated is not None else "   (無制限)"
+            per_item = f"{stage.elapsed() / stage.done:.2f}秒/件" if stage.done else "-"
+            print(f"  - {stage.name:<10} 配分 {planned} / 実績 {stage.elapsed():8.1f}秒 / "
+                  f"処理 {stage.done} 件 ({per_item}) / 持ち越し {stage.carried} 件"
+                  f"{' (打ち切り)' if stage.stopped else ''}")
@@ -0,0 +1,211 @@
+"""
+分析済み記事の列指向エクスポート。
+
+月 × キーワードでパーティション分割したデータセットに、まだエクスポートしていない
+(または前回のエクスポート後に分析し直された) 行だけを追記する。
+    <EXPORT_DIR>/month=YYYY-MM/keyword=<キーワード>/part-<実行時刻>.parquet
+    <EXPORT_DIR>/_watermark.json   (前回のエクスポートの時刻と件数)
+エクスポート済みかどうかは、SOURCE の exported_at 列 (エクスポートした時刻) に記事ごとに記録する。
+analyzed_at は分析した時刻で、保存先に書き込まれた時刻ではないため、最大値をウォーターマークにすると
+他のワーカーのエクスポートの後に書き込まれた古い analyzed_at の行を取りこぼす。
+また EXPORT_DIR は CI ではキャッシュにしか残らないため、アーカイブの判断に使う記録は SOURCE 側に置く。
+pyarrow がある場合は Parquet (日時は timestamp、件数は int、sentiment / category /
+company_info は辞書エンコード)、無い場合は同じレイアウトの gzip CSV を書き出す。
+keyword はディレクトリ名 (Hive 形式のパーティション) に含まれるため、ファイルには書かない。
+複数のキーワードに一致した記事は、最初のキーワードのパーティションに書き出す。
+"""
+import csv
+import gzip
+import json
+import os
+from datetime import datetime
+from urllib.parse import quote
+
+WATERMARK_FILE = "_watermark.json"
+WATERMARK_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+# ファイルに書き出す列と型 (Parquet のスキーマ、CSV の列順)
+COLUMNS = [
+    ("article_id", "string"),
+    ("url", "string"),
+    ("title", "string"),
+    ("source", "dictionary"),
+    ("post_time", "timestamp"),
+    ("comment_count", "int"),
+    ("sentiment", "dictionary"),
+    ("category", "dictionary"),
+    ("company_info", "dictionary"),
+    ("nissan_mention", "string"),
+    ("nissan_sentiment", "string"),
+    ("analyzed_at", "timestamp"),
+]
+
+
+def _load_pyarrow():
+    """
+    pyarrow を遅延読み込みする (import 時間が長いため、書き出すときだけ読み込む)。無ければ (None, None)。
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None, None
+    return pa, pq
+
+
+def parquet_available():
+    return _load_pyarrow()[0] is not None
+
+
+def _arrow_schema(pa):
+    fields = []
+    for name, kind in COLUMNS:
+        if kind == "timestamp":
+            fields.append(pa.field(name, pa.timestamp("s")))
+        elif kind == "int":
+            fields.append(pa.field(name, pa.int32()))
+        elif kind == "dictionary":
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+class ExportLedger:
+    """
+    以前の形式の _watermark.json に記録した、エクスポート済みの記事 {記事ID: エクスポートした時点の analyzed_at 列の値}。
+    analyzed_at の最大値だけを記録した形式の場合は、その時刻以前に分析された記事をエクスポート済みとみなす
+    (legacy_watermark)。exported_at 列がまだ空の行を、書き出し直さずにエクスポート済みとして記録するために使う。
+    """
+
+    def __init__(self, exported=None, legacy_watermark=None):
+        self.exported = exported or {}
+        self.legacy_watermark = legacy_watermark
+
+    def is_exported(self, article_id, analyzed_at_text, analyzed_at):
+        if article_id in self.exported:
+            # 分析し直された記事は analyzed_at が変わるため、もう一度書き出す
+            return self.exported[article_id] == analyzed_at_text
+        return self.legacy_watermark is not None and analyzed_at is not None and analyzed_at <= self.legacy_watermark
+
+
+def is_exported(analyzed_at, exported_at):
+    """
+    analyzed_at 列・exported_at 列の日時から、その分析結果をエクスポート済みか判定する
+    (エクスポートの後に分析し直された行はエクスポート済みとみなさない)。
+    """
+    return exported_at is not None and (analyzed_at is None or exported_at >= analyzed_at)
+
+
+def read_ledger(export_dir):
+    """
+    以前の形式のエクスポート済みの記事の記録を読み込む。無ければ空の記録。
+    """
+    path = os.path.join(export_dir, WATERMARK_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return ExportLedger()
+    legacy = saved.get("analyzed_at")
+    try:
+        legacy_watermark = datetime.strptime(legacy, WATERMARK_FORMAT) if legacy else None
+    except ValueError:
+        legacy_watermark = None
+    return ExportLedger(dict(saved.get("exported", {})), legacy_watermark)
+
+
+def write_watermark(export_dir, rows):
+    """
+    エクスポートした時刻と、今回書き出した件数を保存する (以前の形式の記録は置き換える)。
+    """
+    path = os.path.join(export_dir, WATERMARK_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    saved = {
+        "rows": rows,
+        "exported_at": datetime.now().strftime(WATERMARK_FORMAT),
+    }
+    os.makedirs(export_dir, exist_ok=True)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(saved, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def partition_dir(export_dir, record):
+    """
+    レコードの書き込み先 (month=YYYY-MM/keyword=...) を返す。値は URI エンコードする (pyarrow の Hive 形式と同じ)。
+    """
+    posted = record["post_time"] or record["analyzed_at"]
+    month = posted.strftime("%Y-%m") if posted else "unknown"
+    keyword = quote(record["keyword"] or "unknown", safe="")
+    return os.path.join(export_dir, f"month={month}", f"keyword={keyword}")
+
+
+def _write_parquet(path, records):
+    pa, pq = _load_pyarrow()
+    columns = {name: [record[name] for record in records] for name, _ in COLUMNS}
+    table = pa.table(columns, schema=_arrow_schema(pa))
+    pq.write_table(table, path, compression="zstd")
+
+
+def _write_csv(path, records):
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in COLUMNS])
+        for record in records:
+            row = []
+            for name, kind in COLUMNS:
+                value = record[name]
+                if value is None:
+                    row.append("")
+                elif kind == "timestamp":
+                    row.append(value.isoformat(sep=" "))
+                else:
+                    row.append(value)
+            writer.writerow(row)
+
+
+def write_partitions(export_dir, records, run_id=None):
+    """
+    レコードをパーティションごとに新しいファイルとして書き出す (既存ファイルは書き換えない)。
+    書き出したファイルのパス一覧を返す。
+    """
+    run_id = run_id or datetime.now().strftime("%Y%m%d%H%M%S")
+    use_parquet = parquet_available()
+    suffix = "parquet" if use_parquet else "csv.gz"
+    groups = {}
+    for record in records:
+        groups.setdefault(partition_dir(export_dir, record), []).append(record)
+
+    written = []
+    for directory, group in sorted(groups.items()):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{run_id}.{suffix}")
+        sequence = 1
+        while os.path.exists(path):
+            sequence += 1
+            path = os.path.join(directory, f"part-{run_id}-{sequence}.{suffix}")
+        if use_parquet:
+            _write_parquet(path, group)
+        else:
+            _write_csv(path, group)
+        written.append(path)
+    return written
+
+
+def remove_other_parts(export_dir, keep):
+    """
+    データセットのファイル (part-*) のうち keep 以外を削除し、空になったパーティションのディレクトリも削除する。
+    全件を書き出し直したときに、以前のファイルとの重複を無くすために使う。削除した件数を返す。
+    """
+    keep = {os.path.abspath(path) for path in keep}
+    removed = 0
+    for directory, _, files in os.walk(export_dir, topdown=False):
+        for name in files:
+            path = os.path.abspath(os.path.join(directory, name))
+            if name.startswith("part-") and path not in keep:
+                os.remove(path)
+                removed += 1
+        if directory != export_dir and not os.listdir(directory):
+            os.rmdir(directory)
+    return removed
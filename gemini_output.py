@@ -0,0 +1,102 @@
+"""
+Gemini の分析結果 (JSON) のスキーマ・取り出し・検証。
+
+sentiment / category は選択肢 (enum) を持つ文字列、それ以外は自由記述の文字列。
+検証は各キーを個別に行い、不足・不正なキーだけを再問い合わせできるようにする。
+"""
+import json
+import re
+
+ANALYSIS_KEYS = ["sentiment", "category", "company_info", "nissan_mention", "nissan_sentiment"]
+
+SENTIMENTS = ["ポジティブ", "ネガティブ", "ニュートラル"]
+CATEGORIES = ["会社", "モデル", "技術", "モータースポーツ", "バイク", "その他"]
+
+# 判定ラベルの後ろに付く理由 ('ネガティブ（理由：...）' など) の区切り
+_LABEL_SPLIT_RE = re.compile(r"[（(]")
+
+
+def response_schema(keys):
+    """
+    keys だけを持つ JSON オブジェクトの response_schema (OpenAPI 形式の dict) を返す。
+    """
+    properties = {}
+    for key in keys:
+        if key == "sentiment":
+            properties[key] = {"type": "string", "format": "enum", "enum": SENTIMENTS}
+        elif key == "category":
+            properties[key] = {"type": "string", "format": "enum", "enum": CATEGORIES}
+        else:
+            properties[key] = {"type": "string"}
+    return {"type": "object", "properties": properties, "required": list(keys)}
+
+
+def parse_json_object(text):
+    """
+    応答テキストから最初の JSON オブジェクトを取り出して返す。取り出せなければ None。
+    (スキーマ指定時は応答全体が JSON だが、テキスト出力時は前後の説明文やコードフェンスを読み飛ばす)
+    """
+    text = (text or "").strip()
+    try:
+        result = json.loads(text)
+        return result if isinstance(result, dict) else None
+    except ValueError:
+        pass
+
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\{", text):
+        try:
+            result, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(result, dict):
+            return result
+    return None
+
+
+def _label(value):
+    return _LABEL_SPLIT_RE.split(value, maxsplit=1)[0].strip()
+
+
+def comparable_label(value):
+    """
+    判定結果を正解ラベルと比べるための値 (後ろに付く理由を除いたもの)。
+    """
+    return _label(value) if isinstance(value, str) else ""
+
+
+def validate_field(key, value):
+    """
+    1 つのキーの値を検証し、正規化した値を返す。不正なら None。
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not value or value.upper().startswith("N/A"):
+        return None
+
+    if key == "sentiment":
+        label = _label(value)
+        return label if label in SENTIMENTS else None
+    if key == "category":
+        label = _label(value)
+        return label if label in CATEGORIES else None
+    if key == "nissan_sentiment":
+        # 「-」または「判定（理由：...）」
+        return value if value == "-" or _label(value) in SENTIMENTS else None
+    return value
+
+
+def validate_analysis(result, keys=None):
+    """
+    分析結果の各キーを検証し、(正しいキーの値の辞書, 不足・不正なキーの一覧) を返す。
+    """
+    fields = {}
+    invalid = []
+    for key in keys or ANALYSIS_KEYS:
+        value = validate_field(key, result.get(key)) if isinstance(result, dict) else None
+        if value is None:
+            invalid.append(key)
+        else:
+            fields[key] = value
+    return fields, invalid
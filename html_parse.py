@@ -0,0 +1,167 @@
+"""
+記事ページ・コメントページの HTML 解析と、解析用のプロセスプール。
+
+BeautifulSoup による解析は CPU 処理のため、取得した生の HTML をワーカープロセスに渡して並列に解析し、
+抽出したプレーンなデータ (文字列・タプル) だけを受け取る。
+件数が少ないバッチはプロセス間のやり取りの方が高くつくため、スレッドプールで解析する。
+このモジュールはワーカープロセスでも読み込まれるため、main.py など重いモジュールに依存しない。
+複数の候補があるセレクタは、親プロセスから渡された優先するセレクタ (selector_cache) を先に試し、
+どれを試したかを結果の "selectors" に入れて返す (親プロセスで SelectorProfile に記録する)。
+"""
+import os
+import re
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from selector_cache import run_cascade
+
+# 解析に使うワーカープロセス数 (既定: CPU コア数)
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+# この件数未満のバッチはプロセスプールを使わず、スレッドプールで解析する
+PARSE_PROCESS_MIN_BATCH = int(os.environ.get("PARSE_PROCESS_MIN_BATCH", "8"))
+
+
+def _make_soup(html):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser")
+
+
+def parse_article_page(html, preferred=None, first_page=True):
+    """
+    記事ページの HTML から本文・コメント数・投稿日時 (time タグの datetime 属性) を取り出す。
+    見つからない項目は None。解析に失敗した場合は {"error": メッセージ} を返す。
+    preferred ({カスケード名: ラベル}) のセレクタを先に試す。
+    first_page=False (2 ページ目以降) の場合は本文だけを取り出す (コメント数・投稿日時は 1 ページ目だけで使う)。
+    """
+    try:
+        soup = _make_soup(html)
+
+        # 記事本文 (class="article_body")
+        body_container = soup.find("div", class_="article_body")
+        body = body_container.get_text(separator="\n", strip=True) if body_container else None
+        if not first_page:
+            return {"body": body}
+
+        # コメント数 (動的クラス名対応)
+        comment_count = None
+        comment_count_tag, comment_count_trace = run_cascade([
+            ("CommentCountButton",
+             lambda: soup.find("a", class_=re.compile(r"CommentCount__CommentCountButton"), href=re.compile(r"/comments/"))),
+            # (フォールバック) sc-1n9vtw0-1 (コメントボタン)
+            ("sc-1n9vtw0-1", lambda: soup.find("button", class_=re.compile(r"sc-1n9vtw0-1"))),
+        ], (preferred or {}).get("article_comment_count"))
+        if comment_count_tag:
+            match = re.search(r"(\d+)", comment_count_tag.text)
+            if match:
+                comment_count = match.group(1)
+
+        # 正確な投稿日時
+        time_tag = soup.find("time")
+        post_time = time_tag["datetime"] if time_tag and time_tag.has_attr("datetime") else None
+
+        return {
+            "body": body, "comment_count": comment_count, "post_time": post_time,
+            "selectors": {"article_comment_count": comment_count_trace},
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def parse_comments_page(html):
+    """
+    コメントページの HTML から (ユーザー名, コメント本文) のリストを取り出す。
+    コメント欄のコンテナが無ければ comments は None。解析に失敗した場合は {"error": メッセージ} を返す。
+    (動的な `sc-` クラス名に対応)
+    """
+    try:
+        soup = _make_soup(html)
+
+        # 1. コメント欄のメインコンテナを探す
+        comment_main = soup.find("article", id="comment-main")
+        if not comment_main:
+            return {"comments": None}
+
+        # 2. コンテナ内の全 <article> タグ (これが各コメント) を探す
+        #    (専門家コメント `sc-z8tf0-1`、一般コメント `sc-169yn8p-3` に対応)
+        comments = []
+        for comment in comment_main.find_all("article", class_=re.compile(r"sc-")):
+            user_name = "ユーザー名不明"
+            comment_text = "コメント本文なし"
+
+            # 3. ユーザー名 (h2 タグ) を探す
+            user_name_tag = comment.find("h2")
+            if user_name_tag:
+                user_name = user_name_tag.get_text(strip=True)
+
+            # 4. コメント本文 (p タグ) を探す
+            #    (専門家 `sc-z8tf0-11`、一般 `sc-169yn8p-10` に対応する p タグ)
+            comment_text_tag = comment.find("p", class_=re.compile(r"sc-.*-\d{1,2}$"))
+            if comment_text_tag:
+                comment_text = comment_text_tag.get_text(strip=True)
+
+            comments.append((user_name, comment_text))
+        return {"comments": comments}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _init_worker():
+    """
+    ワーカープロセスの初期化。fork で起動すると親プロセス (main.py) の SIGTERM ハンドラー
+    (KeyboardInterrupt を送出する) を引き継ぐため、既定の動作 (そのまま終了) に戻す。
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+class ParsePool:
+    """
+    HTML の解析を並列に実行するプール。プロセスプールは最初に必要になったときに起動し、実行中は使い回す。
+    """
+
+    def __init__(self, workers=PARSE_WORKERS, min_process_batch=PARSE_PROCESS_MIN_BATCH):
+        self.workers = max(1, workers)
+        self.min_process_batch = min_process_batch
+        self.processes = None
+        self.threads = None
+        self.process_batches = 0
+        self.thread_batches = 0
+
+    def _process_pool(self):
+        if self.processes is None:
+            self.processes = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return self.processes
+
+    def _thread_pool(self):
+        if self.threads is None:
+            self.threads = ThreadPoolExecutor(max_workers=self.workers)
+        return self.threads
+
+    def map(self, func, htmls):
+        """
+        htmls の各要素に func を適用した結果のリストを返す (順序は htmls と同じ)。
+        """
+        htmls = list(htmls)
+        if not htmls:
+            return []
+        if self.workers > 1 and len(htmls) >= self.min_process_batch:
+            chunksize = max(1, len(htmls) // (self.workers * 4))
+            try:
+                results = list(self._process_pool().map(func, htmls, chunksize=chunksize))
+                self.process_batches += 1
+                return results
+            except (BrokenProcessPool, OSError) as e:
+                # プロセスを起動できない環境では、以降はスレッドプールだけで解析する
+                print(f"  ⚠️ 解析用のプロセスプールを使えないため、スレッドで解析します: {e}")
+                self.close()
+                self.min_process_batch = float("inf")
+        self.thread_batches += 1
+        return list(self._thread_pool().map(func, htmls))
+
+    def close(self):
+        if self.processes is not None:
+            self.processes.shutdown()
+            self.processes = None
+        if self.threads is not None:
+            self.threads.shutdown()
+            self.threads = None
@@ -1,16 +1,35 @@
 import os
 import re
+import sys
 import time
+import math
 import json
-import gspread
-import requests
+import csv
+import gzip
+import argparse
+import contextlib
+import functools
+import socket
+import signal
+import sqlite3
 import traceback
-import google.generativeai as genai
-from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
-from google.oauth2.service_account import Credentials
-from google.api_core.exceptions import GoogleAPIError
-from gspread.exceptions import APIError as GSpreadAPIError
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote_plus
+from profiling import StageProfiler
+import blob_store
+import storage
+from storage import extract_article_id, column_letter, row_range, iter_sheet_rows
+import rollup
+import gemini_output
+import export
+import search_planner
+import html_parse
+import sharding
+import budget
+from budget import RunBudget
+import model_router
+import selector_cache
+import story_cluster
 
 # --- グローバル変数 ---
 # Googleスプレッドシートのスコープと認証情報
@@ -18,22 +37,78 @@ SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
-# 環境変数からスプレッドシートキーを取得
+# 環境変数からスプレッドシートキーを取得 (未設定かどうかは setup_gspread で確認する)
 SPREADSHEET_KEY = os.environ.get("SPREADSHEET_KEY")
-if not SPREADSHEET_KEY:
-    # ログ出力（致命的エラー）
-    print("❌ 環境変数 'SPREADSHEET_KEY' が設定されていません。", flush=True)
-    # スクリプトの実行を停止
-    exit(1) # exit(1) はエラーによる終了を示す
 
-# Geminiモデルのグローバルインスタンス
-gemini_model = None
+# Yahoo!ニュースのベースURL (ベンチマーク時はローカルのスタブサーバーに差し替える)
+YAHOO_NEWS_BASE_URL = os.environ.get("YAHOO_NEWS_BASE_URL", "https://news.yahoo.co.jp").rstrip("/")
+
+# リクエスト間の待機時間の倍率 (ベンチマーク時は 0 にして待機を省略できる)
+REQUEST_INTERVAL_SCALE = float(os.environ.get("REQUEST_INTERVAL_SCALE", "1"))
 
-# 検索キーワード
-SEARCH_KEYWORDS = [
+# Geminiモデルのグローバルインスタンス (gemini_fast_model は短い記事用。None なら全記事を gemini_model で分析する)
+gemini_model = None
+gemini_fast_model = None
+
+# HTML 解析用のプール (get_parse_pool で作成する)
+parse_pool = None
+
+# 成功したセレクタとヒット・ミスの件数を保存するファイル (空なら保存せず、実行中だけ記録する)
+SELECTOR_PROFILE_FILE = os.environ.get("SELECTOR_PROFILE_FILE", "selector_profile.json")
+# 優先したセレクタのミス率がこの値以上なら、マークアップの変化として警告する
+SELECTOR_MISS_ALERT = float(os.environ.get("SELECTOR_MISS_ALERT", "0.2"))
+# セレクタプロファイル (get_selector_profile で作成する)
+selector_profile = None
+
+# 本文・コメントを取得する記事のまとまり (この件数ごとにページを取得し、まとめて解析する)
+FETCH_BATCH_SIZE = int(os.environ.get("FETCH_BATCH_SIZE", "50"))
+
+# Gemini の応答を JSON スキーマで制約する (モデルが未対応の場合は自動でテキスト出力に切り替える)
+GEMINI_STRUCTURED_OUTPUT = os.environ.get("GEMINI_STRUCTURED_OUTPUT", "1") == "1"
+# JSON スキーマ指定に対応していなかったモデルの名前 (これらのモデルだけテキスト出力にする)
+unstructured_models = set()
+# 一部のキーが不足・不正だった場合に、そのキーだけを再問い合わせする回数
+GEMINI_REPAIR_ATTEMPTS = int(os.environ.get("GEMINI_REPAIR_ATTEMPTS", "1"))
+
+# --- Gemini のモデル振り分け ---
+# 長い記事・複数のメーカーが登場する記事を分析するモデルと、短い記事を分析する速く安いモデル
+# (既定は空で振り分けない。route-eval で一致率を確かめてから指定する)
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-pro")
+GEMINI_FAST_MODEL = os.environ.get("GEMINI_FAST_MODEL", "")
+# 本文がこの文字数以下で、登場するメーカーが GEMINI_ROUTE_MAX_MAKERS 社以下の記事を速いモデルに振り分ける
+GEMINI_ROUTE_MAX_CHARS = int(os.environ.get("GEMINI_ROUTE_MAX_CHARS", "1500"))
+GEMINI_ROUTE_MAX_MAKERS = int(os.environ.get("GEMINI_ROUTE_MAX_MAKERS", "1"))
+# 振り分け先ごとの 100 万トークンあたりの単価 (米ドル、'fast=入力/出力,strong=入力/出力'。指定の無い振り分け先は費用を表示しない)
+GEMINI_ROUTE_PRICES = os.environ.get("GEMINI_ROUTE_PRICES", "")
+# 振り分け先ごとの所要時間・トークン数・費用
+route_stats = model_router.RouteStats(model_router.parse_prices(GEMINI_ROUTE_PRICES))
+
+# --- ストーリー (同じ出来事を扱う記事のまとまり) ---
+# 同じストーリーの記事は代表記事だけを通常どおり分析し、他の記事は代表記事の結果を確認するだけにする
+# (既定は無効。確認だけの記事は本文の冒頭だけを速いモデルで確認するため、結果の質が変わる)
+STORY_CLUSTERING = os.environ.get("STORY_CLUSTERING", "0") == "1"
+# 同じストーリーとみなす投稿日時の差 (時間) と、TF-IDF のコサイン類似度のしきい値
+STORY_WINDOW_HOURS = float(os.environ.get("STORY_WINDOW_HOURS", "48"))
+STORY_SIMILARITY = float(os.environ.get("STORY_SIMILARITY", "0.4"))
+# ストーリーの判定に使う本文の冒頭の文字数 (タイトルとあわせて比べる)
+STORY_LEAD_CHARS = int(os.environ.get("STORY_LEAD_CHARS", "200"))
+# 代表記事の結果を確認するときに Gemini へ渡す本文の冒頭の文字数
+STORY_CONFIRM_CHARS = int(os.environ.get("STORY_CONFIRM_CHARS", "800"))
+# 確認だけを行った記事の analysis_model 列に付ける印
+STORY_CONFIRM_MARK = " (確認)"
+
+# 検索キーワード (KEYWORDS_FILE から読み込む。ファイルが無い場合は既定のキーワード)
+KEYWORDS_FILE = os.environ.get("KEYWORDS_FILE", search_planner.KEYWORDS_FILE)
+SEARCH_KEYWORDS = search_planner.load_keywords(KEYWORDS_FILE) or [
     "トヨタ", "日産", "ホンダ", "三菱自動車",
     "マツダ", "スバル", "ダイハツ", "スズキ"
 ]
+# 1 回の検索に OR でまとめるキーワード数 (1 でキーワードごとに検索する)
+SEARCH_OR_GROUP_SIZE = int(os.environ.get("SEARCH_OR_GROUP_SIZE", "1"))
+# OR クエリの検索結果を送るページ数の上限 (0 ならまとめたキーワード数。キーワードごとに検索した場合と同じ件数まで読める)
+SEARCH_OR_MAX_PAGES = int(os.environ.get("SEARCH_OR_MAX_PAGES", "0"))
+# 検索結果 1 ページあたりの記事数 (0 なら OR クエリの 1 ページ目の件数。これより短いページで結果が尽きたとみなす)
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "0"))
 
 # プロンプトのファイルパス
 PROMPT_FILES = {
@@ -48,13 +123,119 @@ PROMPT_FILES = {
 # 読み込んだプロンプトを格納する辞書
 PROMPTS = {}
 
+# SOURCE シートのヘッダー (プログラムが期待する列の並び)
+SOURCE_HEADERS = [
+    'keyword', 'URL', 'post_time_str', 'source', 'title', 'analysis_flag', 
+    'body_p1', 'body_p2', 'body_p3', 'body_p4', 'body_p5', 'body_p6', 
+    'body_p7', 'body_p8', 'body_p9', 'body_p10', 
+    'sentiment', 'category', 'company_info', 
+    'comment_count', 'full_post_time', 
+    'comment_1', 'comment_2', 'comment_3', 'comment_4', 'comment_5', 
+    'comment_6', 'comment_7', 'comment_8', 'comment_9', 'comment_10', 
+    'nissan_mention', 'nissan_sentiment',
+    'body_pages', 'body_hash', 'rollup_key', 'analyzed_at', 'analysis_model', 'cluster_id', 'exported_at'
+]
+
+# SOURCE データの保存先: "sheets" (SOURCE シート) / "sqlite" / "csv" (ローカルファイル)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sheets")
+# sqlite / csv の場合のファイルパス (既定: source.sqlite3 / source.csv)
+STORAGE_PATH = os.environ.get("STORAGE_PATH", "")
+
+# 本文の保存先: "sheet" (body_p1〜body_p10 列に分割) / "blob" (ローカルのブロブストアに保存し、
+# シートには冒頭の抜粋・ページ数・ハッシュだけを書く)
+BODY_STORE = os.environ.get("BODY_STORE", "sheet")
+# blob モードでシート (body_p1 列) に残す抜粋の文字数
+BODY_EXCERPT_CHARS = int(os.environ.get("BODY_EXCERPT_CHARS", "200"))
+
+# 分析結果の日別集計 (SUMMARY シート) を分析ステップで差分更新する
+ROLLUP_ENABLED = os.environ.get("ROLLUP_ENABLED", "1") == "1"
+
+# 分析済み記事の列指向エクスポート先 (空なら無効)
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "")
+
+# --- 複数ワーカーでの分担実行 ---
+# このワーカーの担当 ('K/N'、空なら分担しない) と行の分け方 ("hash": 記事IDのハッシュ / "keyword": keyword 列)
+SHARD = os.environ.get("SHARD", "")
+SHARD_MODE = os.environ.get("SHARD_MODE", "hash")
+# リースの保存先 ('sqlite:<パス>' / 'file:<ディレクトリ>'、空ならリースを使わない) と有効期限 (秒)
+LEASE_STORE = os.environ.get("LEASE_STORE", "")
+LEASE_TTL = int(os.environ.get("LEASE_TTL", "1800"))
+# リースの持ち主として記録するワーカー名
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# 実行中の担当とリースの保存先 (main で設定する)
+shard = None
+lease_store = None
+
+# --- 実行の締め切り ---
+# 実行開始からの制限時間 ('55m' / '1h' / '3300s'、空なら無制限)。ステップごとに未処理件数に比例して時間を配分する
+RUN_DEADLINE = os.environ.get("RUN_DEADLINE", "")
+# 締め切りのうち、終了処理 (書き込み・ソート・エクスポート) のために残しておく秒数
+RUN_DEADLINE_RESERVE = float(os.environ.get("RUN_DEADLINE_RESERVE", "60"))
+# 1 件あたりの見込み秒数の上書き ('fetch=8,analyze=4' 形式、既定は budget.DEFAULT_ITEM_SECONDS)
+BUDGET_ITEM_SECONDS = os.environ.get("BUDGET_ITEM_SECONDS", "")
+# 1 回の分析ステップで分析する最大件数
+MAX_ANALYZE = 30
+
+# --- アーカイブ設定 ---
+# 分析済みで投稿から N 日以上経過した行を SOURCE から月別アーカイブへ移す (0 なら無効)
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "0"))
+# アーカイブ先: "sheet" (月別シート ARCHIVE_YYYYMM) / "local" (ARCHIVE_DIR に月別の gzip CSV)
+ARCHIVE_MODE = os.environ.get("ARCHIVE_MODE", "sheet")
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+# ARCHIVE_DIR が永続的な保存先か (既定: CI (GitHub Actions) 以外なら永続的とみなす)。
+# 永続的でない場合、local モードでは SOURCE の行を削除しない
+ARCHIVE_DIR_DURABLE = os.environ.get("ARCHIVE_DIR_DURABLE", "0" if os.environ.get("GITHUB_ACTIONS") == "true" else "1") == "1"
+# 月別シートを作成するスプレッドシート (セル数上限を避けるため別ファイルも指定可能)
+ARCHIVE_SPREADSHEET_KEY = os.environ.get("ARCHIVE_SPREADSHEET_KEY") or SPREADSHEET_KEY
+# 1 回の実行でアーカイブする最大行数
+ARCHIVE_MAX_ROWS = int(os.environ.get("ARCHIVE_MAX_ROWS", "5000"))
+# 重複チェック用の索引シート (アーカイブ済み記事IDとアーカイブ先)
+ARCHIVE_INDEX_SHEET = "ARCHIVE_INDEX"
+ARCHIVE_INDEX_HEADERS = ["article_id", "archive"]
+
+
+# --- 重いライブラリの遅延読み込み ---
+# requests / gspread / google-generativeai / bs4 は使うステップで初めて読み込む
+# (import main だけでは読み込まないため、ライブラリとしての利用や単機能のサブコマンドの起動が速い)
+
+def gspread_exceptions():
+    """
+    gspread.exceptions モジュールを返す。
+    except 節の式は例外が発生したときにだけ評価されるため、except gspread_exceptions().APIError のように使う。
+    """
+    from gspread import exceptions
+    return exceptions
+
+
+def google_api_exceptions():
+    """
+    google.api_core.exceptions モジュールを返す (Gemini API のエラー判定用)。
+    """
+    from google.api_core import exceptions
+    return exceptions
+
+
+def make_soup(html):
+    """
+    HTML を BeautifulSoup (html.parser) で解析する。
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "html.parser")
+
 
 def setup_gspread():
     """
     Google スプレッドシート API への認証を行う。
     環境変数 GCP_SERVICE_ACCOUNT_KEY から認証情報を読み込む。
     """
+    if not SPREADSHEET_KEY:
+        print("❌ 環境変数 'SPREADSHEET_KEY' が設定されていません。", flush=True)
+        return None
+
     try:
+        import gspread
+        from google.oauth2.service_account import Credentials
+
         # 環境変数からサービスアカウントキーのJSON文字列を取得
         creds_json_str = os.environ.get("GCP_SERVICE_ACCOUNT_KEY")
         if not creds_json_str:
@@ -84,6 +265,15 @@ def setup_gspread():
         return None
 
 
+def wait_interval(seconds):
+    """
+    サイト・APIへの連続アクセスを避けるための待機。
+    REQUEST_INTERVAL_SCALE で待機時間を一括調整する (0 なら待機しない)。
+    """
+    if REQUEST_INTERVAL_SCALE > 0:
+        time.sleep(seconds * REQUEST_INTERVAL_SCALE)
+
+
 def get_worksheet(gc, sheet_name):
     """
     gspread クライアントとシート名を受け取り、ワークシートオブジェクトを返す。
@@ -95,7 +285,7 @@ def get_worksheet(gc, sheet_name):
         spreadsheet = gc.open_by_key(SPREADSHEET_KEY)
         worksheet = spreadsheet.worksheet(sheet_name)
         return worksheet
-    except GSpreadAPIError as e:
+    except gspread_exceptions().APIError as e:
         print(f"  ❌ ワークシート '{sheet_name}' が見つからないか、アクセス権限がありません: {e}")
         return None
     except Exception as e:
@@ -103,30 +293,83 @@ def get_worksheet(gc, sheet_name):
         return None
 
 
-def load_existing_urls(ws):
+def open_source_store(gc=None):
+    """
+    STORAGE_BACKEND に応じた SOURCE データの保存先を返す。Sheets の場合にシートを取得できなければ None。
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return storage.SQLiteStore(STORAGE_PATH or "source.sqlite3", SOURCE_HEADERS)
+    if STORAGE_BACKEND == "csv":
+        return storage.CSVStore(STORAGE_PATH or "source.csv", SOURCE_HEADERS)
+    ws = get_worksheet(gc, "SOURCE")
+    return storage.SheetsStore(ws, SOURCE_HEADERS) if ws else None
+
+
+def load_existing_ids(store):
     """
-    SOURCE ワークシートから B 列（URL）のデータを読み込み、
-    重複チェック用のセットとして返す。
+    保存先の記事IDと、アーカイブ索引の記事ID (Sheets の場合) をあわせて重複チェック用のセットとして返す。
     """
     try:
-        # B列の全ての値を取得
-        urls = ws.col_values(2) # B列は 2
-        # 1行目（ヘッダー）を除く
-        return set(urls[1:])
+        existing_ids = store.ids()
+        # アーカイブ済みの記事も重複チェックの対象にする
+        if store.spreadsheet is not None:
+            existing_ids.update(load_archived_article_ids(store.spreadsheet))
+        return existing_ids
     except Exception as e:
-        print(f"  ❌ 既存URLの読み込みに失敗しました: {e}")
+        print(f"  ❌ 既存記事IDの読み込みに失敗しました: {e}")
         # 空のセットを返して処理を続行
         return set()
 
 
-# (修正済) Yahoo!ニュースのHTML構造変更（一覧ページ）に対応
-def get_yahoo_news_search_results(keyword):
+def load_archived_article_ids(spreadsheet):
+    """
+    アーカイブ索引シートの記事ID (A列) を返す。索引シートがなければ空リスト。
+    """
+    try:
+        index_ws = spreadsheet.worksheet(ARCHIVE_INDEX_SHEET)
+    except gspread_exceptions().WorksheetNotFound:
+        return []
+    return index_ws.col_values(1)[1:]
+
+
+def get_or_create_worksheet(spreadsheet, title, headers):
+    """
+    ワークシートを取得する。存在しなければ headers を 1 行目に持つシートを作成する。
+    """
+    try:
+        return spreadsheet.worksheet(title)
+    except gspread_exceptions().WorksheetNotFound:
+        print(f"  ワークシート '{title}' が無いため作成します。")
+        ws = spreadsheet.add_worksheet(title=title, rows=1000, cols=len(headers))
+        ws.update('A1', [headers], value_input_option='RAW')
+        return ws
+
+
+def parse_sheet_datetime(value):
+    """
+    シート上の日時文字列 ('2025/11/11 10:15:00' など) を datetime に変換する。変換できなければ None。
+    """
+    for fmt in ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+
+def get_yahoo_news_search_results(keyword, query=None, start=1):
     """
     指定されたキーワードで Yahoo!ニュースを検索し、
-    記事のタイトル、URL、発行元、投稿時間のリストを返す。
+    記事のタイトル、URL、発行元、投稿時間、スニペットのリストを返す。
+    query を指定した場合は query ('トヨタ OR 日産' など) で検索し、結果の keyword は keyword とする。
+    start (1 始まり) を指定すると、その順位からの結果ページを取得する。
     """
-    print(f"  Yahoo!ニュース検索開始 (キーワード: {keyword})...")
-    search_url = f"https://news.yahoo.co.jp/search?p={keyword}&ei=utf-8"
+    import requests
+    query = query or keyword
+    print(f"  Yahoo!ニュース検索開始 (キーワード: {query}{f', {start}件目から' if start > 1 else ''})...")
+    search_url = f"{YAHOO_NEWS_BASE_URL}/search?p={quote_plus(query)}&ei=utf-8"
+    if start > 1:
+        search_url += f"&b={start}"
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
@@ -135,29 +378,31 @@ def get_yahoo_news_search_results(keyword):
         response = requests.get(search_url, headers=headers)
         response.raise_for_status() # HTTPエラーをチェック
         
-        soup = BeautifulSoup(response.text, "html.parser")
+        soup = make_soup(response.text)
+        # 前回成功したセレクタを先に試す (ミスした場合は残りを元の順に試す)
+        profile = get_selector_profile()
         
         # --- コンテナを探す ---
-        # (新) <ol class="newsFeed_list"> を探す
-        search_results_container = soup.find("ol", class_="newsFeed_list")
-        # (新) <div class="newsFeed"> (小文字) を探す
-        if not search_results_container:
-            search_results_container = soup.find("div", class_="newsFeed")
-        # (旧) <div class="NewsFeed"> (大文字) を探す
-        if not search_results_container:
-             search_results_container = soup.find("div", class_="NewsFeed")
-        # (旧) <div class...="Search__ResultList"> を探す
-        if not search_results_container:
-            search_results_container = soup.find("div", class_=re.compile(r"Search__ResultList"))
+        search_results_container = profile.run("search_container", [
+            # (新) <ol class="newsFeed_list"> を探す
+            ("ol.newsFeed_list", lambda: soup.find("ol", class_="newsFeed_list")),
+            # (新) <div class="newsFeed"> (小文字) を探す
+            ("div.newsFeed", lambda: soup.find("div", class_="newsFeed")),
+            # (旧) <div class="NewsFeed"> (大文字) を探す
+            ("div.NewsFeed", lambda: soup.find("div", class_="NewsFeed")),
+            # (旧) <div class...="Search__ResultList"> を探す
+            ("Search__ResultList", lambda: soup.find("div", class_=re.compile(r"Search__ResultList"))),
+        ])
 
         if not search_results_container:
             print(f"  - 検索結果のコンテナが見つかりません (ol.newsFeed_list, div.newsFeed, div.NewsFeed, Search__ResultList のいずれか)。")
             return []
 
         # --- 記事要素 (li) を探す ---
-        articles = search_results_container.find_all("li")
-        if not articles:
-            articles = search_results_container.find_all("div", class_="newsFeed_item")
+        articles = profile.run("search_items", [
+            ("li", lambda: search_results_container.find_all("li")),
+            ("div.newsFeed_item", lambda: search_results_container.find_all("div", class_="newsFeed_item")),
+        ])
 
         if not articles:
             print("  - 記事要素 (li or div.newsFeed_item) が見つかりません。")
@@ -182,7 +427,7 @@ def get_yahoo_news_search_results(keyword):
                 url = title_tag["href"]
                 
                 # 記事URL以外は除外
-                if not url.startswith("https://news.yahoo.co.jp/articles/"):
+                if not url.startswith(f"{YAHOO_NEWS_BASE_URL}/articles/"):
                     continue
 
                 # --- タイトル、発行元、時間を取得 ---
@@ -203,33 +448,31 @@ def get_yahoo_news_search_results(keyword):
                             source = source_tag.text.strip()
 
                 # タイトルを探す (動的クラス名 `sc-` に依存しない方法)
-                # 'newsFeed_item_body' の中にある 'a' タグの 'div' でクラス名が 'sc-' で始まるものを探す
-                title_text_tag = body_tag.find("div", class_=re.compile(r"^sc-3ls169-0")) # 暫定的な目印
-                
-                if not title_text_tag:
-                    # 'sc-' で始まるクラスを持つ div を全て探し、その中のテキストを結合する (堅牢性を高める)
-                    title_divs = body_tag.select("div[class*='sc-']")
-                    if title_divs:
-                        # 最初の 'sc-' クラスの div をタイトルとする
-                        title = title_divs[0].get_text(strip=True)
-
-                if title_text_tag and title == "（タイトル取得失敗）":
-                        title = title_text_tag.get_text(strip=True)
-
-                # <em> タグ内のテキストも取得（キーワードがハイライトされている場合）
-                if title == "（タイトル取得失敗）" and title_tag.find("div", class_=re.compile(r"newsFeed_item_title")):
-                     title = title_tag.find("div", class_=re.compile(r"newsFeed_item_title")).get_text(strip=True)
-                
-                if title == "（タイトル取得失敗）":
+                def tag_text(tag):
+                    return tag.get_text(strip=True) if tag else ""
+
+                title = profile.run("search_title", [
+                    # 'newsFeed_item_body' の中にある 'a' タグの 'div' でクラス名が 'sc-' で始まるものを探す
+                    ("sc-3ls169-0", lambda: tag_text(body_tag.find("div", class_=re.compile(r"^sc-3ls169-0")))), # 暫定的な目印
+                    # 'sc-' で始まるクラスを持つ最初の div をタイトルとする (堅牢性を高める)
+                    ("div[class*=sc-]", lambda: tag_text(body_tag.select_one("div[class*='sc-']"))),
+                    # <em> タグ内のテキストも取得（キーワードがハイライトされている場合）
+                    ("newsFeed_item_title", lambda: tag_text(title_tag.find("div", class_=re.compile(r"newsFeed_item_title")))),
                     # 最終手段
-                    title = title_tag.get_text(strip=True).split("\n")[0]
+                    ("link_text", lambda: title_tag.get_text(strip=True).split("\n")[0]),
+                ], fallbacks=("div[class*=sc-]", "link_text")) or title
+
 
+                # スニペット (本文の抜粋)。キーワードの割り当てに使う
+                snippet_tag = body_tag.find("p", class_=re.compile(r"newsFeed_item_snippet")) or body_tag.find("p")
+                snippet = snippet_tag.get_text(strip=True) if snippet_tag else ""
 
                 results.append({
                     "title": title,
                     "url": url,
                     "source": source,
                     "post_time_str": post_time_str,
+                    "snippet": snippet,
                     "keyword": keyword
                 })
 
@@ -249,6 +492,82 @@ def get_yahoo_news_search_results(keyword):
         return []
 
 
+def search_keyword_group(keywords, report):
+    """
+    キーワードのグループを OR クエリで検索し、各記事をタイトル・スニペットに含まれる最初のキーワードに割り当てる
+    (keyword 列はキーワードごとに検索した場合と同じく 1 つのキーワード)。
+    検索リクエストはキーワードごとに検索した場合の回数 (グループのキーワード数) を超えないようにする。
+    OR クエリの結果は、どのキーワードにも 1 ページ分 (キーワード単体で検索した場合の件数) が割り当たるまで
+    ページを送る (これまでの割り当ての割合で、残りの回数のうちに届く見込みがある間だけ)。
+    1 ページ分に満たなかったキーワードは、残りの回数の範囲でキーワード単体で検索し直す。
+    キーワードを特定できなかった記事は追加しない。
+    """
+    if len(keywords) == 1:
+        report.requests += 1
+        return get_yahoo_news_search_results(keywords[0])
+
+    query = search_planner.build_query(keywords)
+    budget = len(keywords)
+    max_pages = min(SEARCH_OR_MAX_PAGES or budget, budget)
+    results = {}
+    counts = {keyword: 0 for keyword in keywords}
+    page_size = 0
+    pages = 0
+    truncated = True
+    while pages < max_pages:
+        pages += 1
+        report.requests += 1
+        report.combined_requests += 1
+        combined = get_yahoo_news_search_results(keywords[0], query=query, start=(pages - 1) * page_size + 1)
+        page_size = SEARCH_PAGE_SIZE or page_size or len(combined)
+        new_urls = 0
+        for article in combined:
+            if article["url"] in results:
+                continue
+            new_urls += 1
+            article_keywords = search_planner.match_keywords(f"{article['title']} {article['snippet']}", keywords)
+            if not article_keywords:
+                report.unattributed += 1
+                results[article["url"]] = None
+                continue
+            counts[article_keywords[0]] += 1
+            results[article["url"]] = dict(article, keyword=article_keywords[0])
+        # 1 ページ分より短いページ・新しい記事の無いページで結果は尽きている
+        truncated = bool(page_size) and len(combined) >= page_size and new_urls > 0
+        short = [keyword for keyword in keywords if counts[keyword] < page_size]
+        if not truncated or not short:
+            break
+        # これまでの割り当ての割合で、足りないキーワードが 1 ページ分に届くまでのページ数が残りの回数を超えるなら、
+        # ページ送りを打ち切って単体で検索する
+        needed = max(
+            math.ceil((page_size - counts[keyword]) * pages / counts[keyword]) if counts[keyword] else budget
+            for keyword in short
+        )
+        if needed > budget - pages:
+            break
+
+    # OR クエリで取得できなかった場合と、結果が残っているのに 1 ページ分に満たなかったキーワードは単体で検索する
+    # (割り当たった件数の少ないキーワードから、残りの回数の範囲で)
+    retry = sorted(
+        (keyword for keyword in keywords if not page_size or (truncated and counts[keyword] < page_size)),
+        key=lambda keyword: counts[keyword],
+    )
+    skipped = retry[budget - pages:]
+    retry = retry[:budget - pages]
+    if retry:
+        print(f"  - OR クエリの結果で件数が足りなかったキーワードを単体で検索します: {', '.join(retry)}")
+    if skipped:
+        print(f"  - 検索回数の上限に達したため、OR クエリの結果だけを使うキーワード: {', '.join(skipped)}")
+    for keyword in retry:
+        report.requests += 1
+        report.fallback_requests += 1
+        for article in get_yahoo_news_search_results(keyword):
+            if not results.get(article["url"]):
+                results[article["url"]] = article
+
+    return [article for article in results.values() if article]
+
+
 def parse_relative_time(time_str):
     """
     Yahoo!ニュースの相対時間（例: '1時間前', '11/11(月) 10:00'）を
@@ -297,111 +616,163 @@ def parse_relative_time(time_str):
     return None
 
 
+def get_parse_pool():
+    """
+    HTML 解析用のプール (html_parse.ParsePool) を返す。最初の呼び出しで作成する。
+    """
+    global parse_pool
+    if parse_pool is None:
+        parse_pool = html_parse.ParsePool()
+    return parse_pool
+
+
+def get_selector_profile():
+    """
+    セレクタプロファイル (selector_cache.SelectorProfile) を返す。最初の呼び出しで SELECTOR_PROFILE_FILE から読み込む。
+    """
+    global selector_profile
+    if selector_profile is None:
+        selector_profile = selector_cache.SelectorProfile(SELECTOR_PROFILE_FILE)
+    return selector_profile
+
+
+def record_selectors(parsed):
+    """
+    解析プールで解析した結果の "selectors" (試したセレクタ) をセレクタプロファイルに記録する。
+    """
+    for cascade, trace in parsed.get("selectors", {}).items():
+        get_selector_profile().record(cascade, trace)
+
+
+def report_selectors():
+    """
+    セレクタプロファイルを保存し、カスケードごとのヒット・ミスと、ミス率が高い場合の警告を表示する。
+    """
+    if selector_profile is None or not selector_profile.stats:
+        return
+    print("\n===== 🧭 セレクタのヒット率 =====")
+    for line in selector_profile.summary_lines():
+        print(f"  - {line}")
+    for message in selector_profile.alerts(SELECTOR_MISS_ALERT):
+        print(f"  ⚠️ {message}")
+    try:
+        selector_profile.save()
+    except OSError as e:
+        print(f"  ⚠️ セレクタプロファイル ({selector_profile.path}) を保存できませんでした: {e}")
+
+
 # --- (修正箇所) ---
 # 記事本文ページのHTML構造変更に対応
-def get_article_details(article_url):
+def fetch_article_details(article_urls, stop=None):
     """
-    記事URLから本文（最大10ページ）、コメント数、正確な投稿日時を取得する。
+    複数の記事URLから、それぞれの本文（最大10ページ）、コメント数、正確な投稿日時を取得する。
+    ページ番号ごとに、続きのある記事のページをまとめて取得し、まとめて解析プールで解析する。
+    {記事URL: (本文ページのリスト, コメント数, 投稿日時)} を返す。
+    stop() が True を返した時点で新しい記事の取得を始めない (取得を始めた記事は最後まで取得し、残りは結果に含めない)。
     """
+    import requests
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
-    
-    article_body_parts = []
-    comment_count = "0" # デフォルト
-    full_post_time = None # デフォルト
-
-    try:
-        # --- 1ページ目の取得 (コメント数と日時もここから取る) ---
-        response = requests.get(article_url, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # コメント数 (動的クラス名対応)
-        comment_count_tag = soup.find("a", class_=re.compile(r"CommentCount__CommentCountButton"), href=re.compile(r"/comments/"))
-        if not comment_count_tag:
-            # (フォールバック) sc-1n9vtw0-1 (コメントボタン)
-            comment_count_tag = soup.find("button", class_=re.compile(r"sc-1n9vtw0-1"))
-        
-        if comment_count_tag:
-            match = re.search(r"(\d+)", comment_count_tag.text)
-            if match:
-                comment_count = match.group(1)
-
-        # 正確な投稿日時
-        time_tag = soup.find("time")
-        if time_tag and time_tag.has_attr("datetime"):
-            try:
-                full_post_time = datetime.fromisoformat(time_tag["datetime"].replace("Z", "+00:00"))
-            except ValueError:
-                print(f"  - 日時パース失敗: {time_tag['datetime']}")
-                full_post_time = None
+    failed = ["（本文取得失敗）"] * 10, "0", None
 
-        # --- (修正) 記事本文 (1ページ目) ---
-        # 旧: class_=re.compile(r"ArticleBody")
-        # 新: class="article_body"
-        body_container = soup.find("div", class_="article_body")
-        
-        if body_container:
-            # 本文テキスト
-            body_text = body_container.get_text(separator="\n", strip=True)
-            article_body_parts.append(body_text)
-        else:
-            print(f"  - 記事本文(P1)が見つかりません (URL: {article_url})")
-            article_body_parts.append("（本文取得失敗）")
+    results = {}
+    article_body_parts = {}
+    active = list(dict.fromkeys(article_urls))
 
-
-        # --- 2ページ目以降の取得 (最大10ページ) ---
-        for page_num in range(2, 11): # 2〜10ページ
-            next_page_url = f"{article_url}?page={page_num}"
+    for page_num in range(1, 11): # 1〜10ページ
+        # --- 1. 続きのある記事の page_num ページ目を取得 ---
+        pages = []
+        for article_url in active:
+            if page_num == 1 and stop and stop():
+                break
+            page_url = article_url if page_num == 1 else f"{article_url}?page={page_num}"
+            # 待機は記事ごとに 1 回 (1ページ目の後に 3 秒) と、取得できた 2ページ目以降の後に 1 秒。
+            # 存在しないページ (404 など) の後は待たない
             try:
-                response_page = requests.get(next_page_url, headers=headers)
-                
-                if response_page.status_code != 200:
+                response = requests.get(page_url, headers=headers)
+                if page_num == 1:
+                    response.raise_for_status()
+                elif response.status_code != 200:
                     print(f"  - 記事本文 ページ {page_num} は存在しませんでした。本文取得を完了します。")
-                    break 
-                
-                soup_page = BeautifulSoup(response_page.text, "html.parser")
-                # --- (修正) 2ページ目以降の本文 ---
-                body_container_page = soup_page.find("div", class_="article_body")
-                
-                if body_container_page:
-                    body_text_page = body_container_page.get_text(separator="\n", strip=True)
-                    if body_text_page == article_body_parts[0]:
-                         print(f"  - 記事本文 ページ {page_num} は1ページ目と同じ内容のため終了します。")
-                         break
-                    
-                    print(f"  - 記事本文 ページ {page_num} を取得しました。")
-                    article_body_parts.append(body_text_page)
-                else:
-                    print(f"  - 記事本文 ページ {page_num} が見つかりませんでした。")
-                    break
-                
-                time.sleep(1) 
-
+                    continue
+                pages.append((article_url, response.text))
+                wait_interval(3 if page_num == 1 else 1)
             except requests.exceptions.RequestException as re_e:
-                if "404" in str(re_e):
-                    print(f"  ❌ ページなし (404 Client Error): {next_page_url}")
+                if page_num == 1:
+                    print(f"  ❌ 記事詳細ページ取得エラー (URL: {article_url}): {re_e}")
+                    results[article_url] = failed
+                    if "404" not in str(re_e):
+                        wait_interval(3)
+                elif "404" in str(re_e):
+                    print(f"  ❌ ページなし (404 Client Error): {page_url}")
                     print(f"  - 記事本文 ページ {page_num} は存在しませんでした。本文取得を完了します。")
                 else:
                     print(f"  ❌ ページ {page_num} 取得エラー: {re_e}")
-                break
-            except Exception as e_page:
-                print(f"  ❌ ページ {page_num} 処理エラー: {e_page}")
-                break
+                continue
 
-    except requests.exceptions.RequestException as re_e:
-        print(f"  ❌ 記事詳細ページ取得エラー (URL: {article_url}): {re_e}")
-        return ["（本文取得失敗）"] * 10, "0", None
-    except Exception as e:
-        print(f"  ❌ 記事詳細処理エラー (URL: {article_url}): {e}")
-        traceback.print_exc()
-        return ["（本文取得失敗）"] * 10, "0", None
+        # --- 2. 取得したページをまとめて解析 ---
+        parse_page = functools.partial(
+            html_parse.parse_article_page,
+            preferred=get_selector_profile().preferred_map(), first_page=page_num == 1,
+        )
+        parsed_pages = get_parse_pool().map(parse_page, [html for _, html in pages])
+
+        active = []
+        for (article_url, _), parsed in zip(pages, parsed_pages):
+            record_selectors(parsed)
+            if "error" in parsed:
+                if page_num == 1:
+                    print(f"  ❌ 記事詳細処理エラー (URL: {article_url}): {parsed['error']}")
+                    results[article_url] = failed
+                else:
+                    print(f"  ❌ ページ {page_num} 処理エラー: {parsed['error']}")
+                continue
 
-    if len(article_body_parts) < 10:
-        article_body_parts.extend(["-"] * (10 - len(article_body_parts)))
-    
-    return article_body_parts[:10], comment_count, full_post_time
+            if page_num == 1:
+                # コメント数と日時は1ページ目から取る
+                full_post_time = None
+                if parsed["post_time"]:
+                    try:
+                        full_post_time = datetime.fromisoformat(parsed["post_time"].replace("Z", "+00:00"))
+                    except ValueError:
+                        print(f"  - 日時パース失敗: {parsed['post_time']}")
+                results[article_url] = (None, parsed["comment_count"] or "0", full_post_time)
+
+                if parsed["body"] is None:
+                    print(f"  - 記事本文(P1)が見つかりません (URL: {article_url})")
+                article_body_parts[article_url] = [parsed["body"] or "（本文取得失敗）"]
+                active.append(article_url)
+                continue
+
+            body_text_page = parsed["body"]
+            if body_text_page is None:
+                print(f"  - 記事本文 ページ {page_num} が見つかりませんでした。")
+                continue
+            if body_text_page == article_body_parts[article_url][0]:
+                print(f"  - 記事本文 ページ {page_num} は1ページ目と同じ内容のため終了します。")
+                continue
+
+            print(f"  - 記事本文 ページ {page_num} を取得しました。")
+            article_body_parts[article_url].append(body_text_page)
+            active.append(article_url)
+
+        if not active:
+            break
+
+    for article_url, parts in article_body_parts.items():
+        if len(parts) < 10:
+            parts.extend(["-"] * (10 - len(parts)))
+        _, comment_count, full_post_time = results[article_url]
+        results[article_url] = (parts[:10], comment_count, full_post_time)
+    return results
+
+
+def get_article_details(article_url):
+    """
+    記事URLから本文（最大10ページ）、コメント数、正確な投稿日時を取得する。
+    """
+    return fetch_article_details([article_url])[article_url]
 
 
 def load_prompts():
@@ -434,235 +805,419 @@ def load_prompts():
 def initialize_gemini():
     """
     Gemini API を初期化する。
+    GEMINI_FAST_MODEL を指定した場合は、短い記事を分析するモデルも用意する。
     """
-    global gemini_model
+    global gemini_model, gemini_fast_model
     try:
         api_key = os.environ.get("GOOGLE_API_KEY")
         if not api_key:
             print("  ❌ 警告: 環境変数 'GOOGLE_API_KEY' が設定されていません。")
             return
 
+        import google.generativeai as genai
+
         if hasattr(genai, "configure"):
              genai.configure(api_key=api_key)
         else:
              print("  ⚠️ 警告: genai.configure が見つかりません。APIキーの手動設定を試みます。")
              pass 
         
-        model = genai.GenerativeModel('gemini-pro')
-        
-        if not hasattr(genai, "configure"):
-            model = genai.GenerativeModel('gemini-pro', api_key=api_key)
-
-        gemini_model = model
-        print("✅ Geminiクライアントの初期化に成功しました。 (model: gemini-pro)")
+        def create_model(model_name):
+            if not hasattr(genai, "configure"):
+                return genai.GenerativeModel(model_name, api_key=api_key)
+            return genai.GenerativeModel(model_name)
+
+        gemini_model = create_model(GEMINI_MODEL)
+        gemini_fast_model = create_model(GEMINI_FAST_MODEL) if GEMINI_FAST_MODEL else None
+        route_stats.models = {
+            "strong": GEMINI_MODEL, "fast": GEMINI_FAST_MODEL or GEMINI_MODEL, "confirm": GEMINI_FAST_MODEL or GEMINI_MODEL,
+        }
+        if gemini_fast_model:
+            print(f"✅ Geminiクライアントの初期化に成功しました。 (model: {GEMINI_MODEL} / 短い記事: {GEMINI_FAST_MODEL or '振り分けなし'})")
+        else:
+            print(f"✅ Geminiクライアントの初期化に成功しました。 (model: {GEMINI_MODEL})")
 
     except Exception as e:
         print(f"  ❌ 警告: Geminiクライアントの初期化に失敗しました。Gemini分析はスキップされます。エラー: {e}")
         traceback.print_exc()
         gemini_model = None
+        gemini_fast_model = None
+
+
+# 判定ルールの前に添える注意書き (他のキーの判定結果に依存するもの)
+ANALYSIS_RULE_NOTES = {
+    "nissan_mention": "(注: company_infoが「日産」*以外*の場合のみ、本文中の「日産」への言及を確認せよ)",
+    "nissan_sentiment": "(注: nissan_mentionが「-」*以外*の場合のみ、その言及が日産にとってポジティブ/ネガティブ/ニュートラルか判定せよ)",
+}
 
 
-def analyze_article_with_gemini(article_body):
+def build_analysis_prompt(article_body, keys, known=None):
     """
-    記事本文を受け取り、Gemini API で分析する。
+    記事本文と keys の判定ルールから Gemini へのプロンプトを作る。
+    known (判定済みの値) を渡すと、再問い合わせ用に参考情報として添える。
     """
-    if not gemini_model:
-        return {
-            "sentiment": "N/A", "category": "N/A", "company_info": "N/A",
-            "nissan_mention": "N/A", "nissan_sentiment": "N/A"
-        }
-
-    max_length = 10000
-    if len(article_body) > max_length:
-        article_body = article_body[:max_length]
+    tasks = []
+    for number, key in enumerate(keys, 1):
+        note = ANALYSIS_RULE_NOTES.get(key)
+        rule = PROMPTS.get(key, f"（{key}ルール）")
+        tasks.append(f"{number}. **{key}の判定**:\n" + (f"{note}\n" if note else "") + rule)
+
+    key_names = "「" + "」「".join(keys) + "」"
+    output_format = "{\n" + ",\n".join(
+        f'  "{key}": "（{number}の判定結果）"' for number, key in enumerate(keys, 1)
+    ) + "\n}"
+    known_text = ""
+    if known:
+        known_text = f"""
+【判定済みの値 (参考)】
+{json.dumps(known, ensure_ascii=False, indent=2)}
+"""
 
-    full_prompt = f"""
+    tasks_text = "\n\n".join(tasks)
+    return f"""
 {PROMPTS.get("role", "あなたは業界アナリストです。")}
 
 【記事本文】
 {article_body}
 【記事本文ここまで】
-
+{known_text}
 ---
 【タスク】
 記事本文を分析し、以下のタスクを実行してください。
-結果は必ず指定されたJSONフォーマットで、キー「sentiment」「category」「company_info」「nissan_mention」「nissan_sentiment」を持つ単一のJSONオブジェクトとして出力してください。
+結果は必ず指定されたJSONフォーマットで、キー{key_names}を持つ単一のJSONオブジェクトとして出力してください。
 
-1. **sentimentの判定**:
-{PROMPTS.get("sentiment", "（sentimentルール）")}
+{tasks_text}
 
-2. **categoryの判定**:
-{PROMPTS.get("category", "（categoryルール）")}
+---
+【出力フォーマット (JSON)】
+{output_format}
+"""
 
-3. **company_infoの判定**:
-{PROMPTS.get("company_info", "（company_infoルール）")}
 
-4. **nissan_mentionの判定**:
-(注: company_infoが「日産」*以外*の場合のみ、本文中の「日産」への言及を確認せよ)
-{PROMPTS.get("nissan_mention", "（nissan_mentionルール）")}
+def route_article(article_body):
+    """
+    本文の長さと登場するメーカーの種類数から、分析するモデルの振り分け先 ("fast" / "strong") を決める。
+    短い記事用のモデルが無い場合は常に "strong"。
+    """
+    if gemini_fast_model is None:
+        return "strong"
+    features = model_router.article_features(article_body)
+    return model_router.choose_route(features, GEMINI_ROUTE_MAX_CHARS, GEMINI_ROUTE_MAX_MAKERS)
 
-5. **nissan_sentimentの判定**:
-(注: nissan_mentionが「-」*以外*の場合のみ、その言及が日産にとってポジティブ/ネガティブ/ニュートラルか判定せよ)
-{PROMPTS.get("nissan_sentiment", "（nissan_sentimentルール）")}
 
----
-【出力フォーマット (JSON)】
-{{
-  "sentiment": "（1の判定結果）",
-  "category": "（2の判定結果）",
-  "company_info": "（3の判定結果）",
-  "nissan_mention": "（4の判定結果）",
-  "nissan_sentiment": "（5の判定結果）"
-}}
-"""
+def model_for_route(route):
+    # 同じストーリーの記事の確認 ("confirm") も速いモデルで行う
+    return gemini_fast_model if route in ("fast", "confirm") and gemini_fast_model is not None else gemini_model
 
-    try:
-        response = gemini_model.generate_content(full_prompt)
-        
-        json_match = re.search(r"\{.*\}", response.text, re.DOTALL)
-        
-        if not json_match:
-            print("  ❌ Gemini応答からJSONを抽出できませんでした。")
-            print(f"  応答: {response.text}")
-            return {
-                "sentiment": "N/A", "category": "N/A", "company_info": "N/A",
-                "nissan_mention": "N/A", "nissan_sentiment": "N/A"
-            }
 
-        json_str = json_match.group(0)
-        result = json.loads(json_str)
-        
-        required_keys = ["sentiment", "category", "company_info", "nissan_mention", "nissan_sentiment"]
-        if not all(key in result for key in required_keys):
-             print(f"  ❌ Gemini応答JSONに必要なキーが不足しています。 {result.keys()}")
-             for key in required_keys:
-                 if key not in result:
-                     result[key] = "N/A (キー欠損)"
-
-        return result
-
-    except json.JSONDecodeError as e:
-        print(f"  ❌ Gemini応答のJSONパースに失敗しました: {e}")
-        print(f"  応答テキスト (JSON抽出後): {json_str}")
-        return {
-            "sentiment": "N/A", "category": "N/A", "company_info": "N/A",
-            "nissan_mention": "N/A", "nissan_sentiment": "N/A"
+def generate_analysis_json(prompt, keys, route="strong"):
+    """
+    Gemini を呼び出し、応答から JSON オブジェクトを取り出して返す。取り出せなければ None。
+    GEMINI_STRUCTURED_OUTPUT が有効な場合は keys のスキーマ (sentiment / category は選択肢) で応答を制約する。
+    route の振り分け先のモデルを使い、所要時間とトークン数を route_stats に記録する。
+    """
+    model = model_for_route(route)
+    model_name = getattr(model, "model_name", route)
+    kwargs = {}
+    if GEMINI_STRUCTURED_OUTPUT and model_name not in unstructured_models:
+        kwargs["generation_config"] = {
+            "response_mime_type": "application/json",
+            "response_schema": gemini_output.response_schema(keys),
         }
-    except GoogleAPIError as e:
+    start = time.perf_counter()
+    try:
+        response = model.generate_content(prompt, **kwargs)
+    except google_api_exceptions().InvalidArgument as e:
+        if not kwargs:
+            raise
+        print(f"  ⚠️ モデル {model_name} が JSON スキーマ指定に対応していないため、このモデルはテキスト出力に切り替えます: {e}")
+        unstructured_models.add(model_name)
+        response = model.generate_content(prompt)
+    route_stats.record(route, time.perf_counter() - start, *model_router.usage_tokens(response, prompt))
+
+    result = gemini_output.parse_json_object(response.text)
+    if result is None:
+        print("  ❌ Gemini応答からJSONを抽出できませんでした。")
+        print(f"  応答: {response.text}")
+    return result
+
+
+def analyze_article_with_gemini(article_body, route="strong"):
+    """
+    記事本文を受け取り、Gemini API で分析する (route は route_article で決めた振り分け先)。
+    一部のキーだけが不足・不正だった場合は、そのキーだけを再問い合わせする (最大 GEMINI_REPAIR_ATTEMPTS 回)。
+    """
+    failed_result = {key: "N/A" for key in gemini_output.ANALYSIS_KEYS}
+    if not gemini_model:
+        return failed_result
+    route_stats.count_article(route)
+
+    max_length = 10000
+    if len(article_body) > max_length:
+        article_body = article_body[:max_length]
+
+    try:
+        result = generate_analysis_json(
+            build_analysis_prompt(article_body, gemini_output.ANALYSIS_KEYS), gemini_output.ANALYSIS_KEYS, route,
+        )
+        if result is None:
+            return failed_result
+
+        fields, invalid = gemini_output.validate_analysis(result)
+        if not fields:
+            print(f"  ❌ Gemini応答JSONに有効なキーがありません。 {result}")
+            return failed_result
+
+        attempt = 0
+        while invalid and attempt < GEMINI_REPAIR_ATTEMPTS:
+            attempt += 1
+            print(f"  ⚠️ 不足・不正なキー {invalid} だけを再問い合わせします ({attempt}/{GEMINI_REPAIR_ATTEMPTS})")
+            repaired = generate_analysis_json(build_analysis_prompt(article_body, invalid, known=fields), invalid, route)
+            if repaired is not None:
+                repaired_fields, _ = gemini_output.validate_analysis(repaired, invalid)
+                fields.update(repaired_fields)
+            invalid = [key for key in gemini_output.ANALYSIS_KEYS if key not in fields]
+
+        if invalid:
+            print(f"  ❌ Gemini応答JSONに必要なキーが不足しています。 {invalid}")
+            for key in invalid:
+                fields[key] = "N/A (キー欠損)"
+
+        return {key: fields[key] for key in gemini_output.ANALYSIS_KEYS}
+
+    except google_api_exceptions().GoogleAPIError as e:
         print(f"  ❌ Gemini API エラー: {e}")
-        return {
-            "sentiment": "N/A", "category": "N/A", "company_info": "N/A",
-            "nissan_mention": "N/A", "nissan_sentiment": "N/A"
-        }
+        return failed_result
     except Exception as e:
         print(f"  ❌ Gemini分析中に予期せぬエラー: {e}")
         traceback.print_exc()
-        return {
-            "sentiment": "N/A", "category": "N/A", "company_info": "N/A",
-            "nissan_mention": "N/A", "nissan_sentiment": "N/A"
-        }
+        return failed_result
+
+
+def build_confirm_prompt(title, article_lead, reference):
+    """
+    同じストーリーの代表記事の分析結果 reference を、この記事 (タイトルと本文の冒頭) で確認させるプロンプトを作る。
+    判定ルールは添えず、代表記事と異なるキーだけを判定し直させる。
+    """
+    keys = gemini_output.ANALYSIS_KEYS
+    key_names = "「" + "」「".join(keys) + "」"
+    return f"""
+{PROMPTS.get("role", "あなたは業界アナリストです。")}
+
+【代表記事の分析結果】
+{json.dumps({key: reference[key] for key in keys}, ensure_ascii=False, indent=2)}
+
+【この記事】
+タイトル: {title}
+本文 (冒頭): {article_lead}
+【この記事ここまで】
+---
+【タスク】
+この記事は、代表記事と同じ出来事を扱った記事です。代表記事の分析結果がこの記事にも当てはまるかを確認してください。
+当てはまるキーは代表記事と同じ値を、当てはまらないキー (中心となる会社が違う、論調が違うなど) はこの記事に合わせて判定し直した値を、
+キー{key_names}を持つ単一のJSONオブジェクトとして出力してください。
+"""
+
+
+def confirm_story_analysis(title, article_body, reference):
+    """
+    同じストーリーの代表記事の分析結果 reference が、この記事にも当てはまるかを Gemini (速いモデル) で確認する。
+    (分析結果, 代表記事と異なる値になったキーの一覧) を返す。応答の一部のキーが不正なら、そのキーは代表記事の値を使う。
+    呼び出しに失敗した・有効なキーが 1 つも無い場合は、通常の分析の失敗と同じ N/A の結果 (次回に再分析される) と None を返す。
+    """
+    failed_result = {key: "N/A" for key in gemini_output.ANALYSIS_KEYS}
+    route_stats.count_article("confirm")
+    result = None
+    try:
+        result = generate_analysis_json(
+            build_confirm_prompt(title, article_body[:STORY_CONFIRM_CHARS], reference),
+            gemini_output.ANALYSIS_KEYS, "confirm",
+        )
+    except google_api_exceptions().GoogleAPIError as e:
+        print(f"  ❌ Gemini API エラー: {e}")
+        return failed_result, None
+    except Exception as e:
+        print(f"  ❌ 代表記事の結果の確認中に予期せぬエラー: {e}")
+        traceback.print_exc()
+        return failed_result, None
+
+    fields, _ = gemini_output.validate_analysis(result or {})
+    if not fields:
+        print(f"  ❌ 確認の応答に有効なキーがありません。次回に再分析します。 {result}")
+        return failed_result, None
+    analysis_result = {key: fields.get(key, reference[key]) for key in gemini_output.ANALYSIS_KEYS}
+    overridden = [key for key in gemini_output.ANALYSIS_KEYS if analysis_result[key] != reference[key]]
+    return analysis_result, overridden
 
 
 # --- (修正箇所) ---
 # コメント欄のHTML構造変更（動的クラス名）に対応
-def get_yahoo_news_comments(article_id, article_url):
+def fetch_comments(article_urls, stop=None):
     """
-    記事IDと記事URLを受け取り、コメントページの1〜3ページ目までをスクレイピングする。
-    (動的な `sc-` クラス名に対応)
+    複数の記事のコメントページの1〜3ページ目までをスクレイピングし、{記事URL: コメント10件のリスト} を返す。
+    ページ番号ごとに、続きのある記事のページをまとめて取得し、まとめて解析プールで解析する。
+    stop() が True を返した時点で新しい記事の取得を始めない (残りの記事は結果に含めない)。
     """
-    print(f"    - コメント本文 (S列～AC列) を取得中...")
-    comments_data = []
+    import requests
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
+    comments_data = {}
+    active = list(dict.fromkeys(article_urls))
 
-    try:
-        base_comments_url = f"{article_url}/comments"
-        
-        for page_num in range(1, 4): # 1ページから3ページまで
+    for page_num in range(1, 4): # 1ページから3ページまで
+        # --- 1. 続きのある記事のコメントページを取得 ---
+        pages = []
+        for article_url in active:
             if page_num == 1:
-                comments_url = base_comments_url
-            else:
-                comments_url = f"{base_comments_url}?page={page_num}"
-
-            response = requests.get(comments_url, headers=headers)
-            
+                if stop and stop():
+                    break
+                comments_data[article_url] = []
+            base_comments_url = f"{article_url}/comments"
+            comments_url = base_comments_url if page_num == 1 else f"{base_comments_url}?page={page_num}"
+            try:
+                response = requests.get(comments_url, headers=headers)
+            except requests.exceptions.RequestException as e:
+                print(f"    ❌ コメント取得エラー: {e}")
+                continue
             if response.status_code != 200:
                 print(f"    ❌ コメント ページ {page_num} ( {comments_url} ) が存在しないか取得失敗。ステータス: {response.status_code}")
-                break 
-
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            # --- (修正) 動的クラス名対応 ---
-            # 1. コメント欄のメインコンテナを探す
-            comment_main = soup.find("article", id="comment-main")
-            if not comment_main:
-                 print(f"    - コメント ページ {page_num} に 'comment-main' コンテナが見つかりません。")
-                 break
-
-            # 2. コンテナ内の全 <article> タグ (これが各コメント) を探す
-            #    (専門家コメント `sc-z8tf0-1`、一般コメント `sc-169yn8p-3` に対応)
-            comments = comment_main.find_all("article", class_=re.compile(r"sc-"))
-            
-            if not comments:
-                # print(f"    - コメント ページ {page_num} にコメントが見つかりませんでした。")
-                break 
+                continue
+            pages.append((article_url, response.text))
+            # 取得できたコメントページの後だけ 1 秒待つ (記事ごとの 3 秒は本文の取得で待つ)
+            wait_interval(1)
 
-            for comment in comments:
-                user_name = "ユーザー名不明"
-                comment_text = "コメント本文なし"
-                
-                # 3. ユーザー名 (h2 タグ) を探す
-                user_name_tag = comment.find("h2")
-                if user_name_tag:
-                    user_name = user_name_tag.get_text(strip=True)
-
-                # 4. コメント本文 (p タグ) を探す
-                #    (専門家 `sc-z8tf0-11`、一般 `sc-169yn8p-10` に対応する p タグ)
-                comment_text_tag = comment.find("p", class_=re.compile(r"sc-.*-\d{1,2}$"))
-                
-                if comment_text_tag:
-                    comment_text = comment_text_tag.get_text(strip=True)
+        # --- 2. 取得したページをまとめて解析 ---
+        parsed_pages = get_parse_pool().map(html_parse.parse_comments_page, [html for _, html in pages])
 
-                comments_data.append(f"【{user_name}】{comment_text}")
+        active = []
+        for (article_url, _), parsed in zip(pages, parsed_pages):
+            if "error" in parsed:
+                print(f"    ❌ コメント取得エラー: {parsed['error']}")
+                continue
+            if parsed["comments"] is None:
+                print(f"    - コメント ページ {page_num} に 'comment-main' コンテナが見つかりません。")
+                continue
+            if not parsed["comments"]:
+                continue
 
-                if len(comments_data) >= 10: # 10件取得したら終了
+            collected = comments_data[article_url]
+            for user_name, comment_text in parsed["comments"]:
+                collected.append(f"【{user_name}】{comment_text}")
+                if len(collected) >= 10: # 10件取得したら終了
                     break
-            
-            if len(comments_data) >= 10:
-                break
-            
-            time.sleep(1) 
+            if len(collected) < 10:
+                active.append(article_url)
 
-        if not comments_data:
+        if not active:
+            break
+
+    results = {}
+    for article_url, collected in comments_data.items():
+        if not collected:
             print(f"    - コメントが1件も見つかりませんでした（またはコメント欄閉鎖）。")
-            return ["取得不可"] * 10
+            results[article_url] = ["取得不可"] * 10
+            continue
+        if len(collected) < 10:
+            collected.extend(["-"] * (10 - len(collected)))
+        results[article_url] = collected[:10]
+    return results
 
-        if len(comments_data) < 10:
-            comments_data.extend(["-"] * (10 - len(comments_data)))
 
+def get_yahoo_news_comments(article_id, article_url):
+    """
+    記事IDと記事URLを受け取り、コメントページの1〜3ページ目までをスクレイピングする。
+    """
+    print(f"    - コメント本文 (S列～AC列) を取得中...")
+    comments_data = fetch_comments([article_url])[article_url]
+    if comments_data[0] != "取得不可":
         print(f"    ✅ コメント {len(comments_data)} 件を取得しました。")
-        return comments_data[:10]
-
-    except Exception as e:
-        print(f"    ❌ コメント取得エラー: {e}")
-        traceback.print_exc()
-        return ["取得不可"] * 10
+    return comments_data
 # --- (修正ここまで) ---
 
 
-def update_source_sheet(ws, new_articles, existing_urls):
+def is_flagged(value):
     """
-    SOURCE ワークシートを更新する。
-    1. 新しい記事をフィルタリング
-    2. 新しい記事をシートに追加 (A-E列)
-    3. analysis_flag が "TRUE" かつ 本文が空の記事 (F-AC列) を更新
+    analysis_flag 列が "TRUE" (または "1") かどうか。
+    """
+    return value.upper() == "TRUE" or value == "1"
+
+
+def needs_details(row):
+    """
+    本文を取得する行か (analysis_flag が立っていて、本文が空か取得失敗)。
+    """
+    body_p1 = row["body_p1"]
+    return is_flagged(row["analysis_flag"]) and (not body_p1 or body_p1 == "（本文取得失敗）")
+
+
+def needs_analysis(row):
+    """
+    Gemini で分析する行か (analysis_flag が立っていて、未分析)。
+    """
+    sentiment = row["sentiment"]
+    return is_flagged(row["analysis_flag"]) and (not sentiment or sentiment == "N/A")
+
+
+def count_backlog(store):
+    """
+    担当する行のうち、本文未取得の行数と未分析の行数を返す (時間配分の見込みに使う)。
+    判定に必要な列だけを 1 回読み込む。
+    """
+    pending_details = pending_analysis = 0
+    for _, row in store.select(["analysis_flag", "body_p1", "sentiment"] + shard_where_columns(), in_shard):
+        pending_details += needs_details(row)
+        pending_analysis += needs_analysis(row)
+    return pending_details, pending_analysis
+
+
+def in_shard(row):
+    """
+    行をこのワーカーが担当するか (分担しない場合は常に True)。
+    """
+    return shard is None or shard.owns(row, search_planner.primary_keyword)
+
+
+def shard_where_columns():
+    """
+    in_shard の判定に必要な列 (store.select の where_columns に加える)。
+    """
+    return shard.where_columns() if shard else []
+
+
+def acquire_leases(kind, items, url_of=lambda item: item[1]["URL"]):
+    """
+    items のうち、'<kind>:<記事ID>' のリースを取れたものだけを返す (リースを使わない場合はそのまま返す)。
+    リースは処理後も解放せず、有効期限 (LEASE_TTL) まで他のワーカーが同じ行を処理しないようにする。
+    """
+    if lease_store is None or not items:
+        return items
+    keys = [f"{kind}:{storage.article_key(url_of(item))}" for item in items]
+    acquired = lease_store.acquire(keys, WORKER_ID, LEASE_TTL)
+    taken = [item for item, key in zip(items, keys) if key in acquired]
+    if len(taken) < len(items):
+        print(f"  - 他のワーカーが処理中の {len(items) - len(taken)} 件をスキップします。")
+    return taken
+
+
+def release_leases(kind, items, url_of=lambda item: item[1]["URL"]):
+    """
+    時間切れで処理しなかった items のリースを解放し、次の実行 (や他のワーカー) がすぐに処理できるようにする。
+    """
+    if lease_store is None or not items:
+        return
+    lease_store.release([f"{kind}:{storage.article_key(url_of(item))}" for item in items], WORKER_ID)
+
+
+def append_new_articles(store, new_articles, existing_ids):
+    """
+    検索結果のうち、まだ保存されていない記事を追加する (keyword〜analysis_flag 列)。
+    追加した記事のIDは existing_ids にも加える。追加した件数を返す。
     """
-    
-    # --- 1. 新しい記事をフィルタリング ---
     articles_to_add = []
     for article in new_articles:
-        if article["url"] not in existing_urls:
+        article_id = storage.article_key(article["url"])
+        if article_id not in existing_ids:
             
             post_time = parse_relative_time(article["post_time_str"])
             if post_time:
@@ -670,115 +1225,251 @@ def update_source_sheet(ws, new_articles, existing_urls):
             else:
                 post_time_formatted = article["post_time_str"] 
 
-            row_data = [
-                article["keyword"],
-                article["url"],
-                post_time_formatted,
-                article["source"],
-                article["title"],
-                "TRUE" # F列: analysis_flag
-            ]
-            articles_to_add.append(row_data)
-            existing_urls.add(article["url"])
-
-    # --- 2. 新しい記事をシートに追加 ---
+            articles_to_add.append({
+                "keyword": article["keyword"],
+                "URL": article["url"],
+                "post_time_str": post_time_formatted,
+                "source": article["source"],
+                "title": article["title"],
+                "analysis_flag": "TRUE",
+            })
+            existing_ids.add(article_id)
+
+    # 別のワーカーが同じ記事を同時に追加しないよう、追加する記事のリースを取る
+    articles_to_add = acquire_leases("append", articles_to_add, url_of=lambda record: record["URL"])
     if articles_to_add:
         try:
-            ws.append_rows(articles_to_add, value_input_option="USER_ENTERED")
-            print(f"  ✅ {len(articles_to_add)} 件の新しい記事を SOURCEシート に追加しました。")
+            added = store.append(articles_to_add)
+            print(f"  ✅ {added} 件の新しい記事を {store.name} に追加しました。")
+            return added
         except Exception as e:
-            print(f"  ❌ 新規記事のスプレッドシートへの書き込みに失敗しました: {e}")
+            print(f"  ❌ 新規記事の {store.name} への書き込みに失敗しました: {e}")
     else:
-        print("  SOURCEシートに追記すべき新しいデータはありません。")
+        print(f"  {store.name} に追記すべき新しいデータはありません。")
+    return 0
+
 
+BODY_COLUMNS = [f"body_p{page}" for page in range(1, 11)]
+COMMENT_COLUMNS = [f"comment_{n}" for n in range(1, 11)]
 
-    # --- 3. 本文・コメント等が未取得の記事を更新 ---
+
+def fetch_pending_details(store, with_comments=True, budget=None):
+    """
+    analysis_flag が "TRUE" かつ 本文が空の記事について、本文・コメント数・投稿日時を取得して書き込む。
+    with_comments=False の場合はコメント本文を取得しない (comments サブコマンドで後から取得する)。
+    budget (RunBudget) の配分時間を使い切ったら取得を打ち切り、取得済みの分だけを書き込む (残りは次回)。
+    """
+    label = "本文・コメント" if with_comments else "本文"
+    stage = None
+    updates = []
+    carried = []
     try:
-        print("  ... 本文・コメント未取得のデータをスプレッドシートから読み込み中 ...")
-        all_data = ws.get_all_values()
-        if len(all_data) <= 1:
-            print("  - データがありません。")
-            return 
-
-        headers = all_data[0]
-        data_rows = all_data[1:]
-        
-        # 列インデックスの特定 (0始まり)
-        try:
-            url_col = headers.index("URL") # B列
-            title_col = headers.index("title") # E列
-            flag_col = headers.index("analysis_flag") # F列
-            body_p1_col = headers.index("body_p1") # G列
-            comment_1_col = headers.index("comment_1") # S列
-        except ValueError as e:
-            print(f"  ❌ 必要な列が見つかりません: {e}。本文取得をスキップします。")
+        print(f"  ... {label}未取得のデータを {store.name} から読み込み中 ...")
+        missing = store.missing_columns(
+            ["title", "analysis_flag", "comment_count", "full_post_time", "body_pages", "body_hash"]
+            + BODY_COLUMNS + COMMENT_COLUMNS
+        )
+        if missing:
+            print(f"  ❌ 必要な列が見つかりません: {missing}。本文取得をスキップします。")
             return
 
-        batch_update_data = []
+        # 判定に必要な列 (analysis_flag, body_p1) だけを読み込み、対象の行だけタイトルを読み込む
+        pending_rows = list(store.select(
+            ["analysis_flag", "body_p1"] + shard_where_columns(),
+            lambda row: needs_details(row) and in_shard(row), columns=["title"],
+        ))
+        pending_rows = acquire_leases("fetch", pending_rows)
+        stage = (budget or RunBudget()).begin("fetch", len(pending_rows))
+        if not pending_rows:
+            print(f"  - {label}未取得のデータはありません。")
+            return
 
-        # 2行目から (インデックス 0 = 2行目)
-        for i, row in enumerate(data_rows):
-            row_index = i + 2 # 実際のシート上の行番号
-            
-            if len(row) <= max(flag_col, body_p1_col, url_col):
-                continue
-            
-            analysis_flag = row[flag_col]
-            body_p1 = row[body_p1_col]
-            
-            if (analysis_flag.upper() == "TRUE" or analysis_flag == "1") and \
-               (not body_p1 or body_p1 == "（本文取得失敗）"):
-                
-                title = row[title_col][:30] if len(row) > title_col else "（タイトル不明）"
-                print(f"  - 行 {row_index} (記事: {title}...): 本文(P1-P10)/コメント数/日時補完/コメント本文 を取得中... (完全取得)")
-                
-                article_url = row[url_col]
-                article_id_match = re.search(r"/articles/([a-f0-9]+)", article_url)
-                if not article_id_match:
-                    print(f"    - URLから記事IDが抽出できませんでした: {article_url}")
-                    continue
-                
-                article_id = article_id_match.group(1)
+        try:
+            # 締め切りがある場合は、残りの配分時間で取得できる見込みの件数ずつ取得する
+            start = 0
+            while start < len(pending_rows):
+                if stage.expired():
+                    carried.extend(pending_rows[start:])
+                    break
+                size = stage.batch_size(FETCH_BATCH_SIZE)
+                fetch_detail_batch(store, pending_rows[start:start + size], with_comments, stage, updates, carried)
+                start += size
+        finally:
+            # 打ち切り・中断 (SIGTERM など) の場合も、取得済みの分は書き込む
+            if updates:
+                print(f"  ... {len(updates)} 件の{label}データを {store.name} に一括書き込み中 ...")
+                store.update(updates)
+                print(f"  ✅ {label}データの一括書き込みが完了しました。")
+            if carried:
+                print(f"  ⏭️ {len(carried)} 件の{label}取得を次回に持ち越します。")
+                release_leases("fetch", carried)
 
-                article_body_parts, comment_count, full_post_time = get_article_details(article_url)
-                
-                # (修正済) get_yahoo_news_comments に article_url を渡す
-                comments_data = get_yahoo_news_comments(article_id, article_url)
-                
-                update_row_data = []
-                update_row_data.extend(article_body_parts) # G-P列 (10列)
-                update_row_data.append(comment_count) # Q列
-                
-                if full_post_time:
-                    jst = full_post_time.astimezone(timedelta(hours=9))
-                    update_row_data.append(jst.strftime("%Y/%m/%d %H:%M:%S"))
-                else:
-                    update_row_data.append("-") # R列
+    except Exception as e:
+        print(f"  ❌ {label}取得・書き込み処理中にエラー: {e}")
+        traceback.print_exc()
+    finally:
+        if stage:
+            stage.finish(len(updates), len(carried))
 
-                update_row_data.extend(comments_data) # S-AC列 (10列)
-                
-                # 更新範囲 (G列 から AC列 まで)
-                start_col_letter = gspread.utils.rowcol_to_a1(row_index, body_p1_col + 1)[0]
-                end_col_letter = gspread.utils.rowcol_to_a1(row_index, comment_1_col + 9)
-                end_col_letter = ''.join([c for c in end_col_letter if not c.isdigit()])
 
-                range_to_update = f"{start_col_letter}{row_index}:{end_col_letter}{row_index}"
-                
-                batch_update_data.append({
-                    'range': range_to_update,
-                    'values': [update_row_data]
-                })
+def fetch_detail_batch(store, rows, with_comments, stage, updates, carried):
+    """
+    fetch_pending_details の 1 まとまり (FETCH_BATCH_SIZE 件) の本文・コメントを取得し、書き込む内容を updates に加える。
+    配分時間を使い切って取得できなかった行は carried に加える。
+    """
+    batch = []
+    for key, row in rows:
+        title = row["title"][:30] if row["title"] else "（タイトル不明）"
+        if with_comments:
+            print(f"  - {store.label(key)} (記事: {title}...): 本文(P1-P10)/コメント数/日時補完/コメント本文 を取得中... (完全取得)")
+        else:
+            print(f"  - {store.label(key)} (記事: {title}...): 本文(P1-P10)/コメント数/日時補完 を取得中...")
+
+        article_url = row["URL"]
+        if not extract_article_id(article_url):
+            print(f"    - URLから記事IDが抽出できませんでした: {article_url}")
+            continue
+        batch.append((key, row))
+
+    # まとまりごとにページを取得し、HTML は解析プールでまとめて解析する
+    # (配分時間を使い切ったら、まだ本文の取得を始めていない記事は結果に含まれない。
+    #  本文を取得した記事は、本文とコメントを揃えて書き込むためコメントも最後まで取得する)
+    urls = [row["URL"] for _, row in batch]
+    details = fetch_article_details(urls, stop=stage.expired)
+    comments = fetch_comments([url for url in urls if url in details]) if with_comments else {}
+
+    for key, row in batch:
+        article_url = row["URL"]
+        if article_url not in details:
+            carried.append((key, row))
+            continue
+        article_body_parts, comment_count, full_post_time = details[article_url]
+
+        if full_post_time:
+            jst = full_post_time.astimezone(timezone(timedelta(hours=9)))
+            full_post_time_str = jst.strftime("%Y/%m/%d %H:%M:%S")
+        else:
+            full_post_time_str = "-"
+
+        # 本文 (body_p1〜body_p10 列)
+        values = {}
+        pages = [part for part in article_body_parts if part != "-"]
+        if BODY_STORE == "blob" and pages and pages[0] != "（本文取得失敗）":
+            # 本文全体はブロブストアに保存し、抜粋・ページ数・ハッシュだけを書く
+            values.update(blob_body_values(pages))
+        else:
+            values.update(zip(BODY_COLUMNS, article_body_parts))
 
-                time.sleep(3)
-        
-        if batch_update_data:
-            print(f"  ... {len(batch_update_data)} 件の本文/コメントデータをスプレッドシートに一括書き込み中 ...")
-            ws.batch_update(batch_update_data, value_input_option="USER_ENTERED")
-            print("  ✅ 本文/コメントデータの一括書き込みが完了しました。")
+        # コメント数・投稿日時・コメント本文
+        values["comment_count"] = comment_count
+        values["full_post_time"] = full_post_time_str
+        if with_comments:
+            values.update(zip(COMMENT_COLUMNS, comments[article_url]))
+
+        updates.append((key, values))
+
+
+def blob_body_values(pages):
+    """
+    本文のページをつなげてブロブストアに保存し、SOURCE に書き込む抜粋・ページ数・ハッシュの列を返す。
+    """
+    full_body = "\n".join(pages)
+    values = dict(zip(BODY_COLUMNS, [full_body[:BODY_EXCERPT_CHARS]] + ["-"] * 9))
+    values["body_pages"] = len(pages)
+    values["body_hash"] = blob_store.put_body(full_body)
+    return values
+
+
+def refetch_blob_body(article_url):
+    """
+    ブロブストアに本文が見つからなかった記事の本文を取得し直してブロブストアに保存し、
+    (本文, 書き込む本文の列) を返す。取得できなければ (None, {})。
+    """
+    details = fetch_article_details([article_url])
+    if article_url not in details:
+        return None, {}
+    pages = [part for part in details[article_url][0] if part != "-"]
+    if not pages or pages[0] == "（本文取得失敗）":
+        return None, {}
+    return "\n".join(pages), blob_body_values(pages)
+
+
+def fetch_pending_comments(store, budget=None):
+    """
+    本文は取得済みでコメント本文 (comment_1〜comment_10 列) が空の記事について、コメントを取得して書き込む。
+    (fetch サブコマンドで本文だけを取得した記事が対象)
+    budget (RunBudget) の配分時間を使い切ったら取得を打ち切り、取得済みの分だけを書き込む (残りは次回)。
+    """
+    stage = None
+    updates = []
+    carried = []
+    try:
+        print(f"  ... コメント未取得のデータを {store.name} から読み込み中 ...")
+        missing = store.missing_columns(["title", "analysis_flag", "body_p1"] + COMMENT_COLUMNS)
+        if missing:
+            print(f"  ❌ 必要な列が見つかりません: {missing}。コメント取得をスキップします。")
+            return
+
+        def needs_comments(row):
+            body_p1 = row["body_p1"]
+            return is_flagged(row["analysis_flag"]) and \
+                   body_p1 and body_p1 != "（本文取得失敗）" and not row["comment_1"]
+
+        # 判定に必要な列だけを読み込む (本文・コメント列は読まない)
+        pending_rows = list(store.select(
+            ["analysis_flag", "body_p1", "comment_1"] + shard_where_columns(),
+            lambda row: needs_comments(row) and in_shard(row), columns=["title"],
+        ))
+        pending_rows = acquire_leases("comments", pending_rows)
+        stage = (budget or RunBudget()).begin("comments", len(pending_rows))
+        if not pending_rows:
+            print("  - コメント未取得のデータはありません。")
+            return
+
+        try:
+            # 締め切りがある場合は、残りの配分時間で取得できる見込みの件数ずつ取得する
+            start = 0
+            while start < len(pending_rows):
+                if stage.expired():
+                    carried.extend(pending_rows[start:])
+                    break
+                size = stage.batch_size(FETCH_BATCH_SIZE)
+                batch = []
+                for key, row in pending_rows[start:start + size]:
+                    title = row["title"][:30] if row["title"] else "（タイトル不明）"
+                    print(f"  - {store.label(key)} (記事: {title}...): コメント本文 を取得中...")
+
+                    article_url = row["URL"]
+                    if not extract_article_id(article_url):
+                        print(f"    - URLから記事IDが抽出できませんでした: {article_url}")
+                        continue
+                    batch.append((key, row))
+
+                start += size
+
+                # まとまりごとにコメントページを取得し、HTML は解析プールでまとめて解析する
+                comments = fetch_comments([row["URL"] for _, row in batch], stop=stage.expired)
+                for key, row in batch:
+                    if row["URL"] not in comments:
+                        carried.append((key, row))
+                        continue
+                    updates.append((key, dict(zip(COMMENT_COLUMNS, comments[row["URL"]]))))
+        finally:
+            # 打ち切り・中断 (SIGTERM など) の場合も、取得済みの分は書き込む
+            if updates:
+                print(f"  ... {len(updates)} 件のコメントデータを {store.name} に一括書き込み中 ...")
+                store.update(updates)
+                print("  ✅ コメントデータの一括書き込みが完了しました。")
+            if carried:
+                print(f"  ⏭️ {len(carried)} 件のコメント取得を次回に持ち越します。")
+                release_leases("comments", carried)
 
     except Exception as e:
-        print(f"  ❌ 本文・コメント取得・書き込み処理中にエラー: {e}")
+        print(f"  ❌ コメント取得・書き込み処理中にエラー: {e}")
         traceback.print_exc()
+    finally:
+        if stage:
+            stage.finish(len(updates), len(carried))
 
 
 def sort_and_format_sheet(gc):
@@ -852,13 +1543,127 @@ def sort_and_format_sheet(gc):
         traceback.print_exc()
 
 
-def analyze_with_gemini_and_update_sheet(gc):
+def update_rollup(spreadsheet, deltas):
     """
-    スプレッドシートの「分析フラグ」が立っている記事（最大30件）をGeminiで分析し、
-    結果をP-R列 (sentiment, category, company_info) と
-    AD-AE列 (nissan_mention, nissan_sentiment) に一括で書き込む。
+    分析した行の集計キーの増減を SUMMARY シートに反映する。
+    """
+    if not ROLLUP_ENABLED:
+        return
+    if shard and lease_store is None:
+        # SUMMARY シートの読み書きが他のワーカーと競合するため、merge --rollup でまとめて再集計する
+        print("  - 分担実行中のため日別集計の更新は行いません (merge --rollup で再集計してください)。")
+        return
+    try:
+        with (lease_store.lock(f"rollup:{rollup.SUMMARY_SHEET}", WORKER_ID, LEASE_TTL)
+              if lease_store else contextlib.nullcontext(True)) as locked:
+            if not locked:
+                print("  ❌ 日別集計のロックを取得できませんでした (merge --rollup で再集計してください)。")
+                return
+            summary_ws = get_or_create_worksheet(spreadsheet, rollup.SUMMARY_SHEET, rollup.SUMMARY_HEADERS)
+            rows = rollup.apply_rollup_deltas(summary_ws, deltas)
+        if rows is not None:
+            print(f"  ✅ 日別集計 ({rollup.SUMMARY_SHEET}シート, {rows} 行) を更新しました。")
+    except Exception as e:
+        print(f"  ❌ 日別集計の更新に失敗しました (python main.py rollup で再集計できます): {e}")
+        traceback.print_exc()
+
+
+def rollup_key_for_row(row, col):
+    """
+    行データ (列名→インデックスの辞書 col で参照) から日別集計のキーを作る。
+    """
+    posted = parse_sheet_datetime(row[col["full_post_time"]]) or parse_sheet_datetime(row[col["post_time_str"]])
+    return rollup.make_rollup_key(
+        posted.strftime("%Y/%m/%d") if posted else "",
+        row[col["company_info"]], row[col["category"]],
+        row[col["sentiment"]], row[col["nissan_sentiment"]],
+    )
+
+
+def iter_archived_rows(gc, headers):
+    """
+    アーカイブ済みの行 (月別シートとローカルの gzip CSV) を順に返す。
+    """
+    if ARCHIVE_MODE == "sheet":
+        archive_spreadsheet = gc.open_by_key(ARCHIVE_SPREADSHEET_KEY)
+        for archive_ws in archive_spreadsheet.worksheets():
+            if re.fullmatch(r"ARCHIVE_\d{6}", archive_ws.title):
+                for _, row in iter_sheet_rows(archive_ws, len(headers)):
+                    yield row
+    if os.path.isdir(ARCHIVE_DIR):
+        for name in sorted(os.listdir(ARCHIVE_DIR)):
+            if not re.fullmatch(r"SOURCE_\d{4}-\d{2}\.csv\.gz", name):
+                continue
+            with gzip.open(os.path.join(ARCHIVE_DIR, name), "rt", encoding="utf-8", newline="") as f:
+                for row in csv.reader(f):
+                    if row and row != SOURCE_HEADERS[:len(row)]:
+                        yield row + [""] * (len(headers) - len(row))
+
+
+def rebuild_rollup(gc):
+    """
+    SOURCE シートとアーカイブ全体から日別集計を作り直し、SUMMARY シートと各行の rollup_key 列を書き直す。
+    (集計の初期化や、集計の更新に失敗した後の修復に使う)
+    """
+    print(f"\n===== 📈 日別集計 ({rollup.SUMMARY_SHEET}シート) の再作成 =====")
+    ws = get_worksheet(gc, "SOURCE")
+    if not ws:
+        return
+
+    try:
+        headers = ws.row_values(1)
+        col = {name: headers.index(name) for name in (
+            "post_time_str", "full_post_time", "sentiment", "category",
+            "company_info", "nissan_sentiment", "rollup_key",
+        )}
+    except ValueError as e:
+        print(f"  ❌ 必要な列が見つかりません: {e}。再集計を中断します。")
+        return
+
+    try:
+        counts = {}
+        key_updates = []
+        for row_index, row in iter_sheet_rows(ws, len(headers)):
+            key = rollup_key_for_row(row, col)
+            if key:
+                counts[key] = counts.get(key, 0) + 1
+            if row[col["rollup_key"]] != key:
+                key_updates.append({
+                    'range': row_range(row_index, col["rollup_key"] + 1, col["rollup_key"] + 1),
+                    'values': [[key]]
+                })
+
+        archived = 0
+        for row in iter_archived_rows(gc, headers):
+            key = rollup_key_for_row(row, col)
+            if key:
+                counts[key] = counts.get(key, 0) + 1
+                archived += 1
+
+        if key_updates:
+            ws.batch_update(key_updates, value_input_option="RAW")
+        summary_ws = get_or_create_worksheet(ws.spreadsheet, rollup.SUMMARY_SHEET, rollup.SUMMARY_HEADERS)
+        _, previous_rows = rollup.read_summary(summary_ws)
+        rows = rollup.write_summary(summary_ws, counts, previous_rows)
+        print(f"  ✅ {sum(counts.values())} 件の記事 (うちアーカイブ {archived} 件) から {rows} 行の集計を作成しました "
+              f"(rollup_key 更新 {len(key_updates)} 行)。")
+    except Exception as e:
+        print(f"  ❌ 再集計中にエラー: {e}")
+        traceback.print_exc()
+
+
+def analyze_with_gemini_and_update_sheet(store, budget=None):
+    """
+    「分析フラグ」が立っている未分析の記事（最大30件）をGeminiで分析し、
+    結果を sentiment, category, company_info 列と
+    nissan_mention, nissan_sentiment 列に一括で書き込む。
     (修正済：API 429 エラー対策のバッチ処理化)
+    budget (RunBudget) の配分時間を使い切ったら分析を打ち切り、分析済みの分だけを書き込む (残りは次回)。
+    STORY_CLUSTERING が有効なら、同じ出来事の記事をストーリーにまとめ、代表記事以外は代表記事の結果を確認するだけにする。
     """
+    stage = None
+    updates = []
+    carried = []
     try:
         if not gemini_model:
             print("\n===== 🧠 ステップ④ (スキップ) =====")
@@ -866,206 +1671,959 @@ def analyze_with_gemini_and_update_sheet(gc):
             return
 
         print("\n===== 🧠 ステップ④ Gemini分析の実行・即時反映 (P-R, AD-AE列) [最大30件] =====")
-        ws = get_worksheet(gc, "SOURCE")
-        if not ws:
+        print(f"  ... 分析対象データを {store.name} から読み込み中 ...")
+
+        missing = store.missing_columns([
+            "title", "analysis_flag", "sentiment", "category", "company_info",
+            "nissan_mention", "nissan_sentiment", "full_post_time", "post_time_str",
+            "body_hash", "rollup_key", "analyzed_at", "analysis_model", "cluster_id",
+        ] + BODY_COLUMNS)
+        if missing:
+            print(f"  ❌ 必要な列が見つかりません: {missing}。分析を中断します。")
             return
+        
+        max_analyze = MAX_ANALYZE # 最大分析件数
+
+        # 判定に必要な列 (analysis_flag, sentiment) だけを読み込み、対象の行だけ本文などを読み込む
+        # (上限を超える対象があるかを知るため 1 件多く読む)
+        columns = ["URL", "title", "post_time_str", "full_post_time", "body_hash", "rollup_key"] + BODY_COLUMNS
+        cluster_stories = STORY_CLUSTERING and shard is None and lease_store is None
+        clustered_rows = []
+        if cluster_stories:
+            # ストーリーの判定に使う分析済みの記事 (cluster_id 付き) も同じ読み込みで集める
+            candidates = []
+            for key, row in store.select(
+                ["analysis_flag", "sentiment", "cluster_id"],
+                lambda row: needs_analysis(row) or bool(row["cluster_id"]),
+                columns=columns + ["analysis_model"] + gemini_output.ANALYSIS_KEYS,
+            ):
+                if needs_analysis(row):
+                    candidates.append((key, row))
+                else:
+                    clustered_rows.append((key, row))
+        else:
+            candidates = list(store.select(
+                ["analysis_flag", "sentiment"] + shard_where_columns(),
+                lambda row: needs_analysis(row) and in_shard(row),
+                columns=columns,
+                limit=max_analyze + 1,
+            ))
+        if len(candidates) > max_analyze:
+            print(f"  分析件数が{max_analyze}件に達したため、残りは次回に回します。")
+            candidates = candidates[:max_analyze]
+        candidates = acquire_leases("analyze", candidates)
+        stories = None
+        if STORY_CLUSTERING and candidates:
+            if cluster_stories:
+                candidates, stories = plan_story_clusters(candidates, clustered_rows)
+            else:
+                print("  分担実行中はストーリーのまとめを行わず、すべての記事を分析します。")
+        stage = (budget or RunBudget()).begin("analyze", len(candidates))
+        rollup_deltas = {}
 
-        print("  ... 分析対象データをスプレッドシートから読み込み中 ...")
-        all_data = ws.get_all_values()
-        if len(all_data) <= 1:
-            print("  分析対象データがありません。")
-            return
+        try:
+            analyze_candidates(store, candidates, stage, updates, carried, rollup_deltas, stories)
+        finally:
+            # 打ち切り・中断 (SIGTERM など) の場合も、分析済みの分は書き込む
+            write_analysis_results(store, updates, rollup_deltas)
+            if carried:
+                print(f"  ⏭️ {len(carried)} 件の分析を次回に持ち越します。")
+                release_leases("analyze", carried)
+        if not candidates:
+            print("  分析対象（分析フラグがTRUEで未分析）の記事はありませんでした。")
+        if stories:
+            print(f"  📚 ストーリー: {len(stories['clusters'])} 件の記事を {len(set(stories['clusters'].values()))} 件にまとめ、"
+                  f"{stories['confirmed']} 件は代表記事の結果を確認しました (変更あり {stories['overridden']} 件)。")
+        for line in route_stats.summary_lines():
+            print(f"  🔀 {line}")
 
-        headers = all_data[0]
-        data_rows = all_data[1:]
+    except Exception as e:
+        print(f"  ❌ Gemini分析ステップ全体でエラー: {e}")
+        traceback.print_exc()
+    finally:
+        if stage:
+            stage.finish(len(updates), len(carried))
 
-        # ヘッダー行を取得して、列インデックスを動的に見つける
-        try:
-            # 必要な列のインデックス（0始まり）を取得
-            title_col_idx = headers.index("title") + 1 # E列
-            analysis_flag_col_idx = headers.index("analysis_flag") + 1 # F列
-            body_col_idx = headers.index("body_p1") + 1 # G列
-            sentiment_col_idx = headers.index("sentiment") + 1 # P列
-            category_col_idx = headers.index("category") + 1 # Q列
-            company_info_col_idx = headers.index("company_info") + 1 # R列
-            nissan_mention_col_idx = headers.index("nissan_mention") + 1 # AD列
-            nissan_sentiment_col_idx = headers.index("nissan_sentiment") + 1 # AE列
 
-        except ValueError as e:
-            print(f"  ❌ 必要な列が見つかりません: {e}。分析を中断します。")
-            print(f"  (取得したヘッダー: {headers})")
-            return
-        
-        batch_updates = []
-        count = 0
-        max_analyze = 30 # 最大分析件数
+def story_text(row):
+    """
+    ストーリーの判定に使う文字列 (タイトルと本文の冒頭)。
+    """
+    return f"{row['title']} {row['body_p1'][:STORY_LEAD_CHARS]}"
 
-        # 2行目から (インデックス0 = 2行目)
-        for i, row in enumerate(data_rows):
-            row_index = i + 2 # 実際のシート上の行番号
-            
-            if len(row) <= max(analysis_flag_col_idx-1, sentiment_col_idx-1, body_col_idx-1):
-                continue
 
-            try:
-                analysis_flag = row[analysis_flag_col_idx - 1]
-                sentiment = row[sentiment_col_idx - 1]
-                
-                if (analysis_flag.upper() == "TRUE" or analysis_flag == "1") and (not sentiment or sentiment == "N/A"):
-                    
-                    if count >= max_analyze:
-                        print(f"  分析件数が{max_analyze}件に達したため、残りは次回に回します。")
-                        break
-                    
-                    count += 1
-                    title = row[title_col_idx - 1][:30] # タイトル列
-                    print(f"  - 行 {row_index} (記事: {title}...): Gemini分析を実行中... ({count}/{max_analyze}件目)")
+def plan_story_clusters(candidates, clustered_rows):
+    """
+    分析対象の記事を、時間窓の中の分析済みの記事 (clustered_rows のうち cluster_id 付きの記事) と比べてストーリーにまとめる。
+    clustered_rows は分析対象と同じ読み込みで集めた行 (シートを読み直さない)。
+    (並べ替えた分析対象, ストーリーの情報) を返す。ストーリーの情報は
+        clusters   : {key: cluster_id} (本文が短い記事はまとめない)
+        references : {cluster_id: 代表記事の分析結果} (分析済みの記事の結果。この実行で分析した代表記事の結果も加える)
+    代表記事の結果が無いストーリーは、分析対象のうち最初の記事を代表記事として先に分析し、
+    残りの記事はその結果を確認するだけにする。
+    """
+    clusterer = story_cluster.StoryClusterer(STORY_SIMILARITY, STORY_WINDOW_HOURS)
+    article_keys = {}
+    posted_times = []
+    for key, row in candidates:
+        if len(row["body_p1"].strip()) < 50:
+            continue
+        posted = parse_sheet_datetime(row["full_post_time"]) or parse_sheet_datetime(row["post_time_str"])
+        article_keys[storage.article_key(row["URL"])] = key
+        clusterer.add(storage.article_key(row["URL"]), story_text(row), posted)
+        if posted:
+            posted_times.append(posted)
+
+    window = timedelta(hours=STORY_WINDOW_HOURS)
+    earliest = min(posted_times) - window if posted_times else None
+    latest = max(posted_times) + window if posted_times else None
+
+    def in_window(row):
+        if not row["cluster_id"] or needs_analysis(row):
+            return False
+        posted = parse_sheet_datetime(row["full_post_time"]) or parse_sheet_datetime(row["post_time_str"])
+        return posted is None or earliest is None or earliest <= posted <= latest
+
+    # 時間窓の中の分析済みの記事と、その分析結果 (確認だけを行った記事より代表記事の結果を優先する)
+    references = {}
+    analyzed = 0
+    for _, row in clustered_rows:
+        if not in_window(row):
+            continue
+        analyzed += 1
+        posted = parse_sheet_datetime(row["full_post_time"]) or parse_sheet_datetime(row["post_time_str"])
+        clusterer.add(storage.article_key(row["URL"]), story_text(row), posted, row["cluster_id"])
+        fields, invalid = gemini_output.validate_analysis(row)
+        if not invalid and (row["cluster_id"] not in references or not row["analysis_model"].endswith(STORY_CONFIRM_MARK)):
+            references[row["cluster_id"]] = fields
+
+    clusters = {article_keys[article_key]: cluster_id for article_key, (cluster_id, _) in clusterer.assign().items()}
+
+    # 代表記事 (結果の無いストーリーの最初の記事) を先に分析する
+    leading, following = [], []
+    seen = set(references)
+    for key, row in candidates:
+        cluster_id = clusters.get(key)
+        if cluster_id and cluster_id in seen:
+            following.append((key, row))
+        else:
+            leading.append((key, row))
+            if cluster_id:
+                seen.add(cluster_id)
+    print(f"  📚 分析対象 {len(clusters)} 件を、分析済みの {analyzed} 件 (直近 {STORY_WINDOW_HOURS:g} 時間) と比べて "
+          f"{len(set(clusters.values()))} 件のストーリーにまとめました (代表記事の結果を確認するだけの記事: {len(following)} 件)。")
+    return leading + following, {"clusters": clusters, "references": references, "confirmed": 0, "overridden": 0}
 
-                    # 本文 (G列からP列の直前まで)
-                    body_p1_to_p10 = row[body_col_idx - 1 : body_col_idx + 9]
-                    article_body = " ".join([text for text in body_p1_to_p10 if text and text != "-"])
-                    
-                    if len(article_body.strip()) < 50: 
-                        print(f"    ...本文が短すぎるためスキップ (本文: {article_body[:50]}...)")
-                        analysis_result = {
-                            "sentiment": "N/A (本文短)", "category": "N/A", "company_info": "N/A",
-                            "nissan_mention": "-", "nissan_sentiment": "-"
-                        }
-                    else:
-                        analysis_result = analyze_article_with_gemini(article_body)
-                    
-                    sentiment = analysis_result.get("sentiment", "N/A")
-                    category = analysis_result.get("category", "N/A")
-                    company_info = analysis_result.get("company_info", "N/A")
-                    nissan_mention = analysis_result.get("nissan_mention", "N/A")
-                    nissan_sentiment = analysis_result.get("nissan_sentiment", "N/A")
-
-                    # メインの分析結果 (P列〜R列)
-                    batch_updates.append({
-                        'range': f"{gspread.utils.rowcol_to_a1(row_index, sentiment_col_idx)}:{gspread.utils.rowcol_to_a1(row_index, company_info_col_idx)}",
-                        'values': [[sentiment, category, company_info]]
-                    })
-                    
-                    # 日産関連の分析結果 (AD列〜AE列)
-                    batch_updates.append({
-                        'range': f"{gspread.utils.rowcol_to_a1(row_index, nissan_mention_col_idx)}:{gspread.utils.rowcol_to_a1(row_index, nissan_sentiment_col_idx)}",
-                        'values': [[nissan_mention, nissan_sentiment]]
-                    })
-                    
-                    time.sleep(1) 
 
-            except Exception as e:
-                print(f"  ❌ 行 {row_index} の処理中にエラー: {e}")
-                traceback.print_exc()
+def analyze_candidates(store, candidates, stage, updates, carried, rollup_deltas, stories=None):
+    """
+    analyze_with_gemini_and_update_sheet の分析対象を 1 件ずつ分析し、書き込む内容を updates に加える。
+    配分時間を使い切ったら、残りの行を carried に加えて打ち切る。
+    stories (plan_story_clusters のストーリーの情報) を渡すと、代表記事の結果があるストーリーの記事は確認だけを行う。
+    """
+    references = stories["references"] if stories else {}
+    for count, (key, row) in enumerate(candidates, start=1):
+        if stage.expired():
+            carried.extend(candidates[count - 1:])
+            break
+        try:
+            cluster_id = stories["clusters"].get(key, "") if stories else ""
+            title = row["title"][:30] # タイトル列
+            print(f"  - {store.label(key)} (記事: {title}...): Gemini分析を実行中... ({count}/{len(candidates)}件目)")
+
+            article_body = None
+            body_values = {}
+            digest = row["body_hash"]
+            if digest:
+                article_body = blob_store.get_body(digest)
+                if article_body is None:
+                    # 抜粋だけで分析すると通常の結果と区別できないため、本文を取得し直す (できなければ次回に回す)
+                    print(f"    ⚠️ ブロブストアに本文 ({digest[:12]}...) が見つかりません。本文を取得し直します。")
+                    article_body, body_values = refetch_blob_body(row["URL"])
+                    if article_body is None:
+                        print("    ❌ 本文を取得し直せなかったため、この記事の分析は次回に回します。")
+                        carried.append((key, row))
+                        continue
+
+            if article_body is None:
+                # 本文 (body_p1〜body_p10 列)
+                article_body = " ".join([row[name] for name in BODY_COLUMNS if row[name] and row[name] != "-"])
+            
+            if len(article_body.strip()) < 50: 
+                print(f"    ...本文が短すぎるためスキップ (本文: {article_body[:50]}...)")
+                analysis_result = {
+                    "sentiment": "N/A (本文短)", "category": "N/A", "company_info": "N/A",
+                    "nissan_mention": "-", "nissan_sentiment": "-"
+                }
+                analysis_model = "-"
+            elif cluster_id in references:
+                # 同じストーリーの代表記事の結果があれば、この記事にも当てはまるかを確認するだけにする
+                analysis_result, overridden = confirm_story_analysis(row["title"], article_body, references[cluster_id])
+                analysis_model = route_stats.models.get("confirm", "confirm") + STORY_CONFIRM_MARK
+                if overridden is not None:
+                    print(f"    (ストーリー {cluster_id} の代表記事の結果を確認: "
+                          f"{'変更 ' + ', '.join(overridden) if overridden else '変更なし'})")
+                    stories["confirmed"] += 1
+                    stories["overridden"] += bool(overridden)
+            else:
+                # 短く、登場するメーカーが少ない記事は速いモデルで分析する
+                route = route_article(article_body)
+                analysis_model = route_stats.models.get(route, route)
+                print(f"    (振り分け: {analysis_model}{f' / ストーリー {cluster_id} の代表記事' if cluster_id else ''})")
+                analysis_result = analyze_article_with_gemini(article_body, route)
+                fields, invalid = gemini_output.validate_analysis(analysis_result)
+                if cluster_id and not invalid:
+                    references[cluster_id] = fields
+            
+            sentiment = analysis_result.get("sentiment", "N/A")
+            category = analysis_result.get("category", "N/A")
+            company_info = analysis_result.get("company_info", "N/A")
+            nissan_mention = analysis_result.get("nissan_mention", "N/A")
+            nissan_sentiment = analysis_result.get("nissan_sentiment", "N/A")
+
+            # 日別集計のキー (再分析の場合は前回のキーを差し引く)
+            posted = parse_sheet_datetime(row["full_post_time"]) or parse_sheet_datetime(row["post_time_str"])
+            new_key = rollup.make_rollup_key(
+                posted.strftime("%Y/%m/%d") if posted else "",
+                company_info, category, sentiment, nissan_sentiment,
+            )
+            old_key = row["rollup_key"]
+            if old_key != new_key:
+                rollup_deltas[old_key] = rollup_deltas.get(old_key, 0) - 1
+                rollup_deltas[new_key] = rollup_deltas.get(new_key, 0) + 1
+
+            result_columns = {
+                # メインの分析結果
+                "sentiment": sentiment,
+                "category": category,
+                "company_info": company_info,
+                # 日産関連の分析結果
+                "nissan_mention": nissan_mention,
+                "nissan_sentiment": nissan_sentiment,
+                # 集計キーと分析日時 (エクスポートの対象の判定に使う)
+                "rollup_key": new_key,
+                "analyzed_at": datetime.now().strftime("%Y/%m/%d %H:%M:%S"),
+                # 分析に使ったモデル
+                "analysis_model": analysis_model,
+            }
+            if stories:
+                # 同じ出来事の記事をまとめて集計できるように、ストーリーの ID を書き込む
+                result_columns["cluster_id"] = cluster_id
+            # 本文を取得し直した場合は、抜粋・ページ数・ハッシュも書き直す
+            result_columns.update(body_values)
+            updates.append((key, result_columns))
+            
+            wait_interval(1)
+
+        except Exception as e:
+            print(f"  ❌ {store.label(key)} の処理中にエラー: {e}")
+            traceback.print_exc()
 
-        if batch_updates:
-            print(f"  ... {len(batch_updates) // 2} 件の分析結果をスプレッドシートに一括書き込み中 ...")
-            try:
-                ws.batch_update(batch_updates, value_input_option="USER_ENTERED")
-                print("  ✅ 分析結果の一括書き込みが完了しました。")
-            except Exception as e:
-                print(f"  ❌ スプレッドシートへの一括書き込みに失敗しました: {e}")
-                traceback.print_exc()
-        elif count == 0:
-            print("  分析対象（分析フラグがTRUEで未分析）の記事はありませんでした。")
 
+def write_analysis_results(store, updates, rollup_deltas):
+    """
+    分析結果を一括で書き込み、書き込めた場合は日別集計に反映する。
+    """
+    if not updates:
+        return
+    print(f"  ... {len(updates)} 件の分析結果を {store.name} に一括書き込み中 ...")
+    try:
+        store.update(updates)
+        print("  ✅ 分析結果の一括書き込みが完了しました。")
     except Exception as e:
-        print(f"  ❌ Gemini分析ステップ全体でエラー: {e}")
+        print(f"  ❌ {store.name} への一括書き込みに失敗しました: {e}")
         traceback.print_exc()
+        return
 
+    # 分析結果の書き込みが成功した場合だけ集計に反映する
+    # (ローカルの保存先では Sheets へ反映した後に rollup サブコマンドで集計する)
+    if store.spreadsheet is not None:
+        update_rollup(store.spreadsheet, rollup_deltas)
 
-# (修正) ヘッダー自動設定機能
-def check_and_set_headers(ws):
+
+def evaluate_routing(sample_path):
     """
-    ワークシートの1行目（ヘッダー）を確認し、
-    存在しない場合や不整合がある場合に自動で設定する。
+    ラベル付きサンプル (model_router.load_labeled_sample の形式) の各記事を両方のモデルで分析し、
+    振り分け先ごとに正解との一致率を比べる。速いモデルに振り分けた記事で、一致率が強いモデルと同程度かを確かめる。
     """
-    print("  ヘッダー行（1行目）の整合性を確認中...")
-    
-    # プログラムが期待するヘッダーの完全なリスト
-    expected_headers = [
-        'keyword', 'URL', 'post_time_str', 'source', 'title', 'analysis_flag', 
-        'body_p1', 'body_p2', 'body_p3', 'body_p4', 'body_p5', 'body_p6', 
-        'body_p7', 'body_p8', 'body_p9', 'body_p10', 
-        'sentiment', 'category', 'company_info', 
-        'comment_count', 'full_post_time', 
-        'comment_1', 'comment_2', 'comment_3', 'comment_4', 'comment_5', 
-        'comment_6', 'comment_7', 'comment_8', 'comment_9', 'comment_10', 
-        'nissan_mention', 'nissan_sentiment'
-    ]
-    
+    print("\n===== 🔀 モデル振り分けの検証 =====")
+    if not gemini_model or gemini_fast_model is None:
+        print("  Geminiモデル (GEMINI_MODEL / GEMINI_FAST_MODEL) が初期化されていないため、検証をスキップします。"
+              "GEMINI_FAST_MODEL に検証する速いモデルを指定してください。")
+        return
+    try:
+        samples = model_router.load_labeled_sample(sample_path)
+    except (OSError, ValueError) as e:
+        print(f"  ❌ ラベル付きサンプルの読み込みに失敗しました: {e}")
+        return
+
+    report = model_router.HitRateReport(gemini_output.ANALYSIS_KEYS)
+    for number, sample in enumerate(samples, 1):
+        route = route_article(sample["body"])
+        print(f"  - サンプル {number}/{len(samples)}: {route} に振り分け。両方のモデルで分析中...")
+        for model_route in model_router.ROUTES:
+            report.add(route, model_route, sample, analyze_article_with_gemini(sample["body"], model_route))
+            wait_interval(1)
+
+    for line in report.summary_lines():
+        print(f"  🎯 {line}")
+    for line in route_stats.summary_lines():
+        print(f"  🔀 {line}")
+    fast_rate, strong_rate = report.rate("fast", "fast"), report.rate("fast", "strong")
+    if fast_rate is not None and strong_rate is not None:
+        print(f"  速いモデルに振り分けた記事の一致率: {fast_rate:.0%} (強いモデルでは {strong_rate:.0%}、差 {fast_rate - strong_rate:+.0%})")
+
+
+def export_analyzed_rows(store, full=False):
+    """
+    まだエクスポートしていない (または前回のエクスポート後に分析し直された) 行を、
+    EXPORT_DIR の月 × キーワード別の列指向データセットに追記し、書き出した行の exported_at 列に時刻を書き込む。
+    full=True の場合は分析済みの全行を書き出し、以前のファイルを削除してデータセットを作り直す。
+    """
+    if not EXPORT_DIR:
+        return
+
+    print(f"\n===== 📦 ステップ⑤ 分析済み記事のエクスポート ({EXPORT_DIR}, "
+          f"{'Parquet' if export.parquet_available() else 'gzip CSV'}) =====")
+
     try:
-        current_headers = ws.row_values(1)
-    except GSpreadAPIError as e:
-        print(f"  シートが空のようです (エラー: {e})。")
-        current_headers = []
+        names = [
+            "keyword", "URL", "post_time_str", "source", "title", "sentiment", "category",
+            "company_info", "comment_count", "full_post_time", "nissan_mention",
+            "nissan_sentiment", "analyzed_at", "exported_at",
+        ]
+        missing = store.missing_columns(names)
+        if missing:
+            print(f"  ❌ 必要な列が見つかりません: {missing}。エクスポートをスキップします。")
+            return
+
+        # 以前の形式の記録 (_watermark.json) でエクスポート済みの行は、書き出さずに exported_at 列だけを埋める
+        ledger = export.ExportLedger() if full else export.read_ledger(EXPORT_DIR)
+        if full:
+            print("  分析済みの全行を書き出し直します。")
+
+        # --- 1. URL・analyzed_at・sentiment・exported_at 列だけで対象の行を探し、
+        #        対象の行だけ必要な列を読み込む (本文・コメント列は読まない) ---
+        def is_target(row):
+            sentiment = row["sentiment"]
+            if not sentiment or sentiment.startswith("N/A"):
+                return False
+            if full:
+                return True
+            analyzed_at = parse_sheet_datetime(row["analyzed_at"])
+            return analyzed_at is not None and not export.is_exported(
+                analyzed_at, parse_sheet_datetime(row["exported_at"]))
+
+        targets = list(store.select(["URL", "analyzed_at", "sentiment", "exported_at"], is_target, columns=names))
+        rows, carried = [], []
+        for key, values in targets:
+            if not values["exported_at"] and ledger.is_exported(
+                    storage.article_key(values["URL"]), values["analyzed_at"],
+                    parse_sheet_datetime(values["analyzed_at"])):
+                carried.append((key, values))
+            else:
+                rows.append((key, values))
+
+        if not rows and not carried and not full:
+            print("  エクスポートすべき新しい分析結果はありません。")
+            return
+
+        records = []
+        for _, values in rows:
+            analyzed_at = parse_sheet_datetime(values["analyzed_at"])
+            sentiment = values["sentiment"]
+            comment_count = values["comment_count"]
+            records.append({
+                "article_id": extract_article_id(values["URL"]),
+                "url": values["URL"],
+                "keyword": search_planner.primary_keyword(values["keyword"]),
+                "title": values["title"],
+                "source": values["source"],
+                "post_time": parse_sheet_datetime(values["full_post_time"])
+                             or parse_sheet_datetime(values["post_time_str"]),
+                "comment_count": int(comment_count) if comment_count.isdigit() else None,
+                "sentiment": sentiment,
+                "category": values["category"],
+                "company_info": values["company_info"],
+                "nissan_mention": values["nissan_mention"],
+                "nissan_sentiment": values["nissan_sentiment"],
+                "analyzed_at": analyzed_at,
+            })
+
+        # --- 2. パーティションごとに追記し、書き出した行の exported_at 列に時刻を書き込む ---
+        #        (全件の場合は、書き出した後に以前のファイルを削除する) ---
+        written = export.write_partitions(EXPORT_DIR, records) if records else []
+        if full:
+            removed = export.remove_other_parts(EXPORT_DIR, written)
+            print(f"  以前のファイル {removed} 件を削除しました。")
+        exported_at = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+        marked = store.update([(key, {"exported_at": exported_at}) for key, _ in rows + carried])
+        export.write_watermark(EXPORT_DIR, len(records))
+        print(f"  ✅ {len(records)} 件を {len(written)} ファイルにエクスポートしました (exported_at 列を {marked} 行に記録)。")
+        if carried:
+            print(f"  以前の記録でエクスポート済みの {len(carried)} 行は、exported_at 列だけを記録しました。")
+
     except Exception as e:
-        print(f"  ヘッダー行の読み取りに失敗: {e}")
-        current_headers = []
+        print(f"  ❌ エクスポート中にエラー: {e}")
+        traceback.print_exc()
 
-    if current_headers != expected_headers:
-        print("  ヘッダー行が不足または不整合です。1行目にヘッダーを自動設定します...")
-        try:
-            ws.update('A1', [expected_headers], value_input_option='RAW')
-            print("  ✅ ヘッダー行を更新しました。")
-            return True
-        except Exception as e:
-            print(f"  ❌ ヘッダー行の設定に失敗しました: {e}")
-            traceback.print_exc()
-            return False
-    else:
-        print("  ✅ ヘッダー行は正常です。")
-        return True
 
+def push_to_sheets(store, gc):
+    """
+    ローカルの保存先 (SQLite / CSV) の内容を SOURCE シートに反映する (表示用)。
+    シートに無い記事は追加し、既にある記事は値が変わった列だけを書き換える。
+    analysis_flag 列はシート上での手動変更を優先し、アーカイブ済みの記事は追加しない。
+    """
+    print(f"\n===== 📤 {store.name} → SOURCEシート への反映 =====")
+    ws = get_worksheet(gc, "SOURCE")
+    if not ws:
+        return
+    sheet_store = storage.SheetsStore(ws, SOURCE_HEADERS)
+    if not sheet_store.ensure_headers():
+        return
 
-def main():
+    try:
+        print("  ... SOURCEシートの現在の内容を読み込み中 ...")
+        sheet_rows = {
+            key: row for key, row in sheet_store.select([], columns=SOURCE_HEADERS)
+        }
+        archived_ids = set(load_archived_article_ids(ws.spreadsheet))
+
+        to_append = []
+        updates = []
+        for article_id, row in store.select([], columns=SOURCE_HEADERS):
+            if article_id in sheet_rows:
+                sheet_row = sheet_rows[article_id]
+                changed = {
+                    name: row[name] for name in SOURCE_HEADERS
+                    if name != "analysis_flag" and row[name] and row[name] != sheet_row[name]
+                }
+                if changed:
+                    updates.append((article_id, changed))
+            elif article_id not in archived_ids:
+                to_append.append(row)
+
+        if updates:
+            sheet_store.update(updates)
+        added = sheet_store.append(to_append) if to_append else 0
+        print(f"  ✅ {added} 件を追加し、{len(updates)} 件を更新しました。")
+
+    except Exception as e:
+        print(f"  ❌ SOURCEシートへの反映中にエラー: {e}")
+        traceback.print_exc()
+
+
+def append_local_archive(month, rows):
     """
-    メイン処理
+    ARCHIVE_DIR/SOURCE_YYYY-MM.csv.gz に行を追記する (gzip のメンバーを追加する形で追記)。
+    追記先のパスを返す。
     """
-    print("--- 統合スクリプト開始 ---")
-    start_time = time.time()
-    
-    # --- セットアップ ---
-    gc = setup_gspread()
-    if not gc:
-        print("スプレッドシート認証に失敗。処理を終了します。")
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"SOURCE_{month}.csv.gz")
+    is_new = not os.path.exists(path)
+    with gzip.open(path, "at", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        if is_new:
+            writer.writerow(SOURCE_HEADERS)
+        writer.writerows(rows)
+    return path
+
+
+def archive_old_rows(gc):
+    """
+    分析済みで投稿から ARCHIVE_AFTER_DAYS 日以上経過した行を、SOURCE シートから
+    月別アーカイブ (シート ARCHIVE_YYYYMM またはローカルの gzip CSV) へ移す。
+    移した記事のIDは索引シートに残し、次回以降の重複チェックに使う。
+    (アーカイブ・索引への書き込みが成功してから SOURCE の行を削除する)
+    """
+    if ARCHIVE_AFTER_DAYS <= 0:
         return
 
+    print(f"\n===== 🗄️ ステップ⑥ 古い記事のアーカイブ ({ARCHIVE_AFTER_DAYS}日以上前・{ARCHIVE_MODE}) =====")
+    if ARCHIVE_MODE == "local" and not ARCHIVE_DIR_DURABLE:
+        # CI の作業ディレクトリはキャッシュ・成果物にしか残らないため、SOURCE から行を消すと失われるおそれがある
+        print(f"  ❌ ARCHIVE_DIR ({ARCHIVE_DIR}) が永続的な保存先ではないため、アーカイブをスキップします。"
+              "永続的なストレージに同期している場合は ARCHIVE_DIR_DURABLE=1 を設定してください。")
+        return
     ws = get_worksheet(gc, "SOURCE")
     if not ws:
-        print("SOURCE ワークシートの取得に失敗。処理を終了します。")
         return
-        
-    if not check_and_set_headers(ws):
-        print("ヘッダー行の設定に失敗したため、処理を終了します。")
+
+    try:
+        headers = ws.row_values(1)
+        try:
+            url_col = headers.index("URL")
+            post_time_col = headers.index("post_time_str")
+            full_post_time_col = headers.index("full_post_time")
+            body_p1_col = headers.index("body_p1")
+            sentiment_col = headers.index("sentiment")
+            analyzed_at_col = headers.index("analyzed_at")
+            exported_at_col = headers.index("exported_at") if EXPORT_DIR else None
+        except ValueError as e:
+            print(f"  ❌ 必要な列が見つかりません: {e}。アーカイブをスキップします。")
+            return
+
+        cutoff = datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        # エクスポートが有効な場合、まだエクスポートしていない行はアーカイブしない
+        # (SOURCE の exported_at 列で判断する。EXPORT_DIR の中身はキャッシュが消えると失われるため使わない)
+
+        def archive_month(row):
+            # 本文取得・分析が済んでいない行は対象外
+            body_p1 = row[body_p1_col]
+            sentiment = row[sentiment_col]
+            if not body_p1 or body_p1 == "（本文取得失敗）":
+                return None
+            if not sentiment or sentiment.startswith("N/A"):
+                return None
+            if EXPORT_DIR:
+                analyzed_at = parse_sheet_datetime(row[analyzed_at_col])
+                if not export.is_exported(analyzed_at, parse_sheet_datetime(row[exported_at_col])):
+                    return None
+            posted = parse_sheet_datetime(row[full_post_time_col]) or parse_sheet_datetime(row[post_time_col])
+            if not posted or posted >= cutoff:
+                return None
+            return posted.strftime("%Y-%m")
+
+        # 対象行だけを保持する (最大 ARCHIVE_MAX_ROWS 行)
+        targets = []
+        for row_index, row in iter_sheet_rows(ws, len(headers), predicate=archive_month):
+            targets.append((row_index, archive_month(row), row))
+            if len(targets) >= ARCHIVE_MAX_ROWS:
+                print(f"  アーカイブ件数が{ARCHIVE_MAX_ROWS}件に達したため、残りは次回に回します。")
+                break
+
+        if not targets:
+            print("  アーカイブ対象の記事はありません。")
+            return
+
+        by_month = {}
+        for row_index, month, row in targets:
+            by_month.setdefault(month, []).append(row)
+
+        # --- 1. 月別アーカイブへ書き込み ---
+        index_rows = []
+        archive_spreadsheet = gc.open_by_key(ARCHIVE_SPREADSHEET_KEY) if ARCHIVE_MODE == "sheet" else None
+        for month, rows in sorted(by_month.items()):
+            if ARCHIVE_MODE == "sheet":
+                title = f"ARCHIVE_{month.replace('-', '')}"
+                archive_ws = get_or_create_worksheet(archive_spreadsheet, title, headers)
+                archive_ws.append_rows(rows, value_input_option="RAW")
+                location = title
+            else:
+                location = append_local_archive(month, rows)
+            print(f"  ✅ {month}: {len(rows)} 件を {location} にアーカイブしました。")
+            for row in rows:
+                article_id = extract_article_id(row[url_col])
+                if article_id:
+                    index_rows.append([article_id, location])
+
+        # --- 2. 索引シートに記事IDを追記 ---
+        if index_rows:
+            index_ws = get_or_create_worksheet(ws.spreadsheet, ARCHIVE_INDEX_SHEET, ARCHIVE_INDEX_HEADERS)
+            index_ws.append_rows(index_rows, value_input_option="RAW")
+
+        # --- 3. SOURCE から削除 ---
+        row_indices = [row_index for row_index, _, _ in targets]
+        runs = delete_sheet_rows(ws, row_indices)
+        print(f"  ✅ SOURCEシートから {len(row_indices)} 行を削除しました ({runs} 範囲)。")
+
+    except Exception as e:
+        print(f"  ❌ アーカイブ処理中にエラー: {e}")
+        traceback.print_exc()
+
+
+def delete_sheet_rows(ws, row_indices):
+    """
+    シートの行を削除する (連続する行をまとめ、下の行から削除する)。削除した範囲の数を返す。
+    """
+    runs = []
+    for row_index in sorted(row_indices):
+        if runs and runs[-1][1] == row_index - 1:
+            runs[-1][1] = row_index
+        else:
+            runs.append([row_index, row_index])
+
+    delete_requests = [
+        {
+            "deleteDimension": {
+                "range": {
+                    "sheetId": ws.id,
+                    "dimension": "ROWS",
+                    "startIndex": first - 1, # 0始まり
+                    "endIndex": last,
+                }
+            }
+        }
+        for first, last in reversed(runs)
+    ]
+    if delete_requests:
+        ws.spreadsheet.batch_update({"requests": delete_requests})
+    return len(runs)
+
+
+def remove_duplicate_rows(gc):
+    """
+    SOURCE シートで同じ記事の行が複数ある場合に、1 行だけを残して削除する (分析済みの行を優先し、次に上の行)。
+    リースを共有できないワーカー (別々のマシンで動く matrix のジョブ) が、別々の検索クエリで同じ記事を追加した場合に起きる。
+    """
+    print("\n===== 🧹 SOURCEシートの重複した記事の削除 =====")
+    ws = get_worksheet(gc, "SOURCE")
+    if not ws:
         return
-        
-    if not load_prompts():
-        print("プロンプト読み込みに失敗。Gemini分析は実行されません。")
 
-    initialize_gemini() # Gemini APIの初期化
+    try:
+        headers = ws.row_values(1)
+        try:
+            url_col = headers.index("URL") + 1
+            sentiment_col = headers.index("sentiment") + 1
+        except ValueError as e:
+            print(f"  ❌ 必要な列が見つかりません: {e}。重複の削除をスキップします。")
+            return
+
+        # 記事ID → (残す行の行番号, 分析済みか)
+        kept = {}
+        duplicates = []
+        # URL 列と sentiment 列だけを読む
+        urls = ws.col_values(url_col)
+        sentiments = ws.col_values(sentiment_col)
+        for row_index in range(2, len(urls) + 1):
+            url = urls[row_index - 1]
+            sentiment = sentiments[row_index - 1] if row_index <= len(sentiments) else ""
+            if not url:
+                continue
+            key = storage.article_key(url)
+            analyzed = bool(sentiment) and not sentiment.startswith("N/A")
+            if key not in kept:
+                kept[key] = (row_index, analyzed)
+            elif analyzed and not kept[key][1]:
+                duplicates.append(kept[key][0])
+                kept[key] = (row_index, analyzed)
+            else:
+                duplicates.append(row_index)
 
-    # --- ステップ① ニュースリスト取得 & ステップ② 本文・コメント取得 ---
-    existing_urls = load_existing_urls(ws)
-    print(f"  (現在 {len(existing_urls)} 件の記事URLをロード済み)")
-    
-    for keyword in SEARCH_KEYWORDS:
-        print(f"\n===== 🔑 ステップ① ニュースリスト取得: {keyword} =====")
-        new_articles = get_yahoo_news_search_results(keyword)
-        
-        print(f"\n===== 📝 ステップ② 本文/コメント更新 (キーワード: {keyword} 追加後) =====")
-        update_source_sheet(ws, new_articles, existing_urls)
+        if not duplicates:
+            print("  重複した記事はありません。")
+            return
+        runs = delete_sheet_rows(ws, duplicates)
+        print(f"  ✅ 重複した {len(duplicates)} 行を削除しました ({runs} 範囲)。日別集計は merge --rollup で作り直してください。")
+
+    except Exception as e:
+        print(f"  ❌ 重複の削除中にエラー: {e}")
+        traceback.print_exc()
 
 
-    # --- ステップ③ ソート & 書式設定 ---
-    sort_and_format_sheet(gc)
+# (修正) ヘッダー自動設定機能
+def check_and_set_headers(store):
+    """
+    保存先の1行目（ヘッダー）・テーブル定義を確認し、
+    存在しない場合や不整合がある場合に自動で設定する。
+    """
+    return store.ensure_headers()
 
-    # --- ステップ④ Gemini 分析 ---
-    analyze_with_gemini_and_update_sheet(gc)
+
+# サブコマンドごとに必要な準備 (保存先の用意・Gemini の初期化)
+COMMANDS_NEEDING_STORE = ("run", "search", "fetch", "comments", "analyze", "export", "push", "merge")
+COMMANDS_NEEDING_GEMINI = ("run", "analyze", "route-eval")
+# 保存先に関係なく Sheets を直接扱うサブコマンド
+COMMANDS_NEEDING_SHEETS = ("sort", "archive", "rollup", "push")
+
+
+def setup_sharding(shard_value=None):
+    """
+    担当 (shard_value または SHARD) とリースの保存先 (LEASE_STORE) を設定する。成功したら True。
+    """
+    global shard, lease_store
+    try:
+        shard = sharding.parse_shard(
+            shard_value or SHARD, SHARD_MODE,
+            search_planner.plan_queries(SEARCH_KEYWORDS, SEARCH_OR_GROUP_SIZE),
+        )
+        lease_store = sharding.open_lease_store(LEASE_STORE)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"❌ 分担実行の設定に失敗しました: {e}")
+        return False
+    if shard and STORAGE_BACKEND == "csv":
+        print("❌ CSV の保存先は複数のワーカーから同時に書き込めないため、分担実行には使えません。")
+        return False
+    if shard:
+        print(f"  分担実行: シャード {shard} / ワーカー {WORKER_ID}")
+    if lease_store:
+        purged = lease_store.purge_expired()
+        print(f"  リースの保存先: {lease_store.name} (期限切れ {purged} 件を削除)")
+    return True
+
+
+def setup_budget(command, store, deadline=None, groups=()):
+    """
+    締め切り (deadline または RUN_DEADLINE) から RunBudget を作り、command が行うステップの未処理件数を設定する。
+    締め切りの指定が不正な場合は None。
+    """
+    try:
+        seconds = budget.parse_duration(deadline or RUN_DEADLINE)
+        item_seconds = budget.parse_item_seconds(BUDGET_ITEM_SECONDS)
+    except ValueError as e:
+        print(f"❌ 締め切りの設定に失敗しました: {e}")
+        return None
+    run_budget = RunBudget(seconds, RUN_DEADLINE_RESERVE, item_seconds)
+    if not run_budget.limited:
+        return run_budget
+
+    print(f"  締め切り: {seconds:.0f}秒後 (終了処理の予備 {RUN_DEADLINE_RESERVE:.0f}秒)")
+    if command in ("run", "search"):
+        run_budget.set_backlog("search", len(groups))
+    if command in ("run", "fetch", "analyze") and store is not None:
+        pending_details, pending_analysis = count_backlog(store)
+        if command in ("run", "fetch"):
+            run_budget.set_backlog("fetch", pending_details)
+        if command in ("run", "analyze"):
+            # run では検索で追加した記事の分を、検索 (ステップ①) の後で足す
+            run_budget.set_backlog("analyze", min(pending_analysis, MAX_ANALYZE))
+    return run_budget
+
+
+def main(command="run", profile_dir=None, keywords=None, export_full=False,
+         shard_value=None, merge_rollup=False, deadline=None, sample_path=None):
+    """
+    メイン処理
+    command で実行するステップを選ぶ ("run" は全ステップを順に実行する)。
+        search   : ① ニュースリストを取得し、新しい記事を SOURCE シートに追加する
+        fetch    : ② 本文未取得の記事の本文・コメント数・投稿日時を取得する
+        comments : ② 本文取得済みでコメント未取得の記事のコメントを取得する
+        sort     : ③ SOURCE シートのソートと書式設定
+        analyze  : ④ Gemini 分析
+        export   : ⑤ 分析済み記事のエクスポート (export_full=True なら全件)
+        archive  : ⑥ 古い記事のアーカイブ
+        rollup   : 日別集計 (SUMMARY シート) の作り直し
+        push     : ローカルの保存先 (STORAGE_BACKEND=sqlite / csv) の内容を SOURCE シートに反映する
+        merge    : 分担実行の後にまとめて行うステップ (重複した記事の削除と ③ ⑤ ⑥、merge_rollup=True なら日別集計の作り直しも)
+        route-eval : ラベル付きサンプル (sample_path) でモデルの振り分けを検証する
+    保存先がローカルの場合、run はシート専用のステップ (ソート・アーカイブ・日別集計) を行わない。
+    shard_value ('K/N') または SHARD を指定すると、run は担当分の ① ② ④ だけを行う (残りは merge で行う)。
+    deadline ('55m' など) または RUN_DEADLINE を指定すると、各ステップに時間を配分し、使い切ったら残りを次回に回す。
+    keywords を指定すると、ステップ① の検索キーワードを絞り込む。
+    profile_dir (または環境変数 PROFILE_DIR) を指定すると、ステップごとのプロファイルを出力する。
+    セットアップに失敗した場合は 1、中断 (Ctrl+C / SIGTERM) された場合は 130、それ以外は 0 を返す。
+    """
+    print(f"--- 統合スクリプト開始 ({command}) ---")
+    start_time = time.time()
+    profiler = StageProfiler(profile_dir or os.environ.get("PROFILE_DIR"))
+    keywords = keywords or SEARCH_KEYWORDS
+    run_budget = None
+
+    try:
+        # --- セットアップ ---
+        with profiler.stage("setup"):
+            if not setup_sharding(shard_value):
+                return 1
+            # 分担実行中の run は、シート全体を扱うステップを merge に任せる
+            sharded_run = shard is not None and command == "run"
+            finishing = command == "merge" or (command == "run" and not sharded_run)
+
+            use_sheets = STORAGE_BACKEND == "sheets"
+            gc = None
+            if use_sheets or command in COMMANDS_NEEDING_SHEETS:
+                gc = setup_gspread()
+                if not gc:
+                    print("スプレッドシート認証に失敗。処理を終了します。")
+                    return 1
+
+            store = None
+            if command in COMMANDS_NEEDING_STORE:
+                store = open_source_store(gc)
+                if not store:
+                    print("SOURCE ワークシートの取得に失敗。処理を終了します。")
+                    return 1
+
+                if not check_and_set_headers(store):
+                    print("ヘッダー行の設定に失敗したため、処理を終了します。")
+                    return 1
+
+            if command in COMMANDS_NEEDING_GEMINI:
+                if not load_prompts():
+                    print("プロンプト読み込みに失敗。Gemini分析は実行されません。")
+
+                initialize_gemini() # Gemini APIの初期化
+
+            groups = search_planner.plan_queries(keywords, SEARCH_OR_GROUP_SIZE)
+            if shard:
+                groups = shard.take_groups(groups)
+            run_budget = setup_budget(command, store, deadline, groups)
+            if not run_budget:
+                return 1
+
+        # --- ステップ① ニュースリスト取得 ---
+        if command in ("run", "search"):
+            with profiler.stage("load_existing_ids"):
+                existing_ids = load_existing_ids(store)
+            print(f"  (現在 {len(existing_ids)} 件の記事IDをロード済み)")
+
+            search_report = search_planner.SearchReport([keyword for group in groups for keyword in group])
+            stage = run_budget.begin("search")
+            searched = added = 0
+            for group in groups:
+                if stage.expired():
+                    break
+                print(f"\n===== 🔑 ステップ① ニュースリスト取得: {' / '.join(group)} =====")
+                with profiler.stage("search"):
+                    new_articles = search_keyword_group(group, search_report)
+                with profiler.stage("append_new_articles"):
+                    added += append_new_articles(store, new_articles, existing_ids)
+                searched += 1
+            stage.finish(searched, len(groups) - searched)
+            if command == "run":
+                # 追加した記事も未分析のため、分析の見込みに足す (分析の上限件数まで)
+                run_budget.set_backlog(
+                    "analyze", min(run_budget.backlogs.get("analyze", 0) + added, MAX_ANALYZE)
+                )
+            print(f"\n  🔎 {search_report.summary()}")
+
+        # --- ステップ② 本文・コメント取得 ---
+        # (run では全キーワードの検索結果を追加した後に、担当する未取得の行をまとめて取得する)
+        if command in ("run", "fetch"):
+            print(f"\n===== 📝 ステップ② {'本文/コメント更新' if command == 'run' else '本文取得'} =====")
+            with profiler.stage("fetch"):
+                fetch_pending_details(store, with_comments=command == "run", budget=run_budget)
+
+        if command == "comments":
+            print("\n===== 💬 ステップ② コメント取得 =====")
+            with profiler.stage("comments"):
+                fetch_pending_comments(store, budget=run_budget)
+
+        def can_finish(step):
+            # 締め切りを過ぎた場合は、シート全体を扱う終了処理を次回 (または merge) に回す
+            if not finishing:
+                return False
+            if not run_budget.has_time():
+                print(f"\n  ⏱️ 締め切りを過ぎたため、{step}は次回に回します。")
+                return False
+            return True
+
+        # --- 分担実行で重複して追加された記事の削除 (リースを共有できないワーカーの場合) ---
+        if command == "merge" and use_sheets:
+            with profiler.stage("dedupe"):
+                remove_duplicate_rows(gc)
+
+        # --- ステップ③ ソート & 書式設定 ---
+        if command == "sort" or (use_sheets and can_finish("ソート")):
+            with profiler.stage("sort_and_format_sheet"):
+                sort_and_format_sheet(gc)
+
+        # --- ステップ④ Gemini 分析 ---
+        if command in ("run", "analyze"):
+            with profiler.stage("analyze"):
+                analyze_with_gemini_and_update_sheet(store, budget=run_budget)
+
+        # --- ステップ⑤ 分析済み記事のエクスポート ---
+        if command == "export" or can_finish("エクスポート"):
+            with profiler.stage("export"):
+                export_analyzed_rows(store, full=export_full)
+
+        # --- ステップ⑥ 古い記事のアーカイブ ---
+        if command == "archive" or (use_sheets and can_finish("アーカイブ")):
+            with profiler.stage("archive"):
+                archive_old_rows(gc)
+
+        # --- 日別集計の作り直し ---
+        if command == "rollup" or (command == "merge" and merge_rollup and use_sheets):
+            with profiler.stage("rollup"):
+                rebuild_rollup(gc)
+
+        # --- モデル振り分けの検証 ---
+        if command == "route-eval":
+            with profiler.stage("route_eval"):
+                evaluate_routing(sample_path)
+
+        # --- ローカルの保存先から Sheets への反映 ---
+        if command == "push":
+            if use_sheets:
+                print("保存先が SOURCE シートのため、反映は不要です。")
+            else:
+                with profiler.stage("push"):
+                    push_to_sheets(store, gc)
+
+    except KeyboardInterrupt:
+        # 書き込み中だった分は各ステップの finally で書き込み済み。残りは次回に回す
+        print("\n⚠️ 中断されました (Ctrl+C / SIGTERM)。取得・分析済みの分は書き込み済みです。")
+        return 130
+
+    finally:
+        if parse_pool is not None:
+            parse_pool.close()
+        report_selectors()
+        if run_budget and run_budget.limited:
+            run_budget.report()
+        profiler.finish()
 
     end_time = time.time()
     print(f"\n--- 統合スクリプト終了 (所要時間: {end_time - start_time:.2f}秒) ---")
+    return 0
+
+
+def raise_keyboard_interrupt(signum, frame):
+    """
+    SIGTERM (Actions のジョブのタイムアウト・キャンセル) を Ctrl+C と同じく扱い、取得・分析済みの分を書き込んでから終了する。
+    """
+    raise KeyboardInterrupt
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Yahoo!ニュース取得・Gemini分析スクリプト")
+    parser.add_argument(
+        "--profile", nargs="?", const="profile_output", default=None, metavar="DIR",
+        help="ステップごとの cProfile / tracemalloc 結果を DIR に出力する (既定: profile_output)",
+    )
+    parser.add_argument(
+        "--shard", metavar="K/N", default=None,
+        help="N 個のワーカーのうち K 番目として担当分だけを処理する (既定: 環境変数 SHARD)",
+    )
+    parser.add_argument(
+        "--deadline", metavar="DURATION", default=None,
+        help="実行の制限時間 (例: 55m, 1h, 3300s)。各ステップに時間を配分し、残りは次回に回す (既定: 環境変数 RUN_DEADLINE)",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    subparsers.add_parser("run", help="全ステップを順に実行する (既定)")
+    search_parser = subparsers.add_parser("search", help="① ニュースリストを取得して新しい記事を追加する")
+    search_parser.add_argument(
+        "--keyword", action="append", dest="keywords", metavar="KEYWORD",
+        help="検索するキーワード (複数指定可。既定: KEYWORDS_FILE のすべて)",
+    )
+    subparsers.add_parser("fetch", help="② 本文未取得の記事の本文を取得する")
+    subparsers.add_parser("comments", help="② コメント未取得の記事のコメントを取得する")
+    subparsers.add_parser("sort", help="③ SOURCE シートをソート・整形する")
+    subparsers.add_parser("analyze", help="④ 未分析の記事を Gemini で分析する")
+    export_parser = subparsers.add_parser("export", help="⑤ 分析済み記事を EXPORT_DIR に書き出す")
+    export_parser.add_argument(
+        "--full", action="store_true",
+        help="ウォーターマークを無視して分析済みの全行を書き出す",
+    )
+    subparsers.add_parser("archive", help="⑥ 古い記事をアーカイブする")
+    subparsers.add_parser("rollup", help="SOURCE シートとアーカイブ全体から日別集計 (SUMMARY シート) を作り直す")
+    subparsers.add_parser("push", help="ローカルの保存先 (STORAGE_BACKEND=sqlite / csv) の内容を SOURCE シートに反映する")
+    merge_parser = subparsers.add_parser("merge", help="分担実行の後に、重複した記事の削除・ソート・エクスポート・アーカイブをまとめて行う")
+    merge_parser.add_argument(
+        "--rollup", action="store_true", dest="merge_rollup",
+        help="日別集計 (SUMMARY シート) も作り直す (リース無しで分担実行した場合に使う)",
+    )
+    route_eval_parser = subparsers.add_parser(
+        "route-eval", help="ラベル付きサンプルを両方のモデルで分析し、モデルの振り分けを検証する",
+    )
+    route_eval_parser.add_argument(
+        "--sample", required=True, dest="sample_path", metavar="FILE",
+        help="正解ラベル付きのサンプル (JSON Lines: {\"body\": ..., \"sentiment\": ..., ...})",
+    )
+    return parser
 
 
 if __name__ == "__main__":
-    main()
+    signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
+    args = build_arg_parser().parse_args()
+    sys.exit(main(
+        command=args.command or "run",
+        profile_dir=args.profile,
+        keywords=getattr(args, "keywords", None),
+        export_full=getattr(args, "full", False),
+        shard_value=args.shard,
+        merge_rollup=getattr(args, "merge_rollup", False),
+        deadline=args.deadline,
+        sample_path=getattr(args, "sample_path", None),
+    ))
@@ -0,0 +1,207 @@
+"""
+Gemini 分析のモデル振り分け (ルーティング) と、振り分け先ごとの所要時間・費用の記録。
+
+本文の長さと、本文に登場するメーカーの種類数 (ローカルで数える) から振り分け先を決める。
+    fast   : 短く、登場するメーカーが 1 社以下の記事 (速報など)。速く安いモデルで分析する
+    strong : 長い記事、複数のメーカーが登場する記事。精度の高いモデルで分析する
+同じストーリーの記事の確認 (main.py の confirm_story_analysis) は "confirm" として別に記録する。
+費用は応答の usage_metadata のトークン数 (無ければ文字数から見積もった値) と、振り分け先ごとの単価から計算する。
+料金は変わるため単価は持たず、GEMINI_ROUTE_PRICES で指定された振り分け先だけ費用を計算する。
+"""
+import json
+import unicodedata
+
+import gemini_output
+
+ROUTES = ("fast", "strong")
+
+# メーカー名 → 本文中の表記 (NFKC 正規化・小文字化した本文と照合する)
+MANUFACTURERS = {
+    "トヨタ": ["トヨタ", "toyota", "レクサス", "lexus"],
+    "日産": ["日産", "nissan", "ニッサン"],
+    "ホンダ": ["ホンダ", "honda", "本田技研"],
+    "三菱自動車": ["三菱自動車", "三菱自", "mitsubishi motors"],
+    "マツダ": ["マツダ", "mazda"],
+    "スバル": ["スバル", "subaru"],
+    "ダイハツ": ["ダイハツ", "daihatsu"],
+    "スズキ": ["スズキ", "suzuki"],
+    "いすゞ": ["いすゞ", "いすず", "isuzu"],
+    "日野": ["日野自動車", "hino"],
+    "テスラ": ["テスラ", "tesla"],
+    "BYD": ["byd"],
+}
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def article_features(article_body):
+    """
+    振り分けに使う本文の特徴 (文字数と、登場するメーカー名のリスト) を返す。
+    """
+    text = normalize(article_body)
+    makers = [name for name, aliases in MANUFACTURERS.items() if any(alias in text for alias in aliases)]
+    return {"chars": len(article_body or ""), "manufacturers": makers}
+
+
+def choose_route(features, max_chars, max_makers=1):
+    """
+    本文が max_chars 文字以下で、登場するメーカーが max_makers 社以下なら "fast"、それ以外は "strong"。
+    """
+    if features["chars"] <= max_chars and len(features["manufacturers"]) <= max_makers:
+        return "fast"
+    return "strong"
+
+
+def parse_prices(value):
+    """
+    'fast=0.075/0.30,strong=0.5/1.5,confirm=0.075/0.30' 形式の文字列を {振り分け先: (入力, 出力)} の辞書にする。
+    """
+    prices = {}
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        route, _, price = part.partition("=")
+        input_price, _, output_price = price.partition("/")
+        prices[route.strip()] = (float(input_price), float(output_price or 0))
+    return prices
+
+
+def estimate_tokens(text):
+    """
+    usage_metadata が無い場合のトークン数の見積もり (日本語は 1 文字がおおよそ 1 トークン)。
+    """
+    return len(text or "")
+
+
+def usage_tokens(response, prompt):
+    """
+    応答の (入力トークン数, 出力トークン数) を返す。
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None and getattr(usage, "prompt_token_count", None):
+        return usage.prompt_token_count, getattr(usage, "candidates_token_count", 0) or 0
+    return estimate_tokens(prompt), estimate_tokens(getattr(response, "text", ""))
+
+
+class RouteStats:
+    """
+    振り分け先ごとの 記事数 / 呼び出し回数 / 所要時間 / トークン数 / 費用。
+    """
+
+    def __init__(self, prices=None, models=None):
+        self.prices = prices or {}
+        self.models = models or {}
+        self.routes = {}
+
+    def _route(self, route):
+        return self.routes.setdefault(route, {
+            "articles": 0, "calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0,
+        })
+
+    def count_article(self, route):
+        self._route(route)["articles"] += 1
+
+    def record(self, route, seconds, input_tokens, output_tokens):
+        stats = self._route(route)
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+
+    def cost(self, route):
+        """
+        振り分け先の費用 (米ドル)。単価が指定されていなければ None。
+        """
+        if route not in self.prices:
+            return None
+        stats = self.routes.get(route)
+        if not stats:
+            return 0.0
+        input_price, output_price = self.prices[route]
+        return (stats["input_tokens"] * input_price + stats["output_tokens"] * output_price) / 1_000_000
+
+    def as_dict(self):
+        return {
+            route: dict(stats, model=self.models.get(route, ""), cost_usd=self._rounded_cost(route))
+            for route, stats in self.routes.items()
+        }
+
+    def _rounded_cost(self, route):
+        cost = self.cost(route)
+        return None if cost is None else round(cost, 6)
+
+    def summary_lines(self):
+        lines = []
+        for route, stats in self.routes.items():
+            latency = stats["seconds"] / stats["calls"] if stats["calls"] else 0.0
+            cost = self.cost(route)
+            model = self.models.get(route)
+            lines.append(
+                f"{route:<6}{f' ({model})' if model else ''}: 記事 {stats['articles']} 件 / 呼び出し {stats['calls']} 回 / "
+                f"平均 {latency:.2f}秒 / トークン 入力 {stats['input_tokens']:,} 出力 {stats['output_tokens']:,} / "
+                f"費用 {'-' if cost is None else f'${cost:.4f}'}"
+            )
+        return lines
+
+
+def load_labeled_sample(path):
+    """
+    正解ラベル付きのサンプル (JSON Lines、1 行に {"body": 本文, "sentiment": ..., "category": ..., ...}) を読み込む。
+    ラベルは ANALYSIS_KEYS のうち付いているものだけを比べる。
+    """
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            if not sample.get("body"):
+                raise ValueError(f"{path}:{line_number} に body がありません")
+            samples.append(sample)
+    return samples
+
+
+class HitRateReport:
+    """
+    ラベル付きサンプルで、振り分け先 (fast / strong) ごとに各モデルの判定が正解と一致した割合を集計する。
+    fast に振り分けた記事で fast のモデルの一致率が strong のモデルと同程度なら、振り分けは妥当。
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+        # (振り分け先, モデルの振り分け先) → {"samples": 件数, キー: [一致した件数, ラベルの付いた件数]}
+        self.hits = {}
+
+    def add(self, route, model_route, labels, result):
+        counts = self.hits.setdefault((route, model_route), {"samples": 0})
+        counts["samples"] += 1
+        for key in self.keys:
+            if key in labels:
+                hit = gemini_output.comparable_label(result.get(key)) == gemini_output.comparable_label(labels[key])
+                tally = counts.setdefault(key, [0, 0])
+                tally[0] += hit
+                tally[1] += 1
+
+    def rate(self, route, model_route):
+        """
+        (振り分け先, モデル) の全キーを通した一致率。ラベルが無ければ None。
+        """
+        counts = self.hits.get((route, model_route), {})
+        tallies = [counts[key] for key in self.keys if key in counts]
+        labeled = sum(tally[1] for tally in tallies)
+        return sum(tally[0] for tally in tallies) / labeled if labeled else None
+
+    def summary_lines(self):
+        lines = []
+        for (route, model_route), counts in sorted(self.hits.items()):
+            line = f"{route:<6} に振り分けた {counts['samples']} 件を {model_route:<6} のモデルで分析: "
+            rate = self.rate(route, model_route)
+            if rate is None:
+                lines.append(line + "ラベルなし")
+                continue
+            per_key = " / ".join(
+                f"{key} {counts[key][0] / counts[key][1]:.0%}" for key in self.keys if key in counts
+            )
+            lines.append(line + f"一致率 {rate:.0%} ({per_key})")
+        return lines
@@ -0,0 +1,218 @@
+"""
+ステップ単位のプロファイリング (オプトイン)。
+
+環境変数 PROFILE_DIR または main.py の --profile オプションで有効にすると、
+main() の各ステップについて以下のファイルを出力する。
+    <stage>.pstats          cProfile の結果 (snakeviz / pstats で閲覧)
+    <stage>.collapsed.txt   スタックのサンプリング結果 (flamegraph.pl / speedscope 用の collapsed 形式)
+    <stage>.tracemalloc.txt メモリ確保箇所の上位 (ステップ開始時からの増加分)
+    summary.json            ステップごとの所要時間・tracemalloc ピーク・ピーク RSS
+無効時は stage() が何もしないため、通常実行への影響はない。
+"""
+import cProfile
+import contextlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# スタックをサンプリングする間隔 (秒)
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# tracemalloc で保持するスタックの深さ (深くするほど計測のオーバーヘッドが大きい)
+TRACEMALLOC_FRAMES = int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", "1"))
+# tracemalloc.txt に出力する確保箇所の件数
+TOP_ALLOCATIONS = 30
+
+
+def _safe_name(name):
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", name).strip("_") or "stage"
+
+
+def _reset_peak_rss():
+    """
+    Linux では /proc/self/clear_refs に 5 を書き込むとピーク RSS (VmHWM) をリセットできる。
+    リセットできた場合は True を返す。
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _read_peak_rss_kb():
+    """
+    プロセスのピーク RSS (KB) を返す。/proc が無い環境では getrusage にフォールバックする。
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS はバイト単位、Linux は KB 単位
+        return peak // 1024 if sys.platform == "darwin" else peak
+    except Exception:
+        return None
+
+
+class _StackSampler:
+    """
+    別スレッドから対象スレッドのスタックを一定間隔で取得し、collapsed 形式で集計する。
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+
+class _StageRecord:
+    def __init__(self, name):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.samples = Counter()
+        self.allocations = {}
+        self.seconds = 0.0
+        self.calls = 0
+        self.peak_traced_bytes = 0
+        self.peak_rss_kb = None
+        self.rss_is_per_stage = False
+
+
+class StageProfiler:
+    """
+    ステップごとに cProfile・スタックサンプリング・tracemalloc を取得する。
+    output_dir が空の場合は何もしない。
+    同じ名前のステップに複数回入った場合 (キーワードごとのループなど) は結果を合算する。
+    """
+
+    def __init__(self, output_dir=None, sample_interval=SAMPLE_INTERVAL):
+        self.output_dir = output_dir or None
+        self.sample_interval = sample_interval
+        self.records = {}
+        self._active = False
+        if self.enabled:
+            os.makedirs(self.output_dir, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            print(f"🔬 プロファイリングを有効化しました (出力先: {self.output_dir})")
+
+    @property
+    def enabled(self):
+        return self.output_dir is not None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # 無効時、またはステップの入れ子 (外側で計測中) の場合は何もしない
+        if not self.enabled or self._active:
+            yield
+            return
+
+        record = self.records.setdefault(name, _StageRecord(name))
+        self._active = True
+        rss_reset = _reset_peak_rss()
+        tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot()
+        sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+        sampler.start()
+        start = time.perf_counter()
+        record.profile.enable()
+        try:
+            yield
+        finally:
+            record.profile.disable()
+            record.seconds += time.perf_counter() - start
+            record.calls += 1
+            sampler.stop()
+            record.samples.update(sampler.samples)
+
+            _, peak_traced = tracemalloc.get_traced_memory()
+            record.peak_traced_bytes = max(record.peak_traced_bytes, peak_traced)
+            peak_rss = _read_peak_rss_kb()
+            if peak_rss is not None:
+                # リセットできない環境ではプロセス全体のピークになる
+                record.peak_rss_kb = max(record.peak_rss_kb or 0, peak_rss)
+                record.rss_is_per_stage = rss_reset
+
+            snapshot_after = tracemalloc.take_snapshot()
+            for diff in snapshot_after.compare_to(snapshot_before, "traceback"):
+                if diff.size_diff <= 0:
+                    continue
+                key = tuple(str(frame) for frame in diff.traceback)
+                size, count = record.allocations.get(key, (0, 0))
+                record.allocations[key] = (size + diff.size_diff, count + diff.count_diff)
+            self._active = False
+
+    def finish(self):
+        """
+        各ステップの結果をファイルに書き出し、概要を表示する。
+        """
+        if not self.enabled or not self.records:
+            return
+
+        summary = {}
+        for name, record in self.records.items():
+            base = os.path.join(self.output_dir, _safe_name(name))
+            record.profile.dump_stats(f"{base}.pstats")
+
+            with open(f"{base}.collapsed.txt", "w", encoding="utf-8") as f:
+                for stack, count in record.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            with open(f"{base}.tracemalloc.txt", "w", encoding="utf-8") as f:
+                f.write(f"# stage: {name}\n")
+                f.write(f"# peak traced memory: {record.peak_traced_bytes / 1024 / 1024:.1f} MiB\n\n")
+                top = sorted(record.allocations.items(), key=lambda item: item[1][0], reverse=True)
+                for rank, (frames, (size, count)) in enumerate(top[:TOP_ALLOCATIONS], start=1):
+                    f.write(f"#{rank}: {size / 1024:.1f} KiB ({count} blocks)\n")
+                    for frame in frames:
+                        f.write(f"    {frame}\n")
+                    f.write("\n")
+
+            summary[name] = {
+                "seconds": round(record.seconds, 3),
+                "calls": record.calls,
+                "peak_traced_mib": round(record.peak_traced_bytes / 1024 / 1024, 2),
+                "peak_rss_mib": round(record.peak_rss_kb / 1024, 1) if record.peak_rss_kb else None,
+                "peak_rss_per_stage": record.rss_is_per_stage,
+                "samples": sum(record.samples.values()),
+            }
+
+        with open(os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        print(f"\n===== 🔬 プロファイル結果 ({self.output_dir}) =====")
+        for name, item in summary.items():
+            rss = f"{item['peak_rss_mib']:.1f}MiB" if item["peak_rss_mib"] is not None else "不明"
+            print(f"  - {name:<22} {item['seconds']:8.2f}秒  "
+                  f"tracemallocピーク {item['peak_traced_mib']:7.1f}MiB  ピークRSS {rss}")
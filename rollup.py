@@ -0,0 +1,91 @@
+"""
+日別 × company_info × category × sentiment × nissan_sentiment の件数集計 (SUMMARY シート)。
+
+分析ステップで分析した行の分だけ、集計表に差分 (+1 / -1) を反映する。
+各行で集計に使ったキーは SOURCE の rollup_key 列に記録し、再分析されたときは
+前回のキーを -1、新しいキーを +1 することで二重計上を防ぐ。
+"""
+import re
+from collections import Counter
+
+SUMMARY_SHEET = "SUMMARY"
+SUMMARY_HEADERS = ["date", "company", "category", "sentiment", "nissan_sentiment", "count"]
+
+# rollup_key 列の区切り文字
+KEY_SEPARATOR = "|"
+
+
+def normalize_company(company_info):
+    """
+    'トヨタ (UCC 上島珈琲)' → 'トヨタ' のように主要企業名だけを取り出す。
+    """
+    return re.split(r"[（(]", company_info, maxsplit=1)[0].strip()
+
+
+def normalize_label(value):
+    """
+    'ネガティブ（理由：...）' → 'ネガティブ' のように判定ラベルだけを取り出す。
+    """
+    return re.split(r"[（(]", value, maxsplit=1)[0].strip() or "-"
+
+
+def make_rollup_key(date, company_info, category, sentiment, nissan_sentiment):
+    """
+    集計キー 'date|company|category|sentiment|nissan_sentiment' を返す。
+    分析結果が無効 (空・N/A) の行は集計しないため空文字を返す。
+    """
+    if not sentiment or sentiment.startswith("N/A"):
+        return ""
+    parts = [
+        date or "不明",
+        normalize_company(company_info or "") or "不明",
+        (category or "").strip() or "不明",
+        normalize_label(sentiment),
+        normalize_label(nissan_sentiment or "-"),
+    ]
+    return KEY_SEPARATOR.join(part.replace(KEY_SEPARATOR, "/") for part in parts)
+
+
+def read_summary(summary_ws):
+    """
+    SUMMARY シートを読み込み、({キー: 件数}, シート上のデータ行数) を返す。
+    """
+    counts = Counter()
+    rows = summary_ws.get_all_values()[1:]
+    for row in rows:
+        if len(row) < len(SUMMARY_HEADERS) or not row[0]:
+            continue
+        try:
+            counts[KEY_SEPARATOR.join(row[:5])] += int(row[5])
+        except ValueError:
+            continue
+    return counts, len(rows)
+
+
+def write_summary(summary_ws, counts, previous_rows=0):
+    """
+    {キー: 件数} を日付の新しい順に SUMMARY シートへ書き込む。
+    前回より行数が減った場合は、余った行を空文字で上書きする (1 回の更新で済ませる)。
+    """
+    rows = [
+        key.split(KEY_SEPARATOR) + [count]
+        for key, count in counts.items() if count > 0
+    ]
+    rows.sort(key=lambda r: (r[0], r[1], r[2], r[3], r[4]))
+    rows.sort(key=lambda r: r[0], reverse=True)
+    blank_rows = [[""] * len(SUMMARY_HEADERS)] * max(0, previous_rows - len(rows))
+    summary_ws.update('A1', [SUMMARY_HEADERS] + rows + blank_rows, value_input_option='RAW')
+    return len(rows)
+
+
+def apply_rollup_deltas(summary_ws, deltas):
+    """
+    差分 {キー: 増減} を SUMMARY シートに反映する。反映後の集計行数を返す。
+    """
+    deltas = {key: delta for key, delta in deltas.items() if key and delta}
+    if not deltas:
+        return None
+    counts, previous_rows = read_summary(summary_ws)
+    for key, delta in deltas.items():
+        counts[key] += delta
+    return write_summary(summary_ws, counts, previous_rows)
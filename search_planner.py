@@ -0,0 +1,92 @@
+"""
+ステップ① の検索クエリの組み立て。
+
+keywords.txt のキーワードを SEARCH_OR_GROUP_SIZE 個ずつ 'A OR B OR ...' の 1 クエリにまとめ (既定は 1 個 = まとめない)、
+検索結果はタイトルとスニペットに含まれる最初のキーワードをローカルで調べて割り当てる
+(どのキーワードも含まない記事は追加しない)。まとめたクエリの結果はページを送って読み、
+結果が残っているのにキーワード単体の検索 1 ページ分に満たなかったキーワードは、キーワード単体で検索し直す。
+ページ送りと単体検索を合わせて、キーワードごとに検索した場合のリクエスト数を超えない。
+"""
+import unicodedata
+
+KEYWORDS_FILE = "keywords.txt"
+
+# 以前の形式で複数のキーワードを並べた keyword 列の区切り文字
+KEYWORD_SEPARATOR = ","
+
+
+def load_keywords(path=KEYWORDS_FILE):
+    """
+    キーワードファイルを 1 行 1 キーワードで読み込む (空行と '#' で始まる行は無視し、重複は除く)。
+    ファイルが無ければ空のリストを返す。
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+
+    keywords = []
+    for line in lines:
+        keyword = line.strip()
+        if keyword and not keyword.startswith("#") and keyword not in keywords:
+            keywords.append(keyword)
+    return keywords
+
+
+def plan_queries(keywords, group_size):
+    """
+    キーワードを group_size 個ずつのグループに分ける (group_size が 1 以下ならキーワードごと)。
+    """
+    group_size = max(1, group_size)
+    return [keywords[i:i + group_size] for i in range(0, len(keywords), group_size)]
+
+
+def build_query(keywords):
+    """
+    キーワードのグループから検索クエリ文字列を作る。空白を含むキーワードは引用符で囲む。
+    """
+    terms = [f'"{keyword}"' if any(c.isspace() for c in keyword) else keyword for keyword in keywords]
+    return " OR ".join(terms)
+
+
+def _normalize(text):
+    # 全角英数・半角カナの揺れと大文字小文字を吸収する
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def match_keywords(text, keywords):
+    """
+    text (タイトル + スニペット) に含まれるキーワードを keywords の順で返す。
+    """
+    normalized = _normalize(text)
+    return [keyword for keyword in keywords if _normalize(keyword) in normalized]
+
+
+def primary_keyword(value):
+    """
+    keyword 列の値 ('トヨタ,日産' など) から最初のキーワードを返す。
+    """
+    return (value or "").split(KEYWORD_SEPARATOR, 1)[0].strip()
+
+
+class SearchReport:
+    """
+    検索リクエスト数の集計。キーワードごとに検索した場合との差を「節約したリクエスト数」として表示する。
+    """
+
+    def __init__(self, keywords):
+        self.keywords = len(keywords)
+        self.requests = 0
+        self.combined_requests = 0
+        self.fallback_requests = 0
+        self.unattributed = 0
+
+    def saved(self):
+        return self.keywords - self.requests
+
+    def summary(self):
+        return (f"検索リクエスト {self.requests} 回 (キーワードごとの検索 {self.keywords} 回に対して "
+                f"{self.saved()} 回節約 / OR クエリ {self.combined_requests} 回, "
+                f"単体検索へのフォールバック {self.fallback_requests} 回, "
+                f"キーワードを特定できなかった記事 {self.unattributed} 件)")
@@ -0,0 +1,173 @@
+"""
+HTML のセレクタの候補 (カスケード) のうち、前回成功したものを先に試すための記録 (セレクタプロファイル)。
+
+検索結果のコンテナ・タイトル、記事のコメント数などは、Yahoo!ニュースのマークアップの新旧に対応するため
+複数のセレクタを順に試す。失敗したセレクタはそのたびに HTML 全体を探索するため、
+ページの種類 (カスケード名) ごとに成功したセレクタを記録し、次のページではそれを最初に試す。
+最初に試したセレクタが失敗した場合 (ミス) は、残りを元の順に試して成功したものに切り替える。
+ほぼ必ず何かを返す汎用の代替 (リンク全体のテキストなど) は fallbacks に指定し、優先するセレクタにはしない
+(一度でも代替が成功すると、以降は代替が常に「ヒット」して元のセレクタに戻らなくなるため)。
+代替は常に、特定のマークアップに一致するセレクタをすべて試した後に試す。
+
+カスケード名ごとのヒット・ミスの件数は SELECTOR_PROFILE_FILE (JSON) に実行ごとに保存する。
+マークアップが変わると優先するセレクタのミスと切り替えが記録されるため、
+処理が遅くなるだけで気付けない変化を数値で確認できる。
+
+run_cascade は状態を持たないため、解析用のワーカープロセスでも使える
+(ワーカーには SelectorProfile.preferred_map() を渡し、結果の trace を親プロセスで record する)。
+"""
+import json
+import os
+from datetime import datetime
+
+# 保存する実行ごとの履歴の件数
+HISTORY_LIMIT = 30
+
+
+def run_cascade(strategies, preferred=None, fallbacks=()):
+    """
+    strategies ([(ラベル, 引数なしで値を返す関数)]) のうち fallbacks 以外を preferred のラベルを先頭にして順に試し、
+    続けて fallbacks (汎用の代替) を元の順に試して、最初に値 (真となるもの) を返したものの (値, trace) を返す。
+    どれも見つからなければ値は None。
+    trace の outcome は "hit" (preferred が成功) / "miss" (preferred が失敗し他のセレクタが成功) /
+    "cold" (preferred 無し) / "fallback" (代替だけが成功) / "none" (どれも見つからない) のいずれか。
+    """
+    specific = [strategy for strategy in strategies if strategy[0] not in fallbacks]
+    generic = [strategy for strategy in strategies if strategy[0] in fallbacks]
+    known = any(label == preferred for label, _ in specific)
+    if known:
+        specific = sorted(specific, key=lambda strategy: strategy[0] != preferred)
+    for tried, (label, find) in enumerate(specific + generic, 1):
+        value = find()
+        if value:
+            if label in fallbacks:
+                outcome = "fallback"
+            else:
+                outcome = "cold" if not known else "hit" if label == preferred else "miss"
+            return value, {"winner": label, "tried": tried, "outcome": outcome}
+    return None, {"winner": None, "tried": len(strategies), "outcome": "none"}
+
+
+class SelectorProfile:
+    """
+    カスケード名ごとの 優先するセレクタ と、今回の実行のヒット・ミスの件数。path が空なら保存しない。
+    """
+
+    def __init__(self, path=""):
+        self.path = path
+        self.preferred = {}
+        self.history = {}
+        self.stats = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                self.preferred = dict(saved.get("preferred", {}))
+                self.history = dict(saved.get("history", {}))
+            except (OSError, ValueError) as e:
+                print(f"  ⚠️ セレクタプロファイル ({path}) を読み込めないため、最初から記録します: {e}")
+
+    def preferred_map(self):
+        """
+        ワーカープロセスに渡す {カスケード名: 優先するセレクタのラベル}。
+        """
+        return dict(self.preferred)
+
+    def record(self, cascade, trace):
+        """
+        run_cascade の trace を集計し、別のセレクタが成功した場合は次からそれを優先する (代替は優先しない)。
+        """
+        stats = self.stats.setdefault(cascade, {
+            "calls": 0, "hit": 0, "miss": 0, "cold": 0, "fallback": 0, "none": 0, "tried": 0,
+            "switches": [], "winners": {},
+        })
+        stats["calls"] += 1
+        stats[trace["outcome"]] += 1
+        stats["tried"] += trace["tried"]
+        winner = trace["winner"]
+        if winner:
+            stats["winners"][winner] = stats["winners"].get(winner, 0) + 1
+        if winner and trace["outcome"] != "fallback":
+            previous = self.preferred.get(cascade)
+            if previous != winner:
+                if previous:
+                    stats["switches"].append([previous, winner])
+                self.preferred[cascade] = winner
+
+    def run(self, cascade, strategies, fallbacks=()):
+        """
+        同じプロセス内でカスケードを試し、結果を記録して値を返す。
+        """
+        value, trace = run_cascade(strategies, self.preferred.get(cascade), fallbacks)
+        self.record(cascade, trace)
+        return value
+
+    @staticmethod
+    def miss_rate(stats):
+        """
+        優先するセレクタを試した回数のうち、失敗した割合。試していなければ None。
+        """
+        checked = stats["hit"] + stats["miss"]
+        return stats["miss"] / checked if checked else None
+
+    def summary_lines(self):
+        lines = []
+        for cascade, stats in sorted(self.stats.items()):
+            rate = self.miss_rate(stats)
+            lines.append(
+                f"{cascade:<22} {stats['calls']} 回 / ヒット {stats['hit']} / ミス {stats['miss']}"
+                f"{f' ({rate:.0%})' if rate is not None else ''} / 初回 {stats['cold']} / 代替 {stats['fallback']} / "
+                f"該当なし {stats['none']} / "
+                f"切り替え {len(stats['switches'])} 回 / "
+                f"試したセレクタ {stats['tried'] / stats['calls']:.2f} 個/回 / 優先: {self.preferred.get(cascade, '-')}"
+            )
+        return lines
+
+    def alerts(self, threshold, min_calls=5):
+        """
+        マークアップが変わった可能性があるカスケードの警告文のリスト。
+        優先するセレクタが切り替わった場合と、ミス率が threshold 以上の場合 (新旧のマークアップが混在している)、
+        代替だけが成功した割合が threshold 以上の場合 (どのセレクタも一致しなくなった) に警告する。
+        """
+        messages = []
+        for cascade, stats in sorted(self.stats.items()):
+            rate = self.miss_rate(stats)
+            if stats["switches"]:
+                changes = ", ".join(f"{previous} → {winner}" for previous, winner in stats["switches"])
+                messages.append(
+                    f"{cascade} の優先セレクタが切り替わりました ({changes})。"
+                    f"Yahoo!ニュースのマークアップが変わった可能性があります。"
+                )
+            elif rate is not None and stats["hit"] + stats["miss"] >= min_calls and rate >= threshold:
+                messages.append(
+                    f"{cascade} のミス率が {rate:.0%} です "
+                    f"({', '.join(f'{label} {count} 回' for label, count in stats['winners'].items())})。"
+                    f"新旧のマークアップが混在している可能性があります。"
+                )
+            if stats["calls"] >= min_calls and stats["fallback"] / stats["calls"] >= threshold:
+                messages.append(
+                    f"{cascade} の {stats['fallback'] / stats['calls']:.0%} が代替のセレクタでしか見つかりませんでした "
+                    f"({', '.join(f'{label} {count} 回' for label, count in stats['winners'].items())})。"
+                    f"Yahoo!ニュースのマークアップが変わった可能性があります。"
+                )
+        return messages
+
+    def save(self):
+        """
+        優先するセレクタと、今回の実行の集計を履歴に加えて保存する。
+        """
+        if not self.path or not self.stats:
+            return
+        now = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+        for cascade, stats in self.stats.items():
+            entry = {key: value for key, value in stats.items() if key != "winners"}
+            entry["at"] = now
+            entry["miss_rate"] = self.miss_rate(stats)
+            self.history[cascade] = (self.history.get(cascade, []) + [entry])[-HISTORY_LIMIT:]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"preferred": self.preferred, "history": self.history}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
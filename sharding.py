@@ -0,0 +1,267 @@
+"""
+複数ワーカーでの分担実行 (シャーディング) とリース。
+
+各ワーカーは --shard K/N (または環境変数 SHARD) で自分の担当を決める。
+    検索 (ステップ①)        : キーワードのグループを N 個に分け、K 番目を担当する
+    本文取得・分析 (②④)    : SHARD_MODE=hash なら記事IDのハッシュ、keyword なら行の keyword 列で行を分ける
+                              (keyword では、行のキーワードを検索したワーカーがその行も担当する)
+担当の重複や、前回の実行が終わっていないうちに次の実行が始まった場合に備えて、
+行を取得・分析する前にリース (有効期限付きのロック) を取る。取れなかった行は他のワーカーに任せる。
+
+    SQLiteLeaseStore : SQLite ファイル (LEASE_STORE=sqlite:<パス>)
+    FileLeaseStore   : ディレクトリ内のファイル (LEASE_STORE=file:<ディレクトリ>)
+どちらもワーカー同士が同じファイルシステムを共有している場合に使う。
+"""
+import abc
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+SHARD_MODES = ("hash", "keyword")
+
+
+def stable_hash(value):
+    """
+    プロセスや実行ごとに変わらないハッシュ値 (Python の hash() は実行ごとに変わるため使わない)。
+    """
+    return int(hashlib.sha1(value.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class ShardSpec:
+    """
+    ワーカーの担当 (N 個中 K 番目、K は 1 始まり) と行の分け方。
+    """
+
+    def __init__(self, index, count, mode="hash", groups=()):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"シャードの指定が不正です: {index}/{count}")
+        if mode not in SHARD_MODES:
+            raise ValueError(f"SHARD_MODE は {' / '.join(SHARD_MODES)} のいずれかです: {mode}")
+        self.index = index
+        self.count = count
+        self.mode = mode
+        # keyword モードでの キーワード → 検索クエリのグループ番号
+        self.group_of = {keyword: position for position, group in enumerate(groups) for keyword in group}
+
+    def __str__(self):
+        return f"{self.index}/{self.count} ({self.mode})"
+
+    def _slot(self, position):
+        return position % self.count == self.index - 1
+
+    def take_groups(self, groups):
+        """
+        検索クエリのグループのうち、このワーカーが担当するものを返す。
+        """
+        return [group for position, group in enumerate(groups) if self._slot(position)]
+
+    def where_columns(self):
+        """
+        owns() の判定に必要な列 (URL 以外)。
+        """
+        return ["keyword"] if self.mode == "keyword" else []
+
+    def owns(self, row, primary_keyword):
+        """
+        行 ({列名: 値}) をこのワーカーが担当するか。primary_keyword は keyword 列から最初のキーワードを取り出す関数。
+        """
+        if self.mode == "keyword":
+            keyword = primary_keyword(row["keyword"])
+            if keyword in self.group_of:
+                return self._slot(self.group_of[keyword])
+            return self._slot(stable_hash(keyword))
+        return self._slot(stable_hash(row["URL"].rstrip("/").split("/")[-1]))
+
+
+def parse_shard(value, mode="hash", groups=()):
+    """
+    'K/N' 形式の文字列から ShardSpec を作る。空なら None (分担しない)。
+    groups は検索クエリのグループ (keyword モードで行の担当を決めるのに使う)。
+    """
+    if not value:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/", 1))
+    except ValueError:
+        raise ValueError(f"シャードは 'K/N' (例: 1/4) の形式で指定してください: {value}")
+    return ShardSpec(index, count, mode, groups)
+
+
+class LeaseStore(abc.ABC):
+    """
+    リースの保存先の共通インターフェース。リースはキーごとに 1 人の持ち主と有効期限を持つ。
+    """
+    name = ""
+
+    @abc.abstractmethod
+    def acquire(self, keys, owner, ttl):
+        """
+        keys のうち、リースが無い・期限切れ・自分が持ち主のものを owner のリースにして、取れたキーのセットを返す。
+        """
+
+    @abc.abstractmethod
+    def release(self, keys, owner):
+        """
+        owner が持っている keys のリースを解放する。
+        """
+
+    @abc.abstractmethod
+    def purge_expired(self):
+        """
+        期限切れのリースを削除し、削除した件数を返す。
+        """
+
+    @contextlib.contextmanager
+    def lock(self, key, owner, ttl, wait=60, interval=1):
+        """
+        1 つのキーのリースを排他ロックとして使う。wait 秒待っても取れなければ False を渡す。
+        """
+        deadline = time.time() + wait
+        acquired = bool(self.acquire([key], owner, ttl))
+        while not acquired and time.time() < deadline:
+            time.sleep(interval)
+            acquired = bool(self.acquire([key], owner, ttl))
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release([key], owner)
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """
+    SQLite ファイルのリース表。取得はトランザクション内で行うため、複数のプロセスから同時に使える。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = f"SQLite ({path})"
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def acquire(self, keys, owner, ttl):
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return set()
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+                [(key, owner, now + ttl, now) for key in keys],
+            )
+            acquired = set()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                acquired.update(row[0] for row in self.conn.execute(
+                    f"SELECT key FROM leases WHERE owner = ? AND key IN ({', '.join('?' for _ in chunk)})",
+                    [owner] + chunk,
+                ))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return acquired
+
+    def release(self, keys, owner):
+        self.conn.executemany(
+            "DELETE FROM leases WHERE key = ? AND owner = ?", [(key, owner) for key in keys]
+        )
+
+    def purge_expired(self):
+        return self.conn.execute("DELETE FROM leases WHERE expires_at < ?", (time.time(),)).rowcount
+
+
+class FileLeaseStore(LeaseStore):
+    """
+    ディレクトリ内にキーごとのファイル (持ち主と有効期限の JSON) を置くリース。
+    取得・解放はディレクトリ全体のロックファイル (fcntl.flock) で排他する。
+    """
+
+    def __init__(self, directory):
+        import fcntl  # POSIX のみ (Windows では SQLiteLeaseStore を使う)
+        self._fcntl = fcntl
+        self.directory = directory
+        self.name = f"ファイル ({directory})"
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lease")
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            self._fcntl.flock(lock_file, self._fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(lock_file, self._fcntl.LOCK_UN)
+
+    def acquire(self, keys, owner, ttl):
+        now = time.time()
+        acquired = set()
+        with self._locked():
+            for key in dict.fromkeys(keys):
+                path = self._path(key)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        lease = json.load(f)
+                    if lease["owner"] != owner and lease["expires_at"] >= now:
+                        continue
+                except (OSError, ValueError, KeyError):
+                    pass
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump({"key": key, "owner": owner, "expires_at": now + ttl}, f)
+                acquired.add(key)
+        return acquired
+
+    def release(self, keys, owner):
+        with self._locked():
+            for key in keys:
+                path = self._path(key)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        if json.load(f).get("owner") != owner:
+                            continue
+                    os.remove(path)
+                except (OSError, ValueError):
+                    continue
+
+    def purge_expired(self):
+        now = time.time()
+        purged = 0
+        with self._locked():
+            for name in os.listdir(self.directory):
+                if not name.endswith(".lease"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        expired = json.load(f).get("expires_at", 0) < now
+                    if expired:
+                        os.remove(path)
+                        purged += 1
+                except (OSError, ValueError):
+                    continue
+        return purged
+
+
+def open_lease_store(spec):
+    """
+    'sqlite:<パス>' / 'file:<ディレクトリ>' からリースの保存先を作る。空なら None (リースを使わない)。
+    """
+    if not spec:
+        return None
+    kind, _, path = spec.partition(":")
+    if kind == "sqlite" and path:
+        return SQLiteLeaseStore(path)
+    if kind == "file" and path:
+        return FileLeaseStore(path)
+    raise ValueError(f"LEASE_STORE は 'sqlite:<パス>' または 'file:<ディレクトリ>' の形式で指定してください: {spec}")
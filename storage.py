@@ -0,0 +1,616 @@
+"""
+SOURCE データ (記事 1 件 = 1 行) の保存先。
+
+各ステップは保存先を次の 4 つの操作だけで扱う。
+    ids / exists : 記事IDによる存在チェック
+    append       : 記事の追加
+    select       : 条件に合う行の選択 (判定に使う列を先に読み、合致した行だけ残りの列を読む)
+    update       : 行の一部の列の一括更新
+行は {列名: 文字列} の辞書で扱い、select が返す key を update に渡す
+(key は記事ID)。
+
+    SheetsStore : Google スプレッドシートの SOURCE シート (既定)
+    SQLiteStore : ローカルの SQLite ファイル
+    CSVStore    : ローカルの CSV ファイル
+大量の取得・分析はローカルの保存先で行い、表示用に Sheets へ反映する (main.py push) こともできる。
+"""
+import abc
+import csv
+import os
+import re
+import sqlite3
+import tempfile
+
+# シートを読み込む際の 1 回あたりの行数 (この行数ずつ範囲指定で読み込む)
+SHEET_READ_WINDOW = int(os.environ.get("SHEET_READ_WINDOW", "1000"))
+
+# 読み込み時に 1 つの範囲にまとめる列の隙間 (この列数以下の隙間は範囲を分けずに読む)
+READ_SPAN_MAX_GAP = 2
+
+
+def extract_article_id(article_url):
+    """
+    記事URLから記事ID (/articles/ の後ろの16進文字列) を取り出す。見つからなければ None。
+    """
+    match = re.search(r"/articles/([a-f0-9]+)", article_url)
+    return match.group(1) if match else None
+
+
+def article_key(article_url):
+    """
+    保存先で記事を識別するID。記事IDが取れない URL は URL そのものを使う。
+    """
+    return extract_article_id(article_url) or article_url
+
+
+# --- Sheets の範囲指定のヘルパー ---
+
+def column_letter(col):
+    """
+    1 始まりの列番号を列記号 (A, B, ..., Z, AA, ...) に変換する。
+    """
+    letters = ""
+    while col > 0:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def row_range(row_index, first_col, last_col):
+    """
+    1 行分の更新範囲 (例: 'G5:P5') を返す。列番号は 1 始まり。
+    """
+    return f"{column_letter(first_col)}{row_index}:{column_letter(last_col)}{row_index}"
+
+
+def column_spans(cols, max_gap=0):
+    """
+    列番号の一覧を連続した範囲 [(最初の列, 最後の列), ...] にまとめる。
+    max_gap 列以下の隙間は 1 つの範囲にまとめる (読み込み用。書き込みでは 0 にする)。
+    """
+    spans = []
+    for col in sorted(set(cols)):
+        if spans and col - spans[-1][1] - 1 <= max_gap:
+            spans[-1][1] = col
+        else:
+            spans.append([col, col])
+    return [tuple(span) for span in spans]
+
+
+def iter_sheet_rows(ws, last_col, predicate=None, window=None, start_row=2, extra_cols=()):
+    """
+    シートを window 行ずつ範囲指定で読み込み、(行番号, 行データ) を順に返すジェネレーター。
+    A列 から last_col 列 (1 始まり) までだけを読み込み、行データは last_col 列分に揃える。
+    extra_cols に列番号を渡すと、その列も同じ API 呼び出しで読み込み、行データの末尾に順に追加する
+    (離れた列を見たいときに、間の本文・コメント列を読まずに済む)。
+    predicate を渡すと、条件に合わない行はその場で捨てる (シート全体を保持しない)。
+    A列〜last_col 列の読み込み行数が window 未満になった時点でデータの終端とみなす。
+    """
+    window = window or SHEET_READ_WINDOW
+    last_letter = column_letter(last_col)
+    start = start_row
+    while True:
+        end = start + window - 1
+        main_range = f"A{start}:{last_letter}{end}"
+        if extra_cols:
+            value_ranges = ws.batch_get([main_range] + [
+                f"{column_letter(col)}{start}:{column_letter(col)}{end}" for col in extra_cols
+            ])
+            values, extras = value_ranges[0], value_ranges[1:]
+        else:
+            values, extras = ws.get(main_range), []
+        for offset, row in enumerate(values):
+            if len(row) < last_col:
+                row = row + [""] * (last_col - len(row))
+            for extra in extras:
+                cell = extra[offset] if offset < len(extra) else []
+                row = row + [cell[0] if cell else ""]
+            if predicate is None or predicate(row):
+                yield start + offset, row
+        if len(values) < window:
+            return
+        start = end + 1
+
+
+def load_row_spans(ws, row_indices, spans, chunk_size=500):
+    """
+    指定した行について、列の範囲 spans [(最初の列, 最後の列), ...] (1 始まり) のセルをまとめて読み込み、
+    {行番号: {列番号: 値}} を返す。空セルは空文字になる。
+    batch_get 1 回あたりの範囲数は chunk_size までに分割する。
+    """
+    cells = {row_index: {} for row_index in row_indices}
+    requests = [(row_index, span) for row_index in row_indices for span in spans]
+    for chunk_start in range(0, len(requests), chunk_size):
+        chunk = requests[chunk_start:chunk_start + chunk_size]
+        value_ranges = ws.batch_get([row_range(row_index, first, last) for row_index, (first, last) in chunk])
+        for (row_index, (first, last)), values in zip(chunk, value_ranges):
+            row = values[0] if values else []
+            for col in range(first, last + 1):
+                offset = col - first
+                cells[row_index][col] = row[offset] if offset < len(row) else ""
+    return cells
+
+
+def _cell_text(value):
+    return "" if value is None else str(value)
+
+
+class SourceStore(abc.ABC):
+    """
+    SOURCE データの保存先の共通インターフェース。
+    """
+    # ログに表示する保存先の名前
+    name = ""
+    # Sheets の場合だけ gspread の Spreadsheet (日別集計・アーカイブ索引に使う)
+    spreadsheet = None
+
+    def __init__(self, headers):
+        self.headers = list(headers)
+
+    def label(self, key):
+        """
+        ログに表示する行の呼び名。
+        """
+        return f"記事 {key}"
+
+    @abc.abstractmethod
+    def ensure_headers(self):
+        """
+        列 (ヘッダー) が headers と一致するよう整える。成功したら True。
+        """
+
+    @abc.abstractmethod
+    def missing_columns(self, names):
+        """
+        保存先に無い列名の一覧を返す。
+        """
+
+    @abc.abstractmethod
+    def ids(self):
+        """
+        保存されている記事IDのセットを返す。
+        """
+
+    def exists(self, article_id):
+        return article_id in self.ids()
+
+    @abc.abstractmethod
+    def append(self, records):
+        """
+        記事 ({列名: 値} の辞書) を追加し、追加した件数を返す。既にある記事IDは追加しない。
+        """
+
+    @abc.abstractmethod
+    def select(self, where_columns, predicate=None, columns=(), limit=None):
+        """
+        where_columns の値 (と URL) を {列名: 値} の辞書として predicate に渡し、
+        True になった行について columns の値も読み込んで (key, 行の辞書) を順に返す。
+        limit を指定すると、その件数に達した時点で打ち切る。
+        """
+
+    @abc.abstractmethod
+    def update(self, updates):
+        """
+        [(key, {列名: 値}), ...] の各行の指定した列だけをまとめて書き換え、更新した行数を返す。
+        """
+
+
+class SheetsStore(SourceStore):
+    """
+    Google スプレッドシートの SOURCE シート。
+    select は URL 列と判定に使う列だけを window 行ずつ読み、合致した行の残りの列をまとめて読み込む。
+    update は行ごとに連続した列を 1 つの範囲にまとめ、1 回の batch_update で書き込む。
+    key は記事IDで、select で読んだ行番号を覚えておく。update は書き込む直前に対象の行の URL を読み直し、
+    並べ替え (sort) や行の削除 (archive) で行が移動していれば URL 列から行番号を引き直す
+    (見つからない記事の更新は捨てる)。
+    """
+    name = "SOURCEシート"
+
+    def __init__(self, ws, headers):
+        super().__init__(headers)
+        self.ws = ws
+        self.spreadsheet = ws.spreadsheet
+        self._columns = None
+        # 記事ID → select で読んだ時点の (行番号, URL)
+        self._rows = {}
+
+    def label(self, key):
+        row_index = self._rows.get(key, (None, None))[0]
+        return f"行 {row_index}" if row_index else f"記事 {key}"
+
+    def _column_map(self):
+        # シート上の実際のヘッダー (列名 → 1 始まりの列番号)
+        if self._columns is None:
+            self._columns = {name: i + 1 for i, name in enumerate(self.ws.row_values(1)) if name}
+        return self._columns
+
+    def ensure_headers(self):
+        from gspread.exceptions import APIError
+
+        print("  ヘッダー行（1行目）の整合性を確認中...")
+        self._columns = None
+        try:
+            current_headers = self.ws.row_values(1)
+        except APIError as e:
+            print(f"  シートが空のようです (エラー: {e})。")
+            current_headers = []
+        except Exception as e:
+            print(f"  ヘッダー行の読み取りに失敗: {e}")
+            current_headers = []
+
+        if current_headers == self.headers:
+            print("  ✅ ヘッダー行は正常です。")
+            return True
+
+        print("  ヘッダー行が不足または不整合です。1行目にヘッダーを自動設定します...")
+        try:
+            self.ws.update('A1', [self.headers], value_input_option='RAW')
+            print("  ✅ ヘッダー行を更新しました。")
+            return True
+        except Exception as e:
+            print(f"  ❌ ヘッダー行の設定に失敗しました: {e}")
+            return False
+
+    def missing_columns(self, names):
+        columns = self._column_map()
+        return [name for name in names if name not in columns]
+
+    def ids(self):
+        urls = self.ws.col_values(self._column_map()["URL"])[1:]
+        return {article_key(url) for url in urls if url}
+
+    def append(self, records):
+        if not records:
+            return 0
+        columns = self._column_map()
+        # 値のある最後の列までだけを書き込む
+        width = max(
+            columns[name] for record in records for name, value in record.items() if _cell_text(value)
+        )
+        by_position = {position: name for name, position in columns.items()}
+        rows = [
+            [_cell_text(record.get(by_position.get(position))) for position in range(1, width + 1)]
+            for record in records
+        ]
+        self.ws.append_rows(rows, value_input_option="USER_ENTERED")
+        return len(rows)
+
+    def select(self, where_columns, predicate=None, columns=(), limit=None, window=None):
+        col = self._column_map()
+        scan_names = list(dict.fromkeys(["URL"] + list(where_columns)))
+        if predicate is None:
+            # 絞り込まない場合は最初から全部の列を読む
+            scan_names = list(dict.fromkeys(scan_names + list(columns)))
+        rest_names = [name for name in dict.fromkeys(columns) if name not in scan_names]
+        scan_spans = column_spans([col[name] for name in scan_names], READ_SPAN_MAX_GAP)
+        rest_spans = column_spans([col[name] for name in rest_names], READ_SPAN_MAX_GAP)
+        # URL 列を含む範囲の読み込み行数でデータの終端を判定する
+        url_span = next(i for i, (first, last) in enumerate(scan_spans) if first <= col["URL"] <= last)
+
+        window = window or SHEET_READ_WINDOW
+        found = 0
+        start = 2
+        # URL のある最後の行。window の末尾が URL の空いた行で終わると読み込み行数が window 未満になるため、
+        # そのときだけ URL 列から求め、まだ先に行があれば読み続ける
+        last_row = None
+        while True:
+            end = start + window - 1
+            value_ranges = self.ws.batch_get([
+                f"{column_letter(first)}{start}:{column_letter(last)}{end}" for first, last in scan_spans
+            ])
+            rows_read = len(value_ranges[url_span])
+
+            matches = []
+            for offset in range(rows_read):
+                record = {}
+                for (first, last), values in zip(scan_spans, value_ranges):
+                    row = values[offset] if offset < len(values) else []
+                    for name in scan_names:
+                        position = col[name] - first
+                        if 0 <= position <= last - first:
+                            record[name] = row[position] if position < len(row) else ""
+                if not record["URL"]:
+                    continue
+                if predicate is None or predicate(record):
+                    matches.append((start + offset, record))
+                    if limit and found + len(matches) >= limit:
+                        break
+
+            # 合致した行だけ、残りの列をまとめて読み込む
+            if matches and rest_spans:
+                cells = load_row_spans(self.ws, [row_index for row_index, _ in matches], rest_spans)
+                for row_index, record in matches:
+                    for name in rest_names:
+                        record[name] = cells[row_index][col[name]]
+
+            for row_index, record in matches:
+                key = article_key(record["URL"])
+                self._rows[key] = (row_index, record["URL"])
+                yield key, record
+            found += len(matches)
+            if limit and found >= limit:
+                return
+            if rows_read < window:
+                if last_row is None:
+                    last_row = len(self.ws.col_values(col["URL"]))
+                if end >= last_row:
+                    return
+            start = end + 1
+
+    def _resolve_rows(self, keys):
+        """
+        keys の記事の今の行番号 {記事ID: 行番号} を返す。select で読んだ行の URL が変わっていれば
+        (読み込み後に並べ替え・行の削除があった)、URL 列全体から行番号を引き直す。見つからない記事は含めない。
+        """
+        url_col = self._column_map()["URL"]
+        known = {key: self._rows[key] for key in keys if key in self._rows}
+        current = load_row_spans(self.ws, sorted({row_index for row_index, _ in known.values()}), [(url_col, url_col)])
+        moved = [key for key, (row_index, url) in known.items() if current[row_index][url_col] != url]
+        unknown = [key for key in keys if key not in known]
+        rows = {key: row_index for key, (row_index, _) in known.items() if key not in moved}
+        if not moved and not unknown:
+            return rows
+
+        if moved:
+            print(f"  ⚠️ 読み込み後に {len(moved)} 行が移動していたため、URL から行番号を引き直して書き込みます。")
+        positions = {}
+        for row_index, url in enumerate(self.ws.col_values(url_col)[1:], start=2):
+            if url:
+                positions.setdefault(article_key(url), (row_index, url))
+        for key in moved + unknown:
+            if key not in positions:
+                print(f"  ⚠️ {self.label(key)} ({key}) がシートに見つからないため (アーカイブ済みなど)、書き込みを省略します。")
+                self._rows.pop(key, None)
+                continue
+            self._rows[key] = positions[key]
+            rows[key] = positions[key][0]
+        return rows
+
+    def update(self, updates, value_input_option="USER_ENTERED"):
+        col = self._column_map()
+        rows = self._resolve_rows([key for key, _ in updates])
+        data = []
+        written = 0
+        for key, values in updates:
+            if key not in rows:
+                continue
+            row_index = rows[key]
+            written += 1
+            by_position = {col[name]: value for name, value in values.items()}
+            for first, last in column_spans(by_position):
+                data.append({
+                    'range': row_range(row_index, first, last),
+                    'values': [[by_position[position] for position in range(first, last + 1)]]
+                })
+        if data:
+            self.ws.batch_update(data, value_input_option=value_input_option)
+        return written
+
+
+class SQLiteStore(SourceStore):
+    """
+    ローカルの SQLite ファイル。テーブルは記事IDを主キーとし、列はすべて文字列で保持する。
+    """
+
+    def __init__(self, path, headers, table="source"):
+        super().__init__(headers)
+        self.path = path
+        self.table = table
+        self.name = f"SQLite ({path})"
+        # 分担実行では複数のプロセスが同じファイルに書き込むため、ロックの解放を待つ
+        self.conn = sqlite3.connect(path, timeout=30)
+
+    @staticmethod
+    def _quote(name):
+        return '"' + name.replace('"', '""') + '"'
+
+    def _table_columns(self):
+        return [row[1] for row in self.conn.execute(f"PRAGMA table_info({self._quote(self.table)})")]
+
+    def ensure_headers(self):
+        print(f"  {self.name} のテーブル定義を確認中...")
+        try:
+            existing = self._table_columns()
+            if not existing:
+                columns = ", ".join(f"{self._quote(name)} TEXT NOT NULL DEFAULT ''" for name in self.headers)
+                self.conn.execute(
+                    f"CREATE TABLE {self._quote(self.table)} (article_id TEXT PRIMARY KEY, {columns})"
+                )
+                print(f"  ✅ テーブル '{self.table}' を作成しました。")
+            else:
+                missing = [name for name in self.headers if name not in existing]
+                for name in missing:
+                    self.conn.execute(
+                        f"ALTER TABLE {self._quote(self.table)} ADD COLUMN {self._quote(name)} TEXT NOT NULL DEFAULT ''"
+                    )
+                if missing:
+                    print(f"  ✅ 列を追加しました: {', '.join(missing)}")
+                else:
+                    print("  ✅ テーブル定義は正常です。")
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"  ❌ テーブル定義の設定に失敗しました: {e}")
+            return False
+
+    def missing_columns(self, names):
+        existing = set(self._table_columns())
+        return [name for name in names if name not in existing]
+
+    def ids(self):
+        return {row[0] for row in self.conn.execute(f"SELECT article_id FROM {self._quote(self.table)}")}
+
+    def exists(self, article_id):
+        row = self.conn.execute(
+            f"SELECT 1 FROM {self._quote(self.table)} WHERE article_id = ? LIMIT 1", (article_id,)
+        ).fetchone()
+        return row is not None
+
+    def append(self, records):
+        if not records:
+            return 0
+        before = self.conn.total_changes
+        names = list(dict.fromkeys(name for record in records for name in record))
+        sql = (f"INSERT OR IGNORE INTO {self._quote(self.table)} "
+               f"(article_id, {', '.join(self._quote(name) for name in names)}) "
+               f"VALUES (?, {', '.join('?' for _ in names)})")
+        self.conn.executemany(sql, [
+            [article_key(record["URL"])] + [_cell_text(record.get(name)) for name in names]
+            for record in records
+        ])
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def select(self, where_columns, predicate=None, columns=(), limit=None, window=1000):
+        names = list(dict.fromkeys(["URL"] + list(where_columns) + list(columns)))
+        sql = (f"SELECT rowid, article_id, {', '.join(self._quote(name) for name in names)} "
+               f"FROM {self._quote(self.table)} WHERE rowid > ? ORDER BY rowid LIMIT ?")
+        found = 0
+        last_rowid = 0
+        while True:
+            rows = self.conn.execute(sql, (last_rowid, window)).fetchall()
+            for row in rows:
+                record = dict(zip(names, row[2:]))
+                if predicate is None or predicate({name: record[name] for name in ["URL"] + list(where_columns)}):
+                    yield row[1], record
+                    found += 1
+                    if limit and found >= limit:
+                        return
+            if len(rows) < window:
+                return
+            last_rowid = rows[-1][0]
+
+    def update(self, updates):
+        # 更新する列の組み合わせごとにまとめて実行する
+        groups = {}
+        for article_id, values in updates:
+            names = tuple(values)
+            groups.setdefault(names, []).append(
+                [_cell_text(values[name]) for name in names] + [article_id]
+            )
+        updated = 0
+        for names, params in groups.items():
+            assignments = ", ".join(f"{self._quote(name)} = ?" for name in names)
+            updated += self.conn.executemany(
+                f"UPDATE {self._quote(self.table)} SET {assignments} WHERE article_id = ?", params
+            ).rowcount
+        self.conn.commit()
+        return updated
+
+
+class CSVStore(SourceStore):
+    """
+    ローカルの CSV ファイル (1 行目がヘッダー)。読み込み時にファイル全体をメモリに載せ、
+    追加はファイル末尾への追記、更新はファイル全体の書き直し (一時ファイル経由) で反映する。
+    """
+
+    def __init__(self, path, headers):
+        super().__init__(headers)
+        self.path = path
+        self.name = f"CSV ({path})"
+        self._records = None
+        self._index = None
+        self._file_headers = None
+
+    def _load(self):
+        if self._records is not None:
+            return
+        self._records = []
+        self._index = {}
+        self._file_headers = []
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            self._file_headers = next(reader, [])
+            for row in reader:
+                record = {name: row[i] if i < len(row) else "" for i, name in enumerate(self._file_headers)}
+                if not record.get("URL"):
+                    continue
+                self._index[article_key(record["URL"])] = len(self._records)
+                self._records.append(record)
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(self._file_headers)
+                for record in self._records:
+                    writer.writerow([record.get(name, "") for name in self._file_headers])
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def ensure_headers(self):
+        print(f"  {self.name} のヘッダーを確認中...")
+        try:
+            self._load()
+            if self._file_headers == self.headers:
+                print("  ✅ ヘッダー行は正常です。")
+                return True
+            # 既存の値は列名で引き継ぎ、ヘッダーを揃えて書き直す
+            self._file_headers = list(self.headers)
+            self._save()
+            print("  ✅ ヘッダー行を更新しました。")
+            return True
+        except OSError as e:
+            print(f"  ❌ ヘッダー行の設定に失敗しました: {e}")
+            return False
+
+    def missing_columns(self, names):
+        self._load()
+        return [name for name in names if name not in self._file_headers]
+
+    def ids(self):
+        self._load()
+        return set(self._index)
+
+    def exists(self, article_id):
+        self._load()
+        return article_id in self._index
+
+    def append(self, records):
+        self._load()
+        added = []
+        for record in records:
+            key = article_key(record["URL"])
+            if key in self._index:
+                continue
+            record = {name: _cell_text(record.get(name)) for name in self._file_headers}
+            self._index[key] = len(self._records)
+            self._records.append(record)
+            added.append(record)
+        if added:
+            with open(self.path, "a", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerows([[record[name] for name in self._file_headers] for record in added])
+        return len(added)
+
+    def select(self, where_columns, predicate=None, columns=(), limit=None):
+        self._load()
+        names = list(dict.fromkeys(["URL"] + list(where_columns) + list(columns)))
+        found = 0
+        for record in list(self._records):
+            if predicate is None or predicate({name: record.get(name, "") for name in ["URL"] + list(where_columns)}):
+                yield article_key(record["URL"]), {name: record.get(name, "") for name in names}
+                found += 1
+                if limit and found >= limit:
+                    return
+
+    def update(self, updates):
+        self._load()
+        updated = 0
+        for article_id, values in updates:
+            # 見つからない記事 (archive 済みなど) の更新は捨てる
+            if article_id not in self._index:
+                continue
+            record = self._records[self._index[article_id]]
+            record.update({name: _cell_text(value) for name, value in values.items()})
+            updated += 1
+        if updated:
+            self._save()
+        return updated
@@ -0,0 +1,117 @@
+"""
+同じ出来事 (合併の報道・リコールなど) を扱う記事のまとまり (ストーリー) を、ローカルでまとめる (クラスタリング)。
+
+タイトルと本文の冒頭の文字 n-gram (日本語は分かち書きせずに n 文字ずつを語とする) から TF-IDF ベクトルを作り、
+投稿日時の差が時間窓 (window_hours) 以内の記事とのコサイン類似度が threshold 以上なら同じストーリーとする。
+まとめ方は逐次的で、新しい記事は時間窓の中で最も似ている記事のストーリーに加わり、
+どの記事とも似ていなければ新しいストーリーを作る。前回までの実行で cluster_id を付けた記事も比較の対象にするため、
+実行をまたいでも同じ出来事の記事は同じ cluster_id になる。
+cluster_id はストーリーを作った記事の記事IDから決まる 12 文字の16進文字列。
+"""
+import hashlib
+import math
+import re
+import unicodedata
+from collections import Counter
+
+
+def normalize(text):
+    """
+    NFKC 正規化・小文字化し、記号と空白を区切り (空白 1 つ) に置き換える。
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"[\W_]+", " ", text).strip()
+
+
+def char_ngrams(text, n=2):
+    """
+    区切りごとの文字 n-gram の出現回数。n 文字未満の区切りはそのまま 1 語とする。
+    """
+    grams = Counter()
+    for chunk in normalize(text).split():
+        if len(chunk) < n:
+            grams[chunk] += 1
+            continue
+        for i in range(len(chunk) - n + 1):
+            grams[chunk[i:i + n]] += 1
+    return grams
+
+
+def new_cluster_id(article_key):
+    return hashlib.sha1(article_key.encode("utf-8")).hexdigest()[:12]
+
+
+def cosine(a, b):
+    """
+    長さ 1 に正規化した疎ベクトル ({語: 重み}) のコサイン類似度。
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(gram, 0.0) for gram, weight in a.items())
+
+
+class StoryClusterer:
+    """
+    記事を add で登録し、assign で cluster_id の無い記事にストーリーを割り当てる。
+    IDF は登録したすべての記事 (今回の分析対象と、時間窓の中の cluster_id 付きの記事) から計算する。
+    """
+
+    def __init__(self, threshold=0.5, window_hours=48.0, ngram=2):
+        self.threshold = threshold
+        self.window_seconds = window_hours * 3600
+        self.ngram = ngram
+        self.docs = []
+
+    def add(self, article_key, text, posted=None, cluster_id=""):
+        """
+        記事を登録する。posted (datetime) が None の記事は、時間窓に関係なく比較する。
+        """
+        self.docs.append({
+            "key": article_key, "grams": char_ngrams(text, self.ngram), "posted": posted, "cluster_id": cluster_id,
+        })
+
+    def _vectors(self):
+        df = Counter()
+        for doc in self.docs:
+            df.update(doc["grams"].keys())
+        total = len(self.docs)
+        for doc in self.docs:
+            vector = {
+                gram: count * (math.log((1 + total) / (1 + df[gram])) + 1.0)
+                for gram, count in doc["grams"].items()
+            }
+            norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+            doc["vector"] = {gram: weight / norm for gram, weight in vector.items()}
+
+    def _within_window(self, a, b):
+        if a["posted"] is None or b["posted"] is None:
+            return True
+        return abs((a["posted"] - b["posted"]).total_seconds()) <= self.window_seconds
+
+    def assign(self):
+        """
+        cluster_id の無い記事を投稿日時の古い順にストーリーへ割り当て、
+        {記事ID: (cluster_id, 最も似ていた記事との類似度 (新しいストーリーなら 0.0))} を返す。
+        """
+        self._vectors()
+        assigned = [doc for doc in self.docs if doc["cluster_id"]]
+        pending = [doc for doc in self.docs if not doc["cluster_id"]]
+        pending.sort(key=lambda doc: (doc["posted"] is None, doc["posted"] or 0))
+
+        results = {}
+        for doc in pending:
+            best_similarity, best = 0.0, None
+            for other in assigned:
+                if not self._within_window(doc, other):
+                    continue
+                similarity = cosine(doc["vector"], other["vector"])
+                if similarity > best_similarity:
+                    best_similarity, best = similarity, other
+            if best is not None and best_similarity >= self.threshold:
+                doc["cluster_id"] = best["cluster_id"]
+            else:
+                doc["cluster_id"] = new_cluster_id(doc["key"])
+                best_similarity = 0.0
+            assigned.append(doc)
+            results[doc["key"]] = (doc["cluster_id"], best_similarity)
+        return results